@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Time pit commands on synthetic repositories and catch slowdowns.
+
+Usage:
+    python -m benchmarks.run --scale small --repeat 10 --output results.json
+    python -m benchmarks.run --scale small --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --scale small --baseline benchmarks/baseline.json
+
+A repository is generated at the chosen scale (see `benchmarks/synthetic.py`), then every
+command runs `--repeat` times as a separate `pit.py` process, like a user would run it.
+Whatever a run needs (changed files, staged files, a fresh copy of the repository to merge
+in) is prepared before the clock starts. For every command the results report the latency
+percentiles in milliseconds and the peak RSS of the process in KiB, as JSON.
+
+With `--baseline`, the results are compared with a stored run at the same scale: a command
+whose median latency or peak RSS grew by more than `--tolerance` is reported, and the
+run exits with status 1.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import (PRESETS, Scale, branch_name, change_file,
+                                  generate_repo)
+from src.constants import MAIN_BRANCH
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIT = os.path.join(ROOT, "pit.py")
+
+COMMANDS = ["init", "status", "diff", "add", "commit", "log", "checkout", "merge"]
+PERCENTILES = [50, 90, 95, 99]
+# Relative growth of the median latency or peak RSS reported as a slowdown
+DEFAULT_TOLERANCE = 0.25
+# Latency differences below this many milliseconds are noise, whatever the ratio
+MIN_SLOWDOWN_MS = 5.0
+
+
+def run_pit(cwd, *args):
+    """
+    Run one pit command in its own process.
+
+    Returns:
+        tuple: The wall time in seconds and the peak RSS of the process in KiB.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, PIT, *args],
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    # wait4 reports the resource usage of this process alone
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    if process.returncode != 0:
+        raise RuntimeError(f"pit {' '.join(args)} failed with status {status}")
+    return elapsed, usage.ru_maxrss
+
+
+def percentile(sorted_values, percent):
+    """Return a percentile of sorted values, by the nearest-rank method."""
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(times, rss):
+    """Summarize the runs of one command: latency in milliseconds and peak RSS in KiB."""
+    times_ms = sorted(t * 1000 for t in times)
+    summary = {"runs": len(times_ms)}
+    summary.update(
+        (f"p{percent}_ms", round(percentile(times_ms, percent), 3)) for percent in PERCENTILES
+    )
+    summary["min_ms"] = round(times_ms[0], 3)
+    summary["max_ms"] = round(times_ms[-1], 3)
+    summary["mean_ms"] = round(sum(times_ms) / len(times_ms), 3)
+    summary["max_rss_kb"] = max(rss)
+    return summary
+
+
+class Workload:
+    """
+    The command runs against one generated repository.
+
+    Each `bench_<command>` method prepares one run of its command, untimed, and returns the
+    directory and arguments to time. Changes left by earlier commands are committed before
+    `checkout` and `merge` run, which need a clean working tree.
+    """
+
+    def __init__(self, work_dir, scale, changed, seed=0):
+        self.work_dir = work_dir
+        self.scale = scale
+        self.changed = changed
+        self.repo = os.path.join(work_dir, "repo")
+        self.paths = generate_repo(self.repo, scale, seed)
+        self.runs = 0
+        self.on_branch = False
+        self.dirty = False
+
+    def scratch(self, name):
+        path = os.path.join(self.work_dir, name)
+        shutil.rmtree(path, ignore_errors=True)
+        return path
+
+    def change_files(self):
+        rng = random.Random(self.runs)
+        for relative in rng.sample(self.paths, min(self.changed, len(self.paths))):
+            change_file(rng, os.path.join(self.repo, relative))
+        self.dirty = True
+
+    def settle(self):
+        """Commit the changes left in the working tree."""
+        if self.dirty:
+            run_pit(self.repo, "add", ".")
+            run_pit(self.repo, "commit", "-m", f"Settle benchmark changes {self.runs}")
+            self.dirty = False
+
+    def bench_init(self):
+        path = self.scratch("init")
+        os.makedirs(path)
+        return path, ["init"]
+
+    def bench_status(self):
+        self.change_files()
+        return self.repo, ["status"]
+
+    def bench_diff(self):
+        self.change_files()
+        return self.repo, ["diff"]
+
+    def bench_add(self):
+        self.change_files()
+        return self.repo, ["add", "."]
+
+    def bench_commit(self):
+        self.change_files()
+        run_pit(self.repo, "add", ".")
+        self.dirty = False
+        return self.repo, ["commit", "-m", f"Benchmark commit {self.runs}"]
+
+    def bench_log(self):
+        return self.repo, ["log"]
+
+    def bench_checkout(self):
+        if not self.scale.branches:
+            return None
+        self.settle()
+        self.on_branch = not self.on_branch
+        return self.repo, ["checkout", branch_name(0) if self.on_branch else MAIN_BRANCH]
+
+    def bench_merge(self):
+        if not self.scale.branches:
+            return None
+        self.settle()
+        if self.on_branch:
+            run_pit(self.repo, "checkout", MAIN_BRANCH)
+            self.on_branch = False
+        path = self.scratch("merge")
+        shutil.copytree(self.repo, path, symlinks=True)
+        return path, ["merge", branch_name(0)]
+
+    def run(self, command, repeat):
+        """Time `repeat` runs of a command, or return None if the scale does not allow it."""
+        times, rss = [], []
+        for _ in range(repeat):
+            self.runs += 1
+            prepared = getattr(self, f"bench_{command}")()
+            if prepared is None:
+                return None
+            cwd, args = prepared
+            elapsed, peak = run_pit(cwd, *args)
+            times.append(elapsed)
+            rss.append(peak)
+        return summarize(times, rss)
+
+
+def run_benchmarks(scale, repeat=5, commands=COMMANDS, changed=10, work_dir=None, seed=0):
+    """
+    Generate a repository and time the commands against it.
+
+    Args:
+        scale (Scale): The size of the generated repository.
+        repeat (int): The number of timed runs of every command.
+        commands (list): The commands to time, run in the order of `COMMANDS`.
+        changed (int): The number of files changed before each status, diff, add and commit.
+        work_dir (str): The directory to work in, a temporary one by default.
+        seed (int): The seed of the generated content.
+
+    Returns:
+        dict: The scale, the environment and a summary of every command (see `summarize`).
+    """
+    owned = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="pit-bench-")
+    try:
+        start = time.perf_counter()
+        workload = Workload(work_dir, scale, changed, seed)
+        generate_seconds = time.perf_counter() - start
+        results = {}
+        for command in COMMANDS:
+            if command in commands:
+                summary = workload.run(command, repeat)
+                if summary is not None:
+                    results[command] = summary
+    finally:
+        if owned:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "scale": scale._asdict(),
+        "repeat": repeat,
+        "changed": changed,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "generate_s": round(generate_seconds, 3),
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results with a baseline run.
+
+    Returns:
+        list: A message per slowdown, empty if there is none.
+
+    Raises:
+        ValueError: If the runs were made at different scales.
+    """
+    if results["scale"] != baseline["scale"]:
+        raise ValueError(
+            f"the baseline was run at scale {baseline['scale']}, not {results['scale']}"
+        )
+    slowdowns = []
+    for command, current in results["results"].items():
+        previous = baseline["results"].get(command)
+        if previous is None:
+            continue
+        before, after = previous["p50_ms"], current["p50_ms"]
+        if after > before * (1 + tolerance) and after - before > MIN_SLOWDOWN_MS:
+            slowdowns.append(f"{command}: median {before:.1f} ms -> {after:.1f} ms")
+        before, after = previous["max_rss_kb"], current["max_rss_kb"]
+        if after > before * (1 + tolerance):
+            slowdowns.append(f"{command}: peak RSS {before} KiB -> {after} KiB")
+    return slowdowns
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Time pit commands on a synthetic repository.")
+    parser.add_argument(
+        "--scale", choices=PRESETS, default="small", help="Preset size (default: small)"
+    )
+    for field, help_text in [
+        ("files", "Number of files"),
+        ("file-size", "Size of each file in bytes"),
+        ("depth", "Directory levels the files are nested in"),
+        ("commits", "Number of commits on the main branch"),
+        ("branches", "Number of branches"),
+    ]:
+        parser.add_argument(f"--{field}", type=int, help=f"{help_text}, overrides the preset")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timed runs of every command (default: 5)"
+    )
+    parser.add_argument(
+        "--changed",
+        type=int,
+        default=10,
+        help="Files changed before each status, diff, add and commit (default: 10)",
+    )
+    parser.add_argument(
+        "--commands", nargs="+", choices=COMMANDS, default=COMMANDS, help="Commands to time"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated content")
+    parser.add_argument("--output", help="Write the results to this file instead of stdout")
+    parser.add_argument("--baseline", help="Fail if slower than the results in this file")
+    parser.add_argument("--save-baseline", help="Store the results as a baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed relative growth of the median and peak RSS (default: 0.25)",
+    )
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = {
+        field: getattr(args, field)
+        for field in Scale._fields
+        if getattr(args, field) is not None
+    }
+    scale = PRESETS[args.scale]._replace(**overrides)
+
+    results = run_benchmarks(scale, args.repeat, args.commands, args.changed, seed=args.seed)
+    text = json.dumps(results, indent=2) + "\n"
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        try:
+            slowdowns = compare(results, baseline, args.tolerance)
+        except ValueError as e:
+            print(f"Error: Cannot compare with {args.baseline}: {e}", file=sys.stderr)
+            return 2
+        for message in slowdowns:
+            print(f"Slowdown: {message}", file=sys.stderr)
+        if slowdowns:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
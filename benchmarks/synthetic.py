@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Synthetic repositories for the benchmarks.
+
+A repository is built from a `Scale`: the number of files, their size, how deep they are
+nested in directories, the number of commits and the number of branches. Content comes from
+a seeded random generator, so the same scale and seed always give the same repository.
+
+History is built in-process with the pit command functions, which is much faster than one
+pit process per commit:
+
+- the first commit adds every file, each following commit changes about one file in a
+  hundred;
+- every branch `bench-<n>` gets one commit of its own, and the main branch one more commit
+  afterwards, so merging any branch into the main branch is a merge without conflicts.
+"""
+
+import io
+import os
+import random
+from collections import namedtuple
+from contextlib import redirect_stdout
+
+from src.branch import checkout_branch, create_branch
+from src.commit import commit_changes
+from src.constants import MAIN_BRANCH
+from src.repository import init_repo
+from src.staging import add_files
+
+Scale = namedtuple("Scale", ["files", "file_size", "depth", "commits", "branches"])
+
+PRESETS = {
+    "tiny": Scale(files=20, file_size=256, depth=1, commits=3, branches=1),
+    "small": Scale(files=200, file_size=1024, depth=2, commits=10, branches=2),
+    "medium": Scale(files=2000, file_size=4096, depth=3, commits=50, branches=5),
+    "large": Scale(files=20000, file_size=4096, depth=4, commits=200, branches=10),
+}
+
+# Characters per line of generated content, newline included
+LINE_SIZE = 64
+# Directories per level of nesting
+DIR_FANOUT = 10
+
+
+def branch_name(number):
+    """Return the name of a generated branch."""
+    return f"bench-{number}"
+
+
+def file_path(number, depth):
+    """Return the path of a generated file, nested `depth` directories deep."""
+    dirs = [f"dir{(number // DIR_FANOUT**level) % DIR_FANOUT}" for level in range(depth)]
+    return "/".join(dirs + [f"file{number}.txt"])
+
+
+def file_content(rng, size):
+    """Return `size` bytes of text in lines of hex digits."""
+    count = (size + 1) // 2
+    text = rng.getrandbits(count * 8).to_bytes(count, "big").hex()[:size] if count else ""
+    width = LINE_SIZE - 1
+    return "".join(text[i : i + width] + "\n" for i in range(0, len(text), width))
+
+
+def change_file(rng, path):
+    """Replace one line of a file and append another, as a small edit would."""
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    if lines:
+        lines[rng.randrange(len(lines))] = file_content(rng, LINE_SIZE - 1)
+    lines.append(file_content(rng, LINE_SIZE - 1))
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def _args(**values):
+    return type("Args", (object,), values)()
+
+
+def _commit(message, paths):
+    add_files(_args(files=paths))
+    commit_changes(_args(message=message))
+
+
+def generate_repo(path, scale, seed=0):
+    """
+    Build a synthetic repository.
+
+    Args:
+        path (str): The directory to create the repository in; it must not exist.
+        scale (Scale): The size of the repository.
+        seed (int): The seed of the content generator.
+
+    Returns:
+        list: The paths of the files, relative to the repository root.
+    """
+    rng = random.Random(seed)
+    paths = [file_path(number, scale.depth) for number in range(scale.files)]
+    os.makedirs(path)
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        with redirect_stdout(io.StringIO()):
+            init_repo(None)
+            for relative in paths:
+                os.makedirs(os.path.dirname(relative) or ".", exist_ok=True)
+                with open(relative, "w", encoding="utf-8") as f:
+                    f.write(file_content(rng, scale.file_size))
+            _commit("Initial commit", ["."])
+
+            changes_per_commit = max(1, scale.files // 100)
+            for number in range(1, scale.commits):
+                changed = rng.sample(paths, min(changes_per_commit, len(paths)))
+                for relative in changed:
+                    change_file(rng, relative)
+                _commit(f"Commit {number}", changed)
+
+            for number in range(scale.branches):
+                name = branch_name(number)
+                create_branch(_args(branch_name=name))
+                checkout_branch(_args(branch_name=name))
+                relative = paths[number % len(paths)]
+                change_file(rng, relative)
+                _commit(f"Work on {name}", [relative])
+                checkout_branch(_args(branch_name=MAIN_BRANCH))
+            if scale.branches:
+                relative = paths[-1]
+                change_file(rng, relative)
+                _commit("Work on the main branch", [relative])
+    finally:
+        os.chdir(cwd)
+    return paths
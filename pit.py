@@ -16,12 +16,24 @@ Commands:
 - checkout: Switch branches or restore working tree files
 - merge: Merge branches
 - diff: Show differences between commits or working tree files
+- blame: Show the commit that last changed each line of a file
 - clone: Clone a repository
+- gc (repack): Pack loose objects into a packfile
+- daemon: Watch the working tree and answer status queries from memory
+
+`pit --profile-startup <command>` runs the command and reports the import time of every
+module and the time spent in each phase of the run on stderr.
+
+`pit --trace <command>` (or `PIT_TRACE=1`) records spans and counters of the command and
+writes them as a Chrome trace to stderr, or to a file with `--trace-file` (or
+`PIT_TRACE=<path>`), see `src/trace.py`.
 """
 
 import argparse
+import os
+import sys
 
-from src import cli
+PROFILE_STARTUP_FLAG = "--profile-startup"
 
 
 def main():
@@ -36,7 +48,34 @@ def main():
 
     Expects the user to provide one of the valid subcommands to interact with the system.
     """
+    profiler = None
+    if PROFILE_STARTUP_FLAG in sys.argv[1:]:
+        from src.startup import StartupProfiler
+
+        profiler = StartupProfiler()
+        profiler.start()
+
+    from src import cli, trace
+
+    if profiler:
+        profiler.mark("imports")
+
     parser = argparse.ArgumentParser(description="Pit: Like Git but Awesome.")
+    parser.add_argument(
+        PROFILE_STARTUP_FLAG,
+        action="store_true",
+        help="Report the import time of each module and the time of each phase on stderr",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help=f"Write a Chrome trace of the command to stderr (also {trace.TRACE_ENV}=1)",
+    )
+    parser.add_argument(
+        "--trace-file",
+        metavar="PATH",
+        help=f"Write a Chrome trace of the command to a file (also {trace.TRACE_ENV}=<path>)",
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     cli.add_init_command(subparsers)
@@ -48,9 +87,24 @@ def main():
     cli.add_checkout_command(subparsers)
     cli.add_merge_command(subparsers)
     cli.add_diff_command(subparsers)
+    cli.add_blame_command(subparsers)
+    cli.add_clone_command(subparsers)
+    cli.add_gc_command(subparsers)
+    cli.add_daemon_command(subparsers)
 
     args = parser.parse_args()
-    args.func(args)
+    trace.start(args.trace_file or ("1" if args.trace else os.environ.get(trace.TRACE_ENV)))
+    if profiler:
+        profiler.mark("parser")
+    try:
+        with trace.span(args.command):
+            args.func(args)
+    finally:
+        trace.finish()
+        if profiler:
+            profiler.mark("command")
+            profiler.stop()
+            profiler.report()
 
 
 if __name__ == "__main__":
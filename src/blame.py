@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Shows which commit last changed each line of a file (`pit blame <file> [<revision>]`).
+
+History is walked newest first with `commit_graph.walk_commits`, as `pit log` does, and
+each line of the file is followed back until the commit that introduced it:
+
+- a commit whose parent has the same blob for the file passes all its lines to that parent
+  without reading anything, so commits that did not touch the file cost a tree lookup;
+- otherwise the versions of the parent and the commit are diffed, the lines they share are
+  passed to the parent, and the others were changed by the commit. Each version is read
+  once and only consecutive distinct versions are diffed.
+
+For a merge, lines are passed to the first parent that has them.
+
+The result is cached in `.pit/blame`, one file per (commit, path) listing the commit and
+original line number of every line. A repeated blame is read from the cache. Blaming a
+newer commit stops at the first commit that has a cached blame of the file, so after a
+commit only the new version is diffed.
+
+The working tree is not blamed, only committed content.
+"""
+
+import hashlib
+import os
+import time
+
+from src import trace
+from src.commit_graph import get_commit, read_commit_graph, walk_commits
+from src.constants import PIT_DIR
+from src.linediff import diff_blocks, is_binary
+from src.lockfile import LockFile
+from src.objects import read_object
+from src.repository import Repository
+from src.tree import TREE_MODE, read_tree
+
+BLAME_DIR = "blame"
+
+
+def get_blame_cache_path(repo_dir, commit_hash, path):
+    """Return the path of the cached blame of a file at a commit."""
+    key = hashlib.sha1(f"{commit_hash} {path}".encode("utf-8")).hexdigest()
+    return os.path.join(repo_dir, PIT_DIR, BLAME_DIR, key[:2], key[2:])
+
+
+def read_blame_cache(repo_dir, commit_hash, path):
+    """
+    Read the cached blame of a file at a commit.
+
+    Returns:
+        list: The (commit hash, line number) each line comes from, or None if not cached.
+    """
+    try:
+        with open(get_blame_cache_path(repo_dir, commit_hash, path), encoding="utf-8") as f:
+            header, *lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    # The key is a hash: check the entry really is the blame of this commit and path
+    if header != f"{commit_hash} {path}":
+        return None
+    origins = []
+    for line in lines:
+        origin_hash, _, number = line.partition(" ")
+        origins.append((origin_hash, int(number)))
+    return origins
+
+
+def write_blame_cache(repo_dir, commit_hash, path, origins):
+    """
+    Store the blame of a file at a commit, see `read_blame_cache`.
+
+    The cache is best effort: nothing is stored if another process is writing the same
+    entry or the repository is read-only, and the blame is computed again next time.
+    """
+    lines = [f"{commit_hash} {path}"]
+    lines += [f"{origin_hash} {number}" for origin_hash, number in origins]
+    lock = LockFile(get_blame_cache_path(repo_dir, commit_hash, path))
+    try:
+        if lock.try_acquire():
+            lock.write("\n".join(lines) + "\n")
+            lock.commit()
+    except OSError:
+        pass
+    finally:
+        lock.rollback()
+
+
+class _History:
+    """Reads the versions of one file along history, each blob and tree once."""
+
+    def __init__(self, repo, path):
+        self.repo = repo
+        self.path = path
+        self.graph = read_commit_graph(repo.root)
+        self.blobs = {}
+        self.lines = {}
+        self.entries = {}
+
+    def commit(self, commit_hash):
+        return get_commit(self.repo.root, commit_hash, self.graph)
+
+    def _lookup(self, tree_hash, path):
+        """Return the blob hash of a path in a tree, memoized as subtrees are shared."""
+        key = (tree_hash, path)
+        if key not in self.entries:
+            name, _, rest = path.partition("/")
+            found = None
+            for entry in read_tree(self.repo.root, tree_hash):
+                if entry.name == name:
+                    if rest and entry.mode == TREE_MODE:
+                        found = self._lookup(entry.hash, rest)
+                    elif not rest and entry.mode != TREE_MODE:
+                        found = entry.hash
+                    break
+            self.entries[key] = found
+        return self.entries[key]
+
+    def blob(self, commit_hash):
+        """Return the blob hash of the file at a commit, or None if it has no such file."""
+        if commit_hash not in self.blobs:
+            commit = self.commit(commit_hash)
+            if commit is None:
+                blob = None
+            elif commit.tree:
+                blob = self._lookup(commit.tree, self.path)
+            else:
+                # Commits of older versions of pit list their files instead of a tree
+                blob = self.repo.commit(commit_hash).files.get(self.path)
+            self.blobs[commit_hash] = blob
+        return self.blobs[commit_hash]
+
+    def read_lines(self, blob_hash):
+        if blob_hash not in self.lines:
+            self.lines[blob_hash] = read_object(self.repo.root, blob_hash)[1].splitlines(True)
+        return self.lines[blob_hash]
+
+
+@trace.traced("blame.compute")
+def blame_lines(repo, commit_hash, path):
+    """
+    Find the commit that introduced each line of a file.
+
+    Args:
+        repo (Repository): The repository.
+        commit_hash (str): The commit to blame the file at.
+        path (str): The path of the file relative to the repository root.
+
+    Returns:
+        list: The (commit hash, line number) of every line, line numbers starting at 1, or
+            None if the file is not in the commit.
+    """
+    repo_dir = repo.root
+    cached = read_blame_cache(repo_dir, commit_hash, path)
+    if cached is not None:
+        return cached
+
+    history = _History(repo, path)
+    blob_hash = history.blob(commit_hash)
+    if blob_hash is None:
+        return None
+    line_count = len(history.read_lines(blob_hash))
+    origins = [None] * line_count
+    # The lines each commit still has to account for: (line in its version, final line)
+    pending = {commit_hash: [(line, line) for line in range(line_count)]}
+
+    def pass_lines(parent_hash, suspects):
+        """Hand lines over to a parent, resolving them at once if its blame is cached."""
+        parent_blame = read_blame_cache(repo_dir, parent_hash, path)
+        if parent_blame is not None:
+            for line, final in suspects:
+                origins[final] = parent_blame[line]
+        else:
+            pending.setdefault(parent_hash, []).extend(suspects)
+
+    def assign(commit):
+        suspects = pending.pop(commit.hash)
+        for parent_hash in commit.parents:
+            parent_blob = history.blob(parent_hash)
+            if parent_blob is None:
+                continue
+            if parent_blob == history.blob(commit.hash):
+                pass_lines(parent_hash, suspects)
+                return
+        lines = history.read_lines(history.blob(commit.hash))
+        for parent_hash in commit.parents:
+            parent_blob = history.blob(parent_hash)
+            if parent_blob is None or not suspects:
+                continue
+            # Map the lines of this version to the lines of the parent they match
+            matches = {}
+            for i, j, n in diff_blocks(history.read_lines(parent_blob), lines):
+                for offset in range(n):
+                    matches[j + offset] = i + offset
+            passed = [(matches[line], final) for line, final in suspects if line in matches]
+            if passed:
+                pass_lines(parent_hash, passed)
+            suspects = [(line, final) for line, final in suspects if line not in matches]
+        for line, final in suspects:
+            origins[final] = (commit.hash, line + 1)
+
+    for commit in walk_commits(repo_dir, [commit_hash]):
+        if not pending:
+            break
+        if commit.hash in pending:
+            assign(commit)
+    # A parent with a later timestamp than its child (clock skew) is walked before it
+    while pending:
+        assign(history.commit(next(iter(pending))))
+
+    write_blame_cache(repo_dir, commit_hash, path, origins)
+    return origins
+
+
+def show_blame(args, repo=None):
+    """
+    Show the commit, author and date that last changed each line of a file.
+
+    Args:
+        args: Command-line arguments with `file` and an optional `revision` (default HEAD).
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory.
+    """
+    repo = repo or Repository.discover()
+    if not repo:
+        print("Not a repository.")
+        return
+    repo_dir = repo.root
+
+    revision = getattr(args, "revision", None) or "HEAD"
+    commit_hash = repo.resolve(revision)
+    if commit_hash is None:
+        if revision == "HEAD":
+            print("No commits in the current branch.")
+            return
+        print(f"Error: Unknown revision {revision}")
+        exit(1)
+
+    abs_file = os.path.abspath(os.path.join(os.getcwd(), args.file))
+    path = os.path.relpath(abs_file, repo_dir).replace(os.sep, "/")
+    blob_hash = _History(repo, path).blob(commit_hash)
+    if blob_hash is None:
+        print(f"Error: {path} is not in {revision}")
+        exit(1)
+    content = read_object(repo_dir, blob_hash)[1]
+    if is_binary(content):
+        print(f"Error: Cannot blame binary file {path}")
+        exit(1)
+
+    origins = blame_lines(repo, commit_hash, path)
+    commits = {origin_hash: repo.commit(origin_hash) for origin_hash, _ in origins}
+    author_width = max((len(commit.author) for commit in commits.values()), default=0)
+    number_width = len(str(len(origins)))
+    for number, ((origin_hash, _), line) in enumerate(
+        zip(origins, content.splitlines()), start=1
+    ):
+        commit = commits[origin_hash]
+        date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(commit.timestamp))
+        text = line.decode("utf-8", "replace")
+        print(
+            f"{origin_hash[:8]} ({commit.author.ljust(author_width)} {date} "
+            f"{str(number).rjust(number_width)}) {text}"
+        )
@@ -2,48 +2,95 @@
 
 import os
 
-from src.constants import PIT_DIR
-from src.utils import ensure_repo, get_current_branch, read_file, write_file
+from src.commit_graph import ahead_behind
+from src.repository import require_repo
+from src.worktree import checkout_tree
 
 
-def create_branch(args):
-    # Ensure repo exists
-    ensure_repo()
+def list_branches(args, repo=None):
+    """
+    List the branches with their head commit and how far they are ahead of and behind
+    the current branch.
+
+    The branches are read from packed-refs and the loose refs in one pass, and the
+    commit counts come from walks of the commit-graph.
+    """
+    repo = repo or require_repo()
+    branches = repo.branches()
+    current_branch, head = repo.current_branch, repo.head
+    width = max((len(name) for name in branches), default=0)
+    for name, commit_hash in branches.items():
+        marker = "*" if name == current_branch else " "
+        line = f"{marker} {name.ljust(width)} {commit_hash[:7]}"
+        if head and commit_hash != head:
+            ahead, behind = ahead_behind(repo.root, commit_hash, head)
+            counts = [f"ahead {ahead}"] if ahead else []
+            counts += [f"behind {behind}"] if behind else []
+            line += f" [{', '.join(counts)}]"
+        print(line)
 
-    branch_path = f"{PIT_DIR}/refs/heads/{args.branch_name}"
-    if os.path.exists(branch_path):
-        print(f"Branch {args.branch_name} already exists.")
+
+def create_branch(args, repo=None):
+    # Ensure repo exists
+    repo = repo or require_repo()
+    if getattr(args, "list", False) or not getattr(args, "branch_name", None):
+        list_branches(args, repo)
         return
 
-    # Get current branch
-    current_branch = get_current_branch()
+    if not repo.head:
+        print("No commits in the current branch.")
+        return
 
-    # Get current commit
-    current_commit = read_file(f"{PIT_DIR}/refs/heads/{current_branch}").strip()
+    # The lock makes the existence check and the creation one step for concurrent runs
+    with repo.lock_ref(args.branch_name):
+        if repo.branch_exists(args.branch_name):
+            print(f"Branch {args.branch_name} already exists.")
+            return
 
-    # Write current commit to new branch head
-    write_file(branch_path, current_commit)
+        # Write current commit to new branch head
+        repo.write_ref(args.branch_name, repo.head)
 
     print(f"Branch {args.branch_name} created.")
 
 
-def checkout_branch(args):
+def checkout_branch(args, repo=None):
+    """
+    Switch to another branch, updating the working tree and the index.
+
+    Only the files that differ between the current and the target commit are written,
+    deleted or chmod'ed; the switch is refused if that would overwrite local changes.
+    """
     # Ensure repo exists
-    ensure_repo()
+    repo = repo or require_repo()
+    with repo.lock_index():
+        _checkout_locked(args, repo)
 
+
+def _checkout_locked(args, repo):
+    """Switch branches while `checkout_branch` holds the index lock."""
     # Ensure no staged files
-    staged_data = read_file(f"{PIT_DIR}/index")
-    if staged_data:
+    if repo.staged_files():
         print("There is staged data commit first before switching.")
         return
 
-    branch_path = f".pit/refs/heads/{args.branch_name}"
     # Make sure branch exists before switchig
-    if not os.path.exists(branch_path):
+    if not repo.branch_exists(args.branch_name):
         print(f"Branch {args.branch_name} does not exist.")
         return
 
-    with open(".pit/HEAD", "w") as head:
-        head.write(f"ref: refs/heads/{args.branch_name}")
+    current_commit = repo.head
+    target_commit = repo.read_ref(args.branch_name)
+    if current_commit != target_commit:
+        current_tree = repo.commit(current_commit).tree if current_commit else None
+        target_tree = repo.commit(target_commit).tree
+        dirty = checkout_tree(repo.root, repo.index, current_tree, target_tree)
+        if dirty:
+            print("Your local changes would be overwritten by checkout:")
+            for path in dirty:
+                print(f" {path}")
+            return
+        repo.write_index()
+
+    repo.set_head(args.branch_name)
 
     print(f"Switched to branch {args.branch_name}.")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Content-defined chunking of large blobs (FastCDC).
+
+A blob of at least `core.chunkThreshold` bytes (see `src/config.py`, off by default) is cut
+into chunks whose boundaries depend on the content only: a gear rolling hash is computed
+over the bytes, and a chunk ends where the top bits of the hash are all zero. Inserting or
+changing a few bytes moves the boundaries around the change only, so two versions of a large
+file share all their other chunks.
+
+As in FastCDC, no boundary is looked for in the first `MIN_CHUNK_SIZE` bytes of a chunk,
+a harder condition (more bits) is used until `AVG_CHUNK_SIZE` bytes and an easier one after,
+which keeps chunk sizes close to the average, and a chunk never exceeds `MAX_CHUNK_SIZE`.
+
+Each chunk is stored once as a `chunk` object. The blob itself is stored under its usual
+hash as a `chunked` object whose content is the manifest: one `<chunk hash> <size>` line per
+chunk, in order. See `src/objects.py`.
+"""
+
+import hashlib
+
+MIN_CHUNK_SIZE = 16 * 1024
+AVG_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+# Bytes read from a file at a time while chunking it
+READ_SIZE = 1024 * 1024
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _top_bits(bits):
+    """Return a mask of the top bits of a 64-bit hash, the ones that depend on most bytes."""
+    return ((1 << bits) - 1) << (64 - bits)
+
+
+_AVG_BITS = AVG_CHUNK_SIZE.bit_length() - 1
+# Harder to match before the average size, easier after
+_MASK_SMALL = _top_bits(_AVG_BITS + 2)
+_MASK_LARGE = _top_bits(_AVG_BITS - 2)
+# One fixed pseudo-random 64-bit value per byte value; derived from SHA-1 so it never changes
+_GEAR = [int.from_bytes(hashlib.sha1(bytes([i])).digest()[:8], "big") for i in range(256)]
+
+
+def find_cut(data, start, end):
+    """
+    Find where the chunk starting at `start` ends.
+
+    Args:
+        data (bytes): The content being chunked.
+        start (int): The offset the chunk starts at.
+        end (int): The offset the available content ends at; the chunk may end there.
+
+    Returns:
+        int: The offset the chunk ends at.
+    """
+    if end - start <= MIN_CHUNK_SIZE:
+        return end
+    end = min(end, start + MAX_CHUNK_SIZE)
+    normal = min(end, start + AVG_CHUNK_SIZE)
+    gear, mask_64 = _GEAR, _MASK_64
+    fingerprint = 0
+    position = start + MIN_CHUNK_SIZE
+    for byte in data[position:normal]:
+        fingerprint = ((fingerprint << 1) + gear[byte]) & mask_64
+        position += 1
+        if not fingerprint & _MASK_SMALL:
+            return position
+    for byte in data[normal:end]:
+        fingerprint = ((fingerprint << 1) + gear[byte]) & mask_64
+        position += 1
+        if not fingerprint & _MASK_LARGE:
+            return position
+    return end
+
+
+def iter_chunks(src):
+    """
+    Cut a file into content-defined chunks, reading it in bounded pieces.
+
+    Args:
+        src (file): A binary file, read from its current position to its end.
+
+    Yields:
+        bytes: The chunks, in order.
+    """
+    buffer, position, eof = b"", 0, False
+    while True:
+        if not eof and len(buffer) - position < MAX_CHUNK_SIZE:
+            data = src.read(READ_SIZE)
+            if data:
+                buffer = buffer[position:] + data
+                position = 0
+                continue
+            eof = True
+        if position >= len(buffer):
+            return
+        cut = find_cut(buffer, position, len(buffer))
+        yield buffer[position:cut]
+        position = cut
+
+
+def format_manifest(chunks):
+    """Serialize a list of (chunk hash, size) into the content of a `chunked` object."""
+    return "".join(f"{chunk_hash} {size}\n" for chunk_hash, size in chunks).encode("utf-8")
+
+
+def parse_manifest(content):
+    """Parse the content of a `chunked` object into a list of (chunk hash, size)."""
+    chunks = []
+    for line in content.decode("utf-8").splitlines():
+        chunk_hash, _, size = line.partition(" ")
+        chunks.append((chunk_hash, int(size)))
+    return chunks
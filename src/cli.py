@@ -1,9 +1,34 @@
 #!/usr/bin/env python3
 """
 This is the main cli entry point for parsing the args and running the related functions
+
+Command modules are imported only when their command runs, so starting pit does not pay
+for the modules of every other command.
 """
 
-from src import branch, commit, diff, merge, repository, staging, status
+import argparse
+import importlib
+from datetime import datetime
+
+# linediff.ALGORITHMS, spelled out so that parsing arguments does not import the diff code
+DIFF_ALGORITHMS = ("myers", "patience")
+
+
+def lazy_command(module_name, function_name):
+    """
+    Return a command function that imports its module on first call.
+
+    Args:
+        module_name (str): The module defining the command, e.g. "src.commit".
+        function_name (str): The name of the command function in that module.
+    """
+
+    def command(args):
+        function = getattr(importlib.import_module(module_name), function_name)
+        return function(args)
+
+    command.__name__ = function_name
+    return command
 
 
 def add_init_command(subparsers):
@@ -12,7 +37,7 @@ def add_init_command(subparsers):
     will call the `init_repo` function to initialize a new repository.
     """
     parser = subparsers.add_parser("init", help="Initialize a new repository")
-    parser.set_defaults(func=repository.init_repo)
+    parser.set_defaults(func=lazy_command("src.repository", "init_repo"))
 
 
 def add_add_command(subparsers):
@@ -22,7 +47,14 @@ def add_add_command(subparsers):
     """
     parser = subparsers.add_parser("add", help="Stage files for commit")
     parser.add_argument("files", nargs="+", help="Files to stage")
-    parser.set_defaults(func=staging.add_files)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of threads hashing and writing files (default: based on CPU count)",
+    )
+    parser.set_defaults(func=lazy_command("src.staging", "add_files"))
 
 
 def add_status_command(subparsers):
@@ -30,36 +62,141 @@ def add_status_command(subparsers):
     parser = subparsers.add_parser(
         "status", help="Show the current status of the repository"
     )
-    parser.set_defaults(func=status.status)
+    parser.set_defaults(func=lazy_command("src.status", "status"))
 
 
 def add_commit_command(subparsers):
     parser = subparsers.add_parser("commit", help="Commit staged changes")
     parser.add_argument("-m", "--message", required=True, help="Commit message")
-    parser.set_defaults(func=commit.commit_changes)
+    parser.set_defaults(func=lazy_command("src.commit", "commit_changes"))
+
+
+def parse_date(value):
+    """Parse a `--since` date: a Unix timestamp or an ISO 8601 date or date-time."""
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {value!r}")
 
 
 def add_log_command(subparsers):
     parser = subparsers.add_parser("log", help="View commit history")
-    parser.set_defaults(func=commit.view_log)
+    parser.add_argument(
+        "-n", "--max-count", type=int, default=None, help="Show at most this many commits"
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_date,
+        default=None,
+        help="Show only commits newer than a date (YYYY-MM-DD[THH:MM:SS] or a timestamp)",
+    )
+    parser.set_defaults(func=lazy_command("src.commit", "view_log"))
 
 
 def add_branch_command(subparsers):
-    parser = subparsers.add_parser("branch", help="Create a new branch")
-    parser.add_argument("branch_name", help="Name of the new branch")
-    parser.set_defaults(func=branch.create_branch)
+    parser = subparsers.add_parser("branch", help="Create a new branch or list branches")
+    parser.add_argument(
+        "branch_name", nargs="?", help="Name of the new branch (default: list branches)"
+    )
+    parser.add_argument(
+        "-l",
+        "--list",
+        action="store_true",
+        help="List branches, with commits ahead of and behind the current branch",
+    )
+    parser.set_defaults(func=lazy_command("src.branch", "create_branch"))
 
 
 def add_checkout_command(subparsers):
     parser = subparsers.add_parser("checkout", help="Switch to a branch")
     parser.add_argument("branch_name", help="Name of the branch to switch to")
-    parser.set_defaults(func=branch.checkout_branch)
+    parser.set_defaults(func=lazy_command("src.branch", "checkout_branch"))
 
 def add_merge_command(subparsers):
     parser = subparsers.add_parser("merge", help="Merge another branch into current branch")
     parser.add_argument("branch_name", help="Branch to merge")
-    parser.set_defaults(func=merge.merge_branch)
+    parser.set_defaults(func=lazy_command("src.merge", "merge_branch"))
 
 def add_diff_command(subparsers):
     parser = subparsers.add_parser("diff", help="Show differences between commits and working directory")
-    parser.set_defaults(func=diff.show_diff)
\ No newline at end of file
+    parser.add_argument(
+        "revisions",
+        nargs="*",
+        help="Compare the working tree with a commit, or two commits (default: HEAD)",
+    )
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument(
+        "--stat", action="store_true", help="Show the number of changed lines per file"
+    )
+    output.add_argument(
+        "--name-only", action="store_true", help="Show only the names of changed files"
+    )
+    parser.add_argument(
+        "--diff-algorithm",
+        choices=DIFF_ALGORITHMS,
+        default="myers",
+        help="The line diff algorithm (default: myers)",
+    )
+    parser.set_defaults(func=lazy_command("src.diff", "show_diff"))
+
+
+def add_blame_command(subparsers):
+    parser = subparsers.add_parser("blame", help="Show the commit that last changed each line")
+    parser.add_argument("file", help="The file to blame")
+    parser.add_argument(
+        "revision",
+        nargs="?",
+        default=None,
+        help="The commit to blame the file at (default: HEAD)",
+    )
+    parser.set_defaults(func=lazy_command("src.blame", "show_blame"))
+
+
+def add_clone_command(subparsers):
+    parser = subparsers.add_parser("clone", help="Clone a repository on the local file system")
+    parser.add_argument("source", help="The repository to clone")
+    parser.add_argument("destination", help="The new directory to clone into")
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=None,
+        help="Copy only the last N commits of every branch (a shallow clone)",
+    )
+    parser.add_argument(
+        "--filter",
+        choices=["blob:none"],
+        default=None,
+        help="Copy no blobs; they are fetched from the source when first read",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of threads copying and writing files (default: based on CPU count)",
+    )
+    parser.set_defaults(func=lazy_command("src.clone", "clone_repo"))
+
+
+def add_gc_command(subparsers):
+    parser = subparsers.add_parser(
+        "gc", aliases=["repack"], help="Pack loose objects into a single packfile"
+    )
+    parser.set_defaults(func=lazy_command("src.gc", "gc"))
+
+
+def add_daemon_command(subparsers):
+    parser = subparsers.add_parser(
+        "daemon", help="Watch the working tree and answer status queries from memory"
+    )
+    parser.add_argument(
+        "--detach", action="store_true", help="Run in the background"
+    )
+    parser.add_argument(
+        "--stop", action="store_true", help="Stop the daemon of the repository"
+    )
+    parser.set_defaults(func=lazy_command("src.daemon", "run_daemon"))
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Clone a repository within the local file system.
+
+Objects never change once written, they are only replaced or removed by renames and
+unlinks, so the clone hard links the object files of the source (loose objects, packs and
+the commit-graph) instead of copying them. When the destination is on another file system
+the files are copied by a pool of threads instead, as copy-on-write clones (reflinks) where
+the file system supports them.
+
+The branches are written to the packed-refs of the clone in one file, HEAD points to the
+branch checked out in the source, and the working tree of that branch is written by a pool
+of threads, which also build the index.
+
+Two modes copy less than the whole object database:
+
+- `--depth N` copies only the last N commits of every branch. The oldest copied commits
+  are recorded as graft points in `.pit/shallow` and read as if they had no parents.
+- `--filter=blob:none` copies commits and trees but no blobs. The source is recorded as the
+  promisor of the clone, and blobs are fetched from it when they are first read.
+
+Either way only the selected objects are linked or copied: loose objects one by one, and
+packed objects are read from the source packs and written as loose objects.
+"""
+
+import errno
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src import trace
+from src.commit_graph import update_commit_graph
+from src.config import set_config_values
+from src.constants import PIT_DIR
+from src.index import Index, make_entry
+from src.objects import (get_object_path, get_objects_dir, get_shallow_path,
+                         read_commit, read_manifest, read_object, read_shallow,
+                         read_stored_object, write_stored_object)
+from src.repository import Repository
+from src.tree import EXECUTABLE_MODE, TREE_MODE, parse_tree, walk_tree
+from src.utils import write_file
+
+# The values of --filter
+FILTERS = ["blob:none"]
+
+# Errors of os.link that mean the files have to be copied instead
+_LINK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP}
+# Linux ioctl cloning a whole file into another on copy-on-write file systems
+_FICLONE = 0x40049409
+
+
+def list_object_files(repo_dir):
+    """
+    List the object files of a repository, skipping files still being written.
+
+    Returns:
+        list: The paths of the files relative to `.pit/objects`.
+    """
+    objects_dir = get_objects_dir(repo_dir)
+    files = []
+    for root, _, names in os.walk(objects_dir):
+        for name in names:
+            if name.startswith("tmp_") or name.endswith(".lock"):
+                continue
+            files.append(os.path.relpath(os.path.join(root, name), objects_dir))
+    return files
+
+
+def reflink_file(src, dst):
+    """Clone a file on a copy-on-write file system. Raises OSError where that is unsupported."""
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+
+
+def copy_file(src, dst):
+    """Copy a file, as a reflink when possible."""
+    try:
+        reflink_file(src, dst)
+    except (OSError, ImportError):
+        shutil.copyfile(src, dst)
+
+
+def share_files(pairs, jobs=None):
+    """
+    Hard link files to new paths, or copy them where linking is not possible.
+
+    Once linking fails because the paths are on different file systems, the remaining
+    files are copied by a pool of threads.
+
+    Args:
+        pairs (list): (source path, destination path) tuples.
+        jobs (int): The number of copying threads, by default based on the CPU count.
+
+    Returns:
+        tuple: The number of files linked and the number of files copied.
+    """
+    for directory in {os.path.dirname(dst) for _, dst in pairs}:
+        os.makedirs(directory, exist_ok=True)
+
+    linked = 0
+    for src, dst in pairs:
+        try:
+            os.link(src, dst)
+        except OSError as e:
+            if e.errno not in _LINK_ERRNOS:
+                raise
+            break
+        linked += 1
+
+    remaining = pairs[linked:]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(lambda pair: copy_file(*pair), remaining))
+    return linked, len(remaining)
+
+
+@trace.traced("clone.link_objects")
+def link_objects(source, destination, jobs=None):
+    """
+    Share every object file of one repository with another, see `share_files`.
+
+    Args:
+        source (str): The root directory of the repository to take the objects from.
+        destination (str): The root directory of the new repository.
+        jobs (int): The number of copying threads, by default based on the CPU count.
+
+    Returns:
+        tuple: The number of files linked and the number of files copied.
+    """
+    source_dir, destination_dir = get_objects_dir(source), get_objects_dir(destination)
+    return share_files(
+        [
+            (os.path.join(source_dir, path), os.path.join(destination_dir, path))
+            for path in list_object_files(source)
+        ],
+        jobs,
+    )
+
+
+def select_objects(repo_dir, tips, depth=None, blobs=True):
+    """
+    Find the objects a shallow or partial clone copies.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        tips (list): The commits to start from, the heads of the branches.
+        depth (int): The number of commits to take from every tip, or None for all.
+        blobs (bool): Whether to take the blobs of the trees.
+
+    Returns:
+        tuple: The set of object hashes, and the set of copied commits whose parents are
+            not copied: the graft points of the clone.
+    """
+    commits = {}
+    queue = deque((tip, 1) for tip in tips)
+    # Breadth first, so every commit is first reached at its smallest depth
+    while queue:
+        commit_hash, level = queue.popleft()
+        if commit_hash in commits:
+            continue
+        commit = read_commit(repo_dir, commit_hash)
+        commits[commit_hash] = commit
+        if depth is None or level < depth:
+            queue.extend((parent, level + 1) for parent in commit.parents)
+
+    shallow = {
+        commit_hash
+        for commit_hash, commit in commits.items()
+        if any(parent not in commits for parent in commit.parents)
+    }
+    shallow |= read_shallow(repo_dir) & commits.keys()
+
+    objects = set(commits)
+    pending = []
+    for commit in commits.values():
+        if commit.tree:
+            pending.append(commit.tree)
+        elif blobs:
+            # Commits from older versions of pit list their files inline
+            objects.update(commit.files.values())
+    while pending:
+        tree_hash = pending.pop()
+        if tree_hash in objects:
+            continue
+        objects.add(tree_hash)
+        _, content = read_object(repo_dir, tree_hash)
+        for entry in parse_tree(content):
+            if entry.mode == TREE_MODE:
+                pending.append(entry.hash)
+            elif blobs and entry.hash not in objects:
+                objects.add(entry.hash)
+                objects.update(chunk for chunk, _ in read_manifest(repo_dir, entry.hash) or ())
+    return objects, shallow
+
+
+@trace.traced("clone.copy_objects")
+def copy_objects(source, destination, object_hashes, jobs=None):
+    """
+    Copy some objects of one repository to another.
+
+    Loose objects are shared with `share_files`; packed objects are read from the source
+    packs and written as loose objects by a pool of threads.
+
+    Returns:
+        tuple: The number of objects linked and the number of objects copied.
+    """
+    loose, packed = [], []
+    for object_hash in sorted(object_hashes):
+        path = get_object_path(source, object_hash)
+        if os.path.exists(path):
+            loose.append((path, get_object_path(destination, object_hash)))
+        else:
+            packed.append(object_hash)
+
+    def copy_packed(object_hash):
+        obj_type, content = read_stored_object(source, object_hash)
+        write_stored_object(destination, object_hash, obj_type, content)
+
+    linked, copied = share_files(loose, jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(copy_packed, packed))
+    return linked, copied + len(packed)
+
+
+@trace.traced("clone.checkout")
+def checkout_worktree(repo_dir, tree_hash, jobs=None):
+    """
+    Write the files of a tree into an empty working tree.
+
+    Directories are created first, then the files are written by a pool of threads.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        tree_hash (str): The tree to check out.
+        jobs (int): The number of writing threads, by default based on the CPU count.
+
+    Returns:
+        Index: The index entries of the written files.
+    """
+    files = list(walk_tree(repo_dir, tree_hash))
+    for directory in sorted({os.path.dirname(path) for path, _, _ in files}):
+        os.makedirs(os.path.join(repo_dir, directory), exist_ok=True)
+
+    def write(item):
+        path, mode, object_hash = item
+        _, content = read_object(repo_dir, object_hash)
+        abs_path = os.path.join(repo_dir, path)
+        with open(abs_path, "wb") as f:
+            f.write(content)
+        os.chmod(abs_path, 0o755 if mode == EXECUTABLE_MODE else 0o644)
+        return make_entry(path, object_hash, os.stat(abs_path))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return Index((entry.path, entry) for entry in executor.map(write, files))
+
+
+def clone_repo(args):
+    """
+    Clone a local repository into a new directory.
+
+    Args:
+        args: The parsed arguments: the repository to clone (`source`), the directory to
+            clone it into (`destination`), and optionally the number of commits to copy per
+            branch (`depth`), an object filter (`filter`) and the number of threads copying
+            and writing files (`jobs`).
+    """
+    source = os.path.abspath(args.source)
+    destination = os.path.abspath(args.destination)
+    jobs = getattr(args, "jobs", None)
+    depth = getattr(args, "depth", None)
+    object_filter = getattr(args, "filter", None)
+    if jobs is not None and jobs < 1:
+        print("Error: --jobs must be at least 1.")
+        return
+    if depth is not None and depth < 1:
+        print("Error: --depth must be at least 1.")
+        return
+    if object_filter is not None and object_filter not in FILTERS:
+        print(f"Error: Unsupported filter {object_filter}.")
+        return
+    if not os.path.isdir(os.path.join(source, PIT_DIR)):
+        print(f"Error: {args.source} is not a pit repository.")
+        return
+    if os.path.exists(destination) and (
+        not os.path.isdir(destination) or os.listdir(destination)
+    ):
+        print(f"Error: {args.destination} already exists and is not an empty directory.")
+        return
+
+    source_repo = Repository(source)
+    branches = source_repo.branches()
+    os.makedirs(os.path.join(destination, PIT_DIR, "objects"))
+    os.makedirs(os.path.join(destination, PIT_DIR, "refs", "heads"))
+    if depth is None and object_filter is None:
+        linked, copied = link_objects(source, destination, jobs)
+        shallow = read_shallow(source)
+    else:
+        objects, shallow = select_objects(
+            source, list(branches.values()), depth, blobs=object_filter is None
+        )
+        linked, copied = copy_objects(source, destination, objects, jobs)
+    if shallow:
+        write_file(get_shallow_path(destination), "".join(f"{h}\n" for h in sorted(shallow)))
+
+    config_path = os.path.join(source, PIT_DIR, "config")
+    if os.path.exists(config_path):
+        shutil.copyfile(config_path, os.path.join(destination, PIT_DIR, "config"))
+    remote = {"url": source}
+    if object_filter is not None:
+        remote.update(promisor="true", filter=object_filter)
+    set_config_values(destination, "remote", remote)
+
+    repo = Repository(destination)
+    repo.update_refs(branches)
+    repo.set_head(source_repo.current_branch)
+    if branches:
+        update_commit_graph(destination, list(branches.values()))
+    head = repo.head
+    index = checkout_worktree(destination, repo.commit(head).tree, jobs) if head else Index()
+    repo.write_index(index)
+
+    print(
+        f"Cloned {source} into {destination} "
+        f"({linked} object files linked, {copied} copied)."
+    )
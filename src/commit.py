@@ -1,85 +1,115 @@
 #!/usr/bin/env python3
 
-import hashlib
+import itertools
 import os
 import time
 
+from src.commit_graph import update_commit_graph, walk_commits
+from src.config import get_config_value
 from src.constants import PIT_DIR
-from src.utils import (ensure_repo, get_current_branch, get_repo_dir,
-                       get_staged_files, hash_content, hash_object, read_file,
-                       split_object_hash, write_file, write_tree)
+from src.objects import format_commit, read_commit, write_object
+from src.repository import Repository, require_repo
+from src.tree import write_tree
+from src.utils import read_file
 
-CURRENT_BRANCH = get_current_branch()
-REPO_DIR = get_repo_dir()
 
+def get_merge_head_path(repo_dir):
+    """Return the path of the file recording the branch head of an unfinished merge."""
+    return os.path.join(repo_dir, PIT_DIR, "MERGE_HEAD")
 
-def commit_changes(args):
-    """
-    Creates a commit object with the current state of the repository.
-    """
-    # Get repo dir to enable calling the command from anypoint within the repo tree
-    repo_dir = get_repo_dir()
-    # Make sure repo has been initialized
-    ensure_repo(repo_dir)
-    # Get files already in stating
-    staged_files = get_staged_files(repo_dir)
-
-    if not staged_files:
-        print("No changes to commit.")
-        return
-
-    # Get current commit hash
-    branch_file = os.path.join(REPO_DIR, PIT_DIR, "refs/heads", CURRENT_BRANCH)
-    parent_hash = None
-    if os.path.exists(branch_file):
-        parent_hash = read_file(branch_file, "line").strip()
 
-    print("PARENT HASH", parent_hash)
+def get_author(repo_dir):
+    """Return the commit author, `Name <email>`, from the user section of the config."""
+    name = get_config_value(repo_dir, "user", "name", "Unknown")
+    email = get_config_value(repo_dir, "user", "email", "")
+    return f"{name} <{email}>"
 
-    # Write the tree object
-    # tree_hash = write_tree(REPO_DIR)
 
-    commit_data = f"commit: {time.time()}\n"
-    # commit_data += f"tree {tree_hash}\n"
-    if parent_hash:
-        commit_data += f"parent {parent_hash}\n"
-    commit_data += f"message: {args.message}\n"
-    commit_data += "".join(staged_files)
+def commit_changes(args, repo=None):
+    """
+    Creates a commit object with the current state of the repository.
 
-    # commit_hash = hash_object(commit_data.encode("utf-8"), "commit", REPO_DIR)
-    commit_hash = hashlib.sha1(commit_data.encode("utf-8")).hexdigest()
+    The tree objects are written from the index; only directories containing staged
+    changes get new trees, the others reuse the tree hashes cached in the index.
 
-    # split commit hash into folder and filename
-    commit_folder, commit_file_name = split_object_hash(commit_hash)
+    Args:
+        args: Command-line arguments with the commit `message`.
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory, which enables calling the command from anypoint within the repo tree.
+    """
+    # Make sure repo has been initialized
+    repo = repo or require_repo()
+    # Hold the index and branch locks from reading the parent to moving the branch, so a
+    # concurrent commit can neither be lost nor commit the same staged changes
+    with repo.lock_index() as index, repo.lock_ref(repo.current_branch):
+        commit_hash = _commit_locked(args, repo, index)
+    if commit_hash:
+        print(f"Committed changes: {commit_hash}")
 
-    # create the dir if it does not exits
-    commit_dir = f"{PIT_DIR}/objects/{commit_folder}"
-    os.makedirs(commit_dir, exist_ok=True)
-    # write object files
-    write_file(f"{commit_dir}/{commit_file_name}", commit_data)
 
-    # write branch heads
-    write_file(f"{PIT_DIR}/refs/heads/{CURRENT_BRANCH}", commit_hash)
+def _commit_locked(args, repo, index):
+    """Write the commit while `commit_changes` holds the locks. Returns its hash or None."""
+    # Get files already in stating
+    staged_files = repo.staged_files()
 
-    # clear branch index
-    write_file(f"{PIT_DIR}/index", "")
+    # A merge left to finish by hand is committed even if it changes nothing
+    merge_head_path = get_merge_head_path(repo.root)
+    merge_head = (read_file(merge_head_path, "line") or "").strip()
 
-    print(f"Committed changes: {commit_hash}")
+    if not staged_files and not merge_head:
+        print("No changes to commit.")
+        return None
 
+    # Get current commit hash
+    parent_hash = repo.head
+
+    # Write the tree objects, their hashes are cached in the index for the next commit
+    tree_hash = write_tree(repo.root, index)
+
+    parents = [parent_hash] if parent_hash else []
+    if merge_head:
+        parents.append(merge_head)
+    commit_data = format_commit(
+        tree_hash,
+        parents,
+        get_author(repo.root),
+        time.time(),
+        args.message,
+    )
+    commit_hash = write_object(repo.root, commit_data, "commit")
+
+    # write branch heads, then the index with its cached trees
+    repo.write_ref(repo.current_branch, commit_hash)
+    repo.write_index(index)
+    update_commit_graph(repo.root, [commit_hash])
+    if merge_head:
+        os.remove(merge_head_path)
+    return commit_hash
+
+
+def view_log(args, repo=None):
+    """
+    Show the history of the current branch, newest first.
 
-def view_log(args):
-    if not os.path.exists(PIT_DIR):
+    History is walked through the commit-graph; only the commits that are printed are
+    opened, for their author and message. `max_count` and `since` limit the output.
+    """
+    repo = repo or Repository.discover()
+    if not repo:
         print("Not a repository.")
         return
 
-    with open(f"{PIT_DIR}/refs/heads/{CURRENT_BRANCH}", "r") as branch:
-        commit_hash = branch.read().strip()
-
-    while commit_hash:
-        commit_file = f"{PIT_DIR}/objects/{commit_hash}"
-        if not os.path.exists(commit_file):
-            break
-        with open(commit_file, "r") as commit_obj:
-            print(commit_obj.read())
-            # Assume parent commit hash is in the data for simplicity
-            commit_hash = None  # Replace with actual parent hash retrieval
+    commit_hash = repo.head
+    if not commit_hash:
+        return
+    max_count = getattr(args, "max_count", None)
+    commits = walk_commits(repo.root, [commit_hash], since=getattr(args, "since", None))
+    for graph_commit in itertools.islice(commits, max_count):
+        commit = read_commit(repo.root, graph_commit.hash)
+        print(f"commit {graph_commit.hash}")
+        if len(graph_commit.parents) > 1:
+            print(f"Merge: {' '.join(parent[:7] for parent in graph_commit.parents)}")
+        if commit.author:
+            print(f"Author: {commit.author}")
+        print(f"Date:   {time.ctime(graph_commit.timestamp)}")
+        print(f"\n    {commit.message}\n")
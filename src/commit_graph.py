@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+The commit-graph: a cache of the history of a repository in a single binary file.
+
+Walking history through commit objects means opening, decompressing and parsing one object
+per commit. The commit-graph (`.pit/objects/info/commit-graph`) stores what history walks
+need, the parents, tree, timestamp and generation number of every commit, so `pit log`,
+`--since` filters and merge-base lookups run without opening commit objects.
+
+The generation number of a commit is one more than the highest generation of its parents
+(1 for a root commit). A commit can only be an ancestor of commits with a higher
+generation, which lets searches stop early.
+
+Layout (integers are big-endian):
+- header: signature `PCGR`, version (uint32), commit count (uint32)
+- fanout: 256 uint32, entry i is the number of commits whose hash starts with a byte <= i
+- the 20-byte hashes of all commits, sorted
+- one record per commit, in hash order: tree hash (20 bytes, zeros when the commit has no
+  tree), first and second parent positions (uint32), generation (uint32) and timestamp
+  (uint64). A missing parent is `NO_PARENT`. For commits with more than two parents, the
+  second parent field is `EXTRA_EDGES` | the start of their remaining parents in the
+  extra edge list.
+- extra edges: count (uint32), then parent positions (uint32); the last parent of each
+  commit has the `EXTRA_EDGES` bit set
+- trailer: SHA-1 of everything above
+
+The file is updated on every commit: the commits already in the graph are copied over and
+only the new ones are read from their objects.
+"""
+
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from src import trace
+from src.constants import PIT_DIR
+from src.lockfile import LockFile
+from src.objects import read_commit
+
+GRAPH_SIGNATURE = b"PCGR"
+GRAPH_VERSION = 1
+
+NO_PARENT = 0x7FFFFFFF
+EXTRA_EDGES = 0x80000000
+# The generation of commits that are not in the graph yet: they sort before every
+# commit of the graph, which keeps generation-ordered walks correct
+GENERATION_UNKNOWN = 0xFFFFFFFF
+
+_HEADER = struct.Struct(">4sII")
+_FANOUT = struct.Struct(">256I")
+_RECORD = struct.Struct(">20sIIIQ")
+_HASH_SIZE = 20
+_NULL_TREE = bytes(_HASH_SIZE)
+
+GraphCommit = namedtuple(
+    "GraphCommit", ["hash", "tree", "parents", "timestamp", "generation"]
+)
+
+_cache = {}
+
+
+def get_commit_graph_path(repo_dir):
+    """Return the path of the commit-graph file of the given repository."""
+    return os.path.join(repo_dir, PIT_DIR, "objects", "info", "commit-graph")
+
+
+class CommitGraph:
+    """
+    A memory-mapped commit-graph file, for looking up commits by hash or position.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version, self.count = _HEADER.unpack_from(self._data, 0)
+        if signature != GRAPH_SIGNATURE or version != GRAPH_VERSION:
+            raise ValueError(f"Invalid commit-graph {path}")
+        self._fanout = _FANOUT.unpack_from(self._data, _HEADER.size)
+        self._hashes_offset = _HEADER.size + _FANOUT.size
+        self._records_offset = self._hashes_offset + self.count * _HASH_SIZE
+        self._edges_offset = self._records_offset + self.count * _RECORD.size + 4
+
+    def close(self):
+        self._data.close()
+
+    def __len__(self):
+        return self.count
+
+    def _hash_at(self, position):
+        start = self._hashes_offset + position * _HASH_SIZE
+        return self._data[start : start + _HASH_SIZE].hex()
+
+    def find(self, commit_hash):
+        """Return the position of a commit with a fanout-bounded binary search, or None."""
+        raw_hash = bytes.fromhex(commit_hash)
+        first = raw_hash[0]
+        low = self._fanout[first - 1] if first else 0
+        high = self._fanout[first]
+        while low < high:
+            middle = (low + high) // 2
+            start = self._hashes_offset + middle * _HASH_SIZE
+            candidate = self._data[start : start + _HASH_SIZE]
+            if candidate < raw_hash:
+                low = middle + 1
+            elif candidate > raw_hash:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def __contains__(self, commit_hash):
+        return self.find(commit_hash) is not None
+
+    def _parent_positions(self, first, second):
+        if first == NO_PARENT:
+            return []
+        if second == NO_PARENT:
+            return [first]
+        if not second & EXTRA_EDGES:
+            return [first, second]
+        positions = [first]
+        offset = self._edges_offset + (second & ~EXTRA_EDGES) * 4
+        while True:
+            (edge,) = struct.unpack_from(">I", self._data, offset)
+            positions.append(edge & ~EXTRA_EDGES)
+            if edge & EXTRA_EDGES:
+                return positions
+            offset += 4
+
+    def commit_at(self, position):
+        """Return the GraphCommit stored at a position."""
+        tree, first, second, generation, timestamp = _RECORD.unpack_from(
+            self._data, self._records_offset + position * _RECORD.size
+        )
+        parents = tuple(
+            self._hash_at(parent) for parent in self._parent_positions(first, second)
+        )
+        return GraphCommit(
+            self._hash_at(position),
+            tree.hex() if tree != _NULL_TREE else None,
+            parents,
+            timestamp,
+            generation,
+        )
+
+    def get(self, commit_hash):
+        """Return the GraphCommit of a commit, or None if it is not in the graph."""
+        position = self.find(commit_hash)
+        return None if position is None else self.commit_at(position)
+
+    def commits(self):
+        """Yield every commit of the graph, in hash order."""
+        for position in range(self.count):
+            yield self.commit_at(position)
+
+
+def read_commit_graph(repo_dir):
+    """
+    Return the commit-graph of a repository, opening it once per process.
+
+    The file is reopened when it is replaced. Returns None if there is no commit-graph.
+    """
+    path = get_commit_graph_path(repo_dir)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    if cached:
+        cached[1].close()
+    graph = CommitGraph(path)
+    _cache[path] = (key, graph)
+    return graph
+
+
+def write_commit_graph(repo_dir, commits, lock=None):
+    """
+    Write a commit-graph file, replacing the current one atomically.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        commits (dict): A mapping of hash to GraphCommit. The parents of every commit must
+            be in the mapping too.
+        lock (LockFile): The commit-graph lock, if the caller already holds it. It is
+            released.
+    """
+    sorted_hashes = sorted(commits)
+    positions = {commit_hash: i for i, commit_hash in enumerate(sorted_hashes)}
+
+    fanout = [0] * 256
+    for commit_hash in sorted_hashes:
+        fanout[int(commit_hash[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    data = bytearray(_HEADER.pack(GRAPH_SIGNATURE, GRAPH_VERSION, len(sorted_hashes)))
+    data += _FANOUT.pack(*fanout)
+    for commit_hash in sorted_hashes:
+        data += bytes.fromhex(commit_hash)
+
+    extra_edges = []
+    for commit_hash in sorted_hashes:
+        commit = commits[commit_hash]
+        parents = [positions[parent] for parent in commit.parents]
+        first = parents[0] if parents else NO_PARENT
+        second = parents[1] if len(parents) == 2 else NO_PARENT
+        if len(parents) > 2:
+            second = EXTRA_EDGES | len(extra_edges)
+            extra_edges.extend(parents[1:-1])
+            extra_edges.append(EXTRA_EDGES | parents[-1])
+        tree = bytes.fromhex(commit.tree) if commit.tree else _NULL_TREE
+        data += _RECORD.pack(tree, first, second, commit.generation, commit.timestamp)
+
+    data += struct.pack(">I", len(extra_edges))
+    for edge in extra_edges:
+        data += struct.pack(">I", edge)
+    data += hashlib.sha1(data).digest()
+
+    with lock or LockFile(get_commit_graph_path(repo_dir)) as graph_lock:
+        graph_lock.write(data)
+        graph_lock.commit()
+
+
+def _load_commit(repo_dir, commit_hash):
+    """Read a commit that is not in the graph from its object, without a generation."""
+    commit = read_commit(repo_dir, commit_hash)
+    if commit is None:
+        return None
+    return GraphCommit(
+        commit_hash, commit.tree, tuple(commit.parents), commit.timestamp, GENERATION_UNKNOWN
+    )
+
+
+@trace.traced("commit_graph.update")
+def update_commit_graph(repo_dir, tips):
+    """
+    Add commits and their ancestors to the commit-graph.
+
+    Commits already in the graph are copied over from it; only the others are read from
+    their objects. The graph is read and written under its lock, so concurrent updates
+    keep each other's commits.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        tips (list): The hashes of the commits to add.
+    """
+    with LockFile(get_commit_graph_path(repo_dir)) as lock:
+        _update_locked(repo_dir, tips, lock)
+
+
+def _update_locked(repo_dir, tips, lock):
+    """Add the commits to the commit-graph while `update_commit_graph` holds its lock."""
+    graph = read_commit_graph(repo_dir)
+    missing = {}
+    pending = [tip for tip in tips if not (graph and tip in graph)]
+    while pending:
+        commit_hash = pending.pop()
+        if commit_hash in missing:
+            continue
+        commit = _load_commit(repo_dir, commit_hash)
+        if commit is None:
+            raise ValueError(f"Commit {commit_hash} not found")
+        missing[commit_hash] = commit
+        pending.extend(p for p in commit.parents if not (graph and p in graph))
+    if not missing:
+        return
+
+    commits = {commit.hash: commit for commit in graph.commits()} if graph else {}
+
+    def lookup(commit_hash):
+        return commits.get(commit_hash) or missing[commit_hash]
+
+    # Assign generations, parents before children
+    for commit_hash in missing:
+        stack = [commit_hash]
+        while stack:
+            current = lookup(stack[-1])
+            if current.generation != GENERATION_UNKNOWN:
+                stack.pop()
+                continue
+            unknown = [
+                p for p in current.parents if lookup(p).generation == GENERATION_UNKNOWN
+            ]
+            if unknown:
+                stack.extend(unknown)
+                continue
+            parent_generations = [lookup(p).generation for p in current.parents]
+            commits[current.hash] = current._replace(
+                generation=max(parent_generations, default=0) + 1
+            )
+            stack.pop()
+    write_commit_graph(repo_dir, commits, lock)
+
+
+def get_commit(repo_dir, commit_hash, graph=None):
+    """
+    Return the GraphCommit of a commit, from the commit-graph when it is there.
+
+    Commits missing from the graph are read from their objects and have an unknown
+    generation. Returns None if the commit does not exist.
+    """
+    graph = graph if graph is not None else read_commit_graph(repo_dir)
+    if graph is not None:
+        commit = graph.get(commit_hash)
+        if commit is not None:
+            return commit
+    return _load_commit(repo_dir, commit_hash)
+
+
+def walk_commits(repo_dir, tips, since=None):
+    """
+    Yield the commits reachable from the tips, newest first, each once.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        tips (list): The hashes of the commits to start from.
+        since (int): Stop at the first commit older than this Unix timestamp.
+
+    Yields:
+        GraphCommit: The commits, by decreasing timestamp.
+    """
+    graph = read_commit_graph(repo_dir)
+    seen = set()
+    queue = []
+
+    def push(commit_hash):
+        if commit_hash in seen:
+            return
+        seen.add(commit_hash)
+        commit = get_commit(repo_dir, commit_hash, graph)
+        if commit is not None:
+            heapq.heappush(queue, (-commit.timestamp, commit_hash, commit))
+
+    for tip in tips:
+        push(tip)
+    while queue:
+        _, _, commit = heapq.heappop(queue)
+        if since is not None and commit.timestamp < since:
+            return
+        yield commit
+        for parent in commit.parents:
+            push(parent)
+
+
+_PARENT1, _PARENT2, _STALE, _RESULT = 1, 2, 4, 8
+_BOTH = _PARENT1 | _PARENT2
+
+
+def _priority(commit):
+    """Heap key that pops commits by decreasing generation, then decreasing timestamp."""
+    return (-commit.generation, -commit.timestamp, commit.hash)
+
+
+def merge_bases(repo_dir, one, two):
+    """
+    Find the best common ancestors of two commits.
+
+    Both sides are painted down their history, highest generation first, so a commit is
+    always visited after all of its descendants in the search. The search stops as soon as
+    every commit left in the frontier is known to be a common ancestor or below one.
+
+    Returns:
+        list: The hashes of the common ancestors no other common ancestor descends from,
+            highest generation first. Empty if the commits share no history.
+    """
+    if one == two:
+        return [one]
+    graph = read_commit_graph(repo_dir)
+    commits = {}
+    flags = {}
+    queue = []
+
+    # Queue entries per commit, and the number of entries whose commit is not stale
+    queued = {}
+    active = 0
+
+    def push(commit_hash, flag):
+        nonlocal active
+        commit = commits.get(commit_hash)
+        if commit is None:
+            commit = commits[commit_hash] = get_commit(repo_dir, commit_hash, graph)
+            if commit is None:
+                raise ValueError(f"Commit {commit_hash} not found")
+        before = flags.get(commit_hash, 0)
+        flags[commit_hash] = before | flag
+        if flag & _STALE and not before & _STALE:
+            active -= queued.get(commit_hash, 0)
+        queued[commit_hash] = queued.get(commit_hash, 0) + 1
+        if not flags[commit_hash] & _STALE:
+            active += 1
+        heapq.heappush(queue, (_priority(commit), commit_hash))
+
+    push(one, _PARENT1)
+    push(two, _PARENT2)
+    results = []
+    while active:
+        _, commit_hash = heapq.heappop(queue)
+        queued[commit_hash] -= 1
+        if not flags[commit_hash] & _STALE:
+            active -= 1
+        flag = flags[commit_hash] & (_PARENT1 | _PARENT2 | _STALE)
+        if flag == _PARENT1 | _PARENT2:
+            if not flags[commit_hash] & _RESULT:
+                flags[commit_hash] |= _RESULT
+                results.append(commit_hash)
+            flag |= _STALE
+        for parent in commits[commit_hash].parents:
+            if flags.get(parent, 0) & flag != flag:
+                push(parent, flag)
+
+    # A result reachable from another result is not a best common ancestor
+    return [
+        base
+        for base in results
+        if not any(other != base and is_ancestor(repo_dir, base, other) for other in results)
+    ]
+
+
+def ahead_behind(repo_dir, one, two):
+    """
+    Count the commits reachable from one commit but not the other, in both directions.
+
+    Both sides are painted down their history like in `merge_bases`. A commit is counted
+    with the flags it has when popped; the search stops once every commit left in the
+    frontier is reachable from both sides.
+
+    Commits missing from the commit-graph are popped by timestamp, so one may be popped
+    before a descendant, e.g. with equal timestamps. When the other side reaches such a
+    commit afterwards, it is moved to the count of both sides and queued again to pass
+    that on to its ancestors, and the search does not stop while any is left.
+
+    Returns:
+        tuple: (ahead, behind), the number of commits only reachable from `one` and the
+            number of commits only reachable from `two`.
+    """
+    if one == two:
+        return 0, 0
+    graph = read_commit_graph(repo_dir)
+    commits = {}
+    flags = {}
+    queue = []
+
+    # Commits in the queue, and how many of them can still change the counts
+    queued = set()
+    active = 0
+
+    def is_active(commit_hash):
+        flag = flags[commit_hash]
+        return flag != _BOTH or commits[commit_hash].generation == GENERATION_UNKNOWN
+
+    def enqueue(commit_hash):
+        nonlocal active
+        queued.add(commit_hash)
+        active += is_active(commit_hash)
+        heapq.heappush(queue, (_priority(commits[commit_hash]), commit_hash))
+
+    def push(commit_hash, flag):
+        nonlocal active
+        if commit_hash not in flags:
+            commit = commits[commit_hash] = get_commit(repo_dir, commit_hash, graph)
+            if commit is None:
+                raise ValueError(f"Commit {commit_hash} not found")
+            flags[commit_hash] = flag
+            enqueue(commit_hash)
+            return
+        before = flags[commit_hash]
+        if before | flag == before:
+            return
+        if commit_hash in queued:
+            active -= is_active(commit_hash)
+            flags[commit_hash] = before | flag
+            active += is_active(commit_hash)
+        else:
+            # Popped before a descendant: count it again once its ancestors know
+            counts[before] -= 1
+            flags[commit_hash] = before | flag
+            enqueue(commit_hash)
+
+    counts = {_PARENT1: 0, _PARENT2: 0, _BOTH: 0}
+    push(one, _PARENT1)
+    push(two, _PARENT2)
+    while active:
+        _, commit_hash = heapq.heappop(queue)
+        active -= is_active(commit_hash)
+        queued.discard(commit_hash)
+        flag = flags[commit_hash]
+        counts[flag] += 1
+        for parent in commits[commit_hash].parents:
+            push(parent, flag)
+    return counts[_PARENT1], counts[_PARENT2]
+
+
+def merge_base(repo_dir, one, two):
+    """Return the hash of the best common ancestor of two commits, or None."""
+    bases = merge_bases(repo_dir, one, two)
+    return bases[0] if bases else None
+
+
+def is_ancestor(repo_dir, ancestor, descendant):
+    """
+    Check whether a commit is reachable from another one (or is that commit).
+
+    Commits with a generation not higher than the ancestor's are not descended into.
+    """
+    graph = read_commit_graph(repo_dir)
+    target = get_commit(repo_dir, ancestor, graph)
+    if target is None:
+        return False
+    seen = {descendant}
+    pending = [descendant]
+    while pending:
+        commit_hash = pending.pop()
+        if commit_hash == ancestor:
+            return True
+        commit = get_commit(repo_dir, commit_hash, graph)
+        if commit is None:
+            continue
+        # The graph holds every ancestor of its commits, so unknown generations only
+        # need to be walked through
+        if GENERATION_UNKNOWN != commit.generation <= target.generation:
+            continue
+        for parent in commit.parents:
+            if parent not in seen:
+                seen.add(parent)
+                pending.append(parent)
+    return False
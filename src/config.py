@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Access to the repository configuration in `.pit/config`.
+
+The file uses git-style INI syntax:
+
+    [core]
+        compression = 1
+        chunkThreshold = 8388608
+
+`core.chunkThreshold` turns on content-defined chunking of blobs of at least that many
+bytes (see `src/chunking.py`); it is off (0) by default.
+
+The parsed file is cached per process and re-read only when it changes on disk.
+
+A partial clone records the repository it was cloned from, which missing objects are
+fetched from:
+
+    [remote]
+        url = /path/to/source
+        promisor = true
+        filter = blob:none
+"""
+
+import configparser
+import io
+import os
+
+from src.constants import PIT_DIR
+from src.lockfile import write_locked
+
+DEFAULT_COMPRESSION_LEVEL = 1
+
+_cache = {}
+
+
+def get_config_path(repo_dir):
+    """Return the path of the configuration file of the given repository."""
+    return os.path.join(repo_dir, PIT_DIR, "config")
+
+
+def _new_config():
+    """
+    Return an empty parser: values are taken literally, so paths may contain `%`, and option
+    names keep their case when the file is rewritten (`chunkThreshold`, not `chunkthreshold`).
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    config.optionxform = str
+    return config
+
+
+def read_config(repo_dir):
+    """
+    Read the configuration of the given repository.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+
+    Returns:
+        configparser.ConfigParser: The parsed configuration, empty if there is no config file.
+    """
+    config_path = get_config_path(repo_dir)
+    try:
+        st = os.stat(config_path)
+    except FileNotFoundError:
+        return _new_config()
+
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(config_path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    config = _new_config()
+    config.read(config_path, encoding="utf-8")
+    _cache[config_path] = (key, config)
+    return config
+
+
+def get_config_value(repo_dir, section, option, default=None):
+    """Read a string option from the configuration, or default if it is missing."""
+    return read_config(repo_dir).get(section, option, fallback=default)
+
+
+def get_config_int(repo_dir, section, option, default):
+    """
+    Read an integer option from the configuration.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        section (str): The section of the option, e.g. "core".
+        option (str): The name of the option.
+        default (int): The value to use if the option is missing or not an integer.
+
+    Returns:
+        int: The value of the option.
+    """
+    try:
+        return read_config(repo_dir).getint(section, option, fallback=default)
+    except ValueError:
+        return default
+
+
+def get_compression_level(repo_dir):
+    """Return the zlib level loose objects are compressed with (`core.compression`)."""
+    level = get_config_int(repo_dir, "core", "compression", DEFAULT_COMPRESSION_LEVEL)
+    return level if -1 <= level <= 9 else DEFAULT_COMPRESSION_LEVEL
+
+
+def get_chunk_threshold(repo_dir):
+    """Return the size from which blobs are stored in chunks (`core.chunkThreshold`), or 0."""
+    return max(0, get_config_int(repo_dir, "core", "chunkThreshold", 0))
+
+
+def set_config_values(repo_dir, section, values):
+    """
+    Set options of one section of the configuration, keeping every other option.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        section (str): The section of the options, e.g. "remote".
+        values (dict): A mapping of option name to its new value.
+    """
+    config = _new_config()
+    config.read(get_config_path(repo_dir), encoding="utf-8")
+    if not config.has_section(section):
+        config.add_section(section)
+    for option, value in values.items():
+        config.set(section, option, str(value))
+    out = io.StringIO()
+    config.write(out)
+    write_locked(get_config_path(repo_dir), out.getvalue())
+
+
+def get_promisor(repo_dir):
+    """Return the repository a partial clone fetches missing objects from, or None."""
+    try:
+        if not read_config(repo_dir).getboolean("remote", "promisor", fallback=False):
+            return None
+    except ValueError:
+        return None
+    return get_config_value(repo_dir, "remote", "url")
@@ -5,4 +5,5 @@ This file common string literals as constants to reduce typos and enforece unifo
 
 PIT_DIR = ".pit"
 MAIN_BRANCH = "main"
-NOT_A_REPO_MESSAGE = "Error: Not a Pit Repository"
\ No newline at end of file
+NOT_A_REPO_MESSAGE = "Error: Not a Pit Repository"
+CORRUPT_INDEX_MESSAGE = "Error: The index file is corrupt"
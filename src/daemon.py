@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+A long-running filesystem monitor answering status queries (`pit daemon`).
+
+The daemon scans the working tree once, then keeps the classification of every changed
+file (modified, deleted or untracked) in memory. inotify reports which files and
+directories changed since, and only those are classified again when a query comes in, so
+answering does not walk the tree. Changes to the index, HEAD or the branch refs are watched
+too: the files whose index entries changed are classified again and the staged files are
+recomputed.
+
+Queries are JSON lines sent over a Unix socket (`.pit/daemon.sock`):
+
+    {"command": "status"}      -> {"staged": [...], "modified": [...], "deleted": [...],
+                                   "untracked": [...]}
+    {"command": "diff-files"}  -> {"files": [...]}, the files differing from the index
+    {"command": "ping"}        -> {"pong": true}
+    {"command": "stop"}        -> {"stopped": true}
+
+Commands call `query_daemon` (see `src/daemon_client.py`, which does not load the server
+side), which returns None when no daemon is running so they fall back to scanning the tree
+themselves.
+"""
+
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+
+from src import inotify
+from src.constants import PIT_DIR
+from src.daemon_client import QUERY_TIMEOUT, get_socket_path, query_daemon
+from src.ignore import IGNORE_FILE, is_ignored
+from src.index import get_index_mtime_ns, read_index
+from src.repository import require_repo
+from src.utils import get_staged_files
+from src.worktree import (DELETED, MODIFIED, UNTRACKED, classify_path,
+                          scan_worktree)
+
+def _is_within(path, prefix):
+    return path == prefix or path.startswith(prefix + "/")
+
+
+class Daemon:
+    """
+    The in-memory state of the working tree, kept up to date from inotify events.
+    """
+
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self.pit_dir = os.path.join(repo_dir, PIT_DIR)
+        self.inotify = inotify.Inotify()
+        self.watches = {}  # watch descriptor -> watched directory, relative to the root
+        self.full_rescan()
+
+    # Watches
+
+    def _watch(self, rel_dir):
+        try:
+            wd = self.inotify.add_watch(os.path.join(self.repo_dir, rel_dir))
+        except OSError:
+            return  # Removed in the meantime, its parent reports it
+        self.watches[wd] = rel_dir
+
+    def _watch_tree(self, rel_dir):
+        """Watch a directory and every sub directory that is not ignored."""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            self._watch(current)
+            try:
+                with os.scandir(os.path.join(self.repo_dir, current)) as it:
+                    for entry in it:
+                        path = f"{current}/{entry.name}" if current else entry.name
+                        if not entry.is_dir(follow_symlinks=False) or path == PIT_DIR:
+                            continue
+                        if not is_ignored(self.repo_dir, path, is_dir=True):
+                            stack.append(path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _unwatch_tree(self, rel_dir):
+        for wd, watched in list(self.watches.items()):
+            if _is_within(watched, rel_dir):
+                self.inotify.rm_watch(wd)
+                del self.watches[wd]
+
+    # State
+
+    def full_rescan(self):
+        """Forget everything and classify the whole working tree again."""
+        for wd in list(self.watches):
+            self.inotify.rm_watch(wd)
+        self.watches = {}
+        self.pit_wd = self.inotify.add_watch(self.pit_dir)
+        refs_dir = os.path.join(self.pit_dir, "refs", "heads")
+        self.refs_wd = self.inotify.add_watch(refs_dir) if os.path.isdir(refs_dir) else None
+        self._watch_tree("")
+
+        self.index = read_index(self.repo_dir)
+        self.index_mtime_ns = get_index_mtime_ns(self.repo_dir)
+        self.staged = None
+        self.dirty_paths, self.dirty_dirs = set(), set()
+        self.kinds = {}
+        for entry in scan_worktree(self.repo_dir, self.index, set()):
+            self.kinds[entry.path] = entry.kind
+
+        # Tracked files in ignored directories get no events, they are checked on queries
+        watched = set(self.watches.values())
+        self.unwatched = {
+            path for path in self.index if os.path.dirname(path) not in watched
+        }
+
+    def _reload_index(self):
+        """Classify again the files whose index entries changed."""
+        index = read_index(self.repo_dir)
+        for path in self.index.keys() | index.keys():
+            if self.index.get(path) != index.get(path):
+                self.dirty_paths.add(path)
+                if os.path.dirname(path) not in self.watches.values():
+                    self.unwatched.add(path)
+        self.index = index
+        self.index_mtime_ns = get_index_mtime_ns(self.repo_dir)
+        self.staged = None
+
+    def handle_events(self):
+        """Read the pending inotify events and record what has to be classified again."""
+        for event in self.inotify.read_events():
+            if event.mask & inotify.IN_Q_OVERFLOW:
+                self.full_rescan()
+                continue
+            if event.wd == self.pit_wd:
+                if event.name == "index":
+                    self._reload_index()
+                elif event.name in ("HEAD", "packed-refs"):
+                    self.staged = None
+                elif event.name == "refs" and self.refs_wd is None:
+                    self.full_rescan()
+                continue
+            if event.wd == self.refs_wd:
+                self.staged = None
+                continue
+
+            rel_dir = self.watches.get(event.wd)
+            if rel_dir is None:
+                continue
+            if event.mask & inotify.IN_IGNORED:
+                del self.watches[event.wd]
+                continue
+            if not event.name:
+                continue  # The directory itself, its parent reports the change
+            path = f"{rel_dir}/{event.name}" if rel_dir else event.name
+            if path == PIT_DIR:
+                continue
+            if event.mask & inotify.IN_ISDIR:
+                self.dirty_dirs.add(path)
+                if event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                    if not is_ignored(self.repo_dir, path, is_dir=True):
+                        self._watch_tree(path)
+                elif event.mask & inotify.IN_MOVED_FROM:
+                    self._unwatch_tree(path)
+            elif event.name == IGNORE_FILE:
+                self.dirty_dirs.add(rel_dir)
+            else:
+                self.dirty_paths.add(path)
+
+    def refresh(self):
+        """Classify again every file that changed since the last query."""
+        self.handle_events()
+        for rel_dir in sorted(self.dirty_dirs):
+            for path in [p for p in self.kinds if not rel_dir or _is_within(p, rel_dir)]:
+                del self.kinds[path]
+            for entry in scan_worktree(self.repo_dir, self.index, set(), prefix=rel_dir):
+                self.kinds[entry.path] = entry.kind
+        for path in self.dirty_paths | self.unwatched:
+            if any(not d or _is_within(path, d) for d in self.dirty_dirs):
+                continue  # Already classified by the directory scan
+            kind = classify_path(self.repo_dir, self.index, path, self.index_mtime_ns)
+            if kind in (MODIFIED, DELETED, UNTRACKED):
+                self.kinds[path] = kind
+            else:
+                self.kinds.pop(path, None)
+        self.dirty_paths, self.dirty_dirs = set(), set()
+        if self.staged is None:
+            self.staged = get_staged_files(self.repo_dir, self.index)
+
+    def answer(self, command):
+        """Answer a query, see the module documentation."""
+        if command == "ping":
+            return {"pong": True}
+        self.refresh()
+        if command == "status":
+            files = {MODIFIED: [], DELETED: [], UNTRACKED: []}
+            for path, kind in sorted(self.kinds.items()):
+                files[kind].append(path)
+            return {
+                "staged": self.staged,
+                "modified": files[MODIFIED],
+                "deleted": files[DELETED],
+                "untracked": files[UNTRACKED],
+            }
+        if command == "diff-files":
+            return {
+                "files": sorted(p for p, k in self.kinds.items() if k in (MODIFIED, DELETED))
+            }
+        return {"error": f"unknown command {command}"}
+
+    def serve(self, server):
+        """Answer queries on a listening socket until a stop query arrives."""
+        selector = selectors.DefaultSelector()
+        selector.register(self.inotify, selectors.EVENT_READ)
+        selector.register(server, selectors.EVENT_READ)
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fileobj is self.inotify:
+                        self.handle_events()
+                        continue
+                    connection, _ = server.accept()
+                    with connection:
+                        if not self._handle_connection(connection):
+                            return
+        finally:
+            selector.close()
+            self.inotify.close()
+
+    def _handle_connection(self, connection):
+        """Answer one query, return False if the daemon has to stop."""
+        connection.settimeout(QUERY_TIMEOUT)
+        data = b""
+        try:
+            while not data.endswith(b"\n") and (chunk := connection.recv(65536)):
+                data += chunk
+            command = json.loads(data).get("command")
+        except (OSError, ValueError, AttributeError):
+            return True
+        if command == "stop":
+            connection.sendall(b'{"stopped": true}\n')
+            return False
+        try:
+            connection.sendall(json.dumps(self.answer(command)).encode("utf-8") + b"\n")
+        except OSError:
+            pass
+        return True
+
+
+def _detach():
+    """Run the rest of the process in the background, detached from the terminal."""
+    if os.fork():
+        os._exit(0)
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+
+def run_daemon(args, repo=None):
+    """
+    Start the daemon of the current repository, or stop it with `--stop`.
+
+    Args:
+        args: Command-line arguments with `detach` and `stop`.
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory.
+    """
+    repo_dir = (repo or require_repo()).root
+    try:
+        socket_path = get_socket_path(repo_dir)
+    except PermissionError as e:
+        print(f"Error: Cannot place the daemon socket: {e}")
+        exit(1)
+
+    if getattr(args, "stop", False):
+        if query_daemon(repo_dir, "stop") is None:
+            print("No daemon is running.")
+        else:
+            print("Daemon stopped.")
+        return
+    if not inotify.is_available():
+        print("Error: The daemon needs inotify, which is only available on Linux.")
+        exit(1)
+    if query_daemon(repo_dir, "ping") is not None:
+        print("A daemon is already running for this repository.")
+        return
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Left behind by a daemon that did not exit cleanly
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    # Only the user may connect, whatever the umask
+    os.chmod(socket_path, 0o600)
+    server.listen()
+    print(f"Daemon listening on {socket_path}")
+    sys.stdout.flush()
+    if getattr(args, "detach", False):
+        _detach()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        Daemon(repo_dir).serve(server)
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+The client side of the daemon (see `src/daemon.py`): where its socket is and how to query
+it. Kept apart from the server so that `pit status` does not load the inotify bindings and
+the event loop just to ask a question.
+
+The socket is `.pit/daemon.sock`, or, when that path is too long for a Unix socket, a
+socket in a directory only the user can enter (`$XDG_RUNTIME_DIR/pit-<uid>`, or
+`pit-<uid>` in the temporary directory). A daemon is only trusted if its socket belongs to
+the user and, where the system reports it, the process listening on it runs as the user,
+so another local user cannot answer in its place.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import stat
+import struct
+import tempfile
+
+from src.constants import PIT_DIR
+
+# Unix socket paths are limited to about 108 bytes
+MAX_SOCKET_PATH = 100
+# Seconds a command waits for the daemon before falling back
+QUERY_TIMEOUT = 5
+# struct ucred: pid, uid, gid
+_PEER_CREDENTIALS = struct.Struct("3i")
+
+
+def _is_own(st):
+    """Check whether a file belongs to the current user."""
+    return st.st_uid == os.getuid()
+
+
+def _private_dir():
+    """
+    Return a directory for sockets that only the current user can enter, creating it.
+
+    Raises:
+        PermissionError: If the directory exists but someone else could use it.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    path = os.path.join(base, f"pit-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or not _is_own(st) or st.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory of the current user")
+    return path
+
+
+def get_socket_path(repo_dir):
+    """
+    Return the path of the daemon socket of a repository.
+
+    Raises:
+        PermissionError: If the path is too long for `.pit` and the private directory the
+            socket goes to instead is not private.
+    """
+    path = os.path.join(repo_dir, PIT_DIR, "daemon.sock")
+    if len(path) <= MAX_SOCKET_PATH:
+        return path
+    digest = hashlib.sha1(os.path.abspath(repo_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(_private_dir(), f"{digest}.sock")
+
+
+def _peer_is_own(client):
+    """Check that the process at the other end of a socket runs as the current user."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True  # Not reported on this system; the socket owner was checked
+    credentials = client.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, _PEER_CREDENTIALS.size
+    )
+    _, uid, _ = _PEER_CREDENTIALS.unpack(credentials)
+    return uid == os.getuid()
+
+
+def query_daemon(repo_dir, command):
+    """
+    Send a query to the daemon of a repository.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        command (str): The query, e.g. "status".
+
+    Returns:
+        dict: The answer of the daemon, or None if no daemon of the current user is running.
+    """
+    try:
+        socket_path = get_socket_path(repo_dir)
+        if not _is_own(os.stat(socket_path)):
+            return None
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(QUERY_TIMEOUT)
+            client.connect(socket_path)
+            if not _peer_is_own(client):
+                return None
+            client.sendall(json.dumps({"command": command}).encode("utf-8") + b"\n")
+            data = b""
+            while chunk := client.recv(65536):
+                data += chunk
+        return json.loads(data)
+    except (OSError, ValueError):
+        return None
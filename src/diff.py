@@ -1,53 +1,199 @@
 #!/usr/bin/env python3
+"""
+Shows the changes between commits, or between a commit and the working tree (`pit diff`).
+
+    pit diff                    latest commit -> working tree
+    pit diff <commit>           commit -> working tree
+    pit diff <commit> <commit>  commit -> commit
+
+Revisions are branch names, `HEAD` or full commit hashes.
+
+The files to compare are found without reading any content: commits are compared tree by
+tree, skipping subtrees with equal hashes, and the working tree through the index, whose
+stat data tells which files changed. Only the files that differ are read, once each, and
+files that look binary are reported without a line diff. `--name-only` reads no content at
+all, and files whose hashes turn out equal are skipped.
+"""
 
-import difflib
 import os
+import sys
+
+from src.linediff import count_changes, is_binary, unified_diff
+from src.objects import read_object
+from src.repository import Repository
+from src.tree import diff_trees, file_mode, nest_index
+from src.utils import compute_file_hash
+from src.worktree import DELETED, MODIFIED, scan_worktree
+
+# Width of the bar of `--stat`
+STAT_WIDTH = 50
+
+
+def _tree_of(repo, name):
+    """Return the tree hash of a revision, exiting if it does not resolve to a commit."""
+    commit_hash = repo.resolve(name)
+    if commit_hash is None:
+        print(f"Error: Unknown revision {name}")
+        exit(1)
+    return repo.commit(commit_hash).tree
+
+
+def worktree_changes(repo, old_tree):
+    """
+    Yield the files that differ between a tree and the working tree.
+
+    The tree is compared with the index first, then the working tree with the index; only
+    files whose stat data changed since they were indexed are hashed.
+
+    Args:
+        repo (Repository): The repository.
+        old_tree (str): The hash of the tree to compare with.
+
+    Yields:
+        tuple: (path, old, new) where old and new are (mode, hash) pairs or None.
+    """
+    repo_dir = repo.root
+    index = repo.index
+    changes = {
+        path: old for path, old, _ in diff_trees(repo_dir, old_tree, nest_index(index))
+    }
+    indexed = dict(index)
+
+    modified, deleted, refreshed = set(), set(), set()
+    for entry in scan_worktree(repo_dir, index, set(), refreshed=refreshed):
+        if entry.kind == MODIFIED:
+            modified.add(entry.path)
+        elif entry.kind == DELETED:
+            deleted.add(entry.path)
+    if refreshed:
+        repo.refresh_index()
+    for path in modified | deleted:
+        if path not in changes:
+            changes[path] = (file_mode(indexed[path].mode), indexed[path].hash)
+
+    for path in sorted(changes):
+        if path in deleted or path not in index:
+            new = None
+        elif path in modified:
+            abs_path = os.path.join(repo_dir, path)
+            new = (file_mode(os.stat(abs_path).st_mode), compute_file_hash(abs_path))
+        else:
+            new = (file_mode(index[path].mode), index[path].hash)
+        if changes[path] != new:
+            yield path, changes[path], new
 
 
-def show_diff(args):
-    if not os.path.exists(".pit"):
+def _read_side(repo_dir, path, side, from_worktree):
+    """Read one side of a file pair: from the working tree, the objects, or empty."""
+    if side is None:
+        return b""
+    if from_worktree:
+        with open(os.path.join(repo_dir, path), "rb") as f:
+            return f.read()
+    return read_object(repo_dir, side[1])[1]
+
+
+def _header(path, old, new):
+    lines = [f"diff --git a/{path} b/{path}"]
+    if old is None:
+        lines.append(f"new file mode {new[0]}")
+    elif new is None:
+        lines.append(f"deleted file mode {old[0]}")
+    elif old[0] != new[0]:
+        lines += [f"old mode {old[0]}", f"new mode {new[0]}"]
+    return "\n".join(lines) + "\n"
+
+
+def _stat_line(path, added, deleted, width):
+    total = added + deleted
+    scale = min(1, STAT_WIDTH / total) if total else 1
+    bar = "+" * round(added * scale) + "-" * round(deleted * scale)
+    return f" {path.ljust(width)} | {str(total).rjust(5)} {bar}"
+
+
+def show_diff(args, repo=None):
+    """
+    Show the changes between two commits, or a commit and the working tree.
+
+    Args:
+        args: Command-line arguments with `revisions` (zero, one or two), `stat`,
+            `name_only` and `diff_algorithm`.
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory.
+    """
+    repo = repo or Repository.discover()
+    if not repo:
         print("Not a repository.")
         return
+    repo_dir = repo.root
 
-    with open(".pit/HEAD", "r", encoding="utf-8") as head:
-        current_branch = head.read().strip().split(": ")[1].split("/")[-1]
+    revisions = getattr(args, "revisions", None) or []
+    algorithm = getattr(args, "diff_algorithm", None) or "myers"
+    if len(revisions) > 2:
+        print("Error: diff takes at most two revisions")
+        exit(1)
+    if not revisions and not repo.head:
+        print("No commits in the current branch.")
+        return
 
-    with open(f".pit/refs/heads/{current_branch}", "r", encoding="utf-8") as branch:
-        latest_commit_hash = branch.read().strip()
+    old_tree = _tree_of(repo, revisions[0] if revisions else "HEAD")
+    from_worktree = len(revisions) < 2
+    if from_worktree:
+        changes = worktree_changes(repo, old_tree)
+    else:
+        changes = diff_trees(repo_dir, old_tree, _tree_of(repo, revisions[1]))
 
-    if not os.path.exists(f".pit/objects/{latest_commit_hash}"):
-        print("No commits in the current branch.")
+    if getattr(args, "name_only", False):
+        for path, _, _ in changes:
+            print(path)
         return
 
-    staged_files = []
-    with open(".pit/index", "r", encoding="utf-8") as index:
-        for line in index.readlines():
-            file, _ = line.strip().split()
-            staged_files.append(file)
+    stats = []
+    out = sys.stdout
+    for path, old, new in changes:
+        if old is not None and new is not None and old[1] == new[1]:
+            # Only the mode changed, there is no content to compare
+            if not getattr(args, "stat", False):
+                out.write(_header(path, old, new))
+            stats.append((path, 0, 0, False))
+            continue
+
+        old_content = _read_side(repo_dir, path, old, False)
+        new_content = _read_side(repo_dir, path, new, from_worktree)
+        binary = is_binary(old_content) or is_binary(new_content)
+        if getattr(args, "stat", False):
+            if binary:
+                stats.append((path, 0, 0, True))
+            else:
+                added, deleted = count_changes(
+                    old_content.splitlines(True), new_content.splitlines(True), algorithm
+                )
+                stats.append((path, added, deleted, False))
+            continue
 
-    print("Comparing current working directory with latest commit:")
-    for file in staged_files:
-        if not os.path.exists(file):
-            print(f"File {file} deleted.")
+        out.write(_header(path, old, new))
+        if binary:
+            old_name = f"a/{path}" if old else "/dev/null"
+            new_name = f"b/{path}" if new else "/dev/null"
+            out.write(f"Binary files {old_name} and {new_name} differ\n")
             continue
+        out.write(f"--- {'a/' + path if old else '/dev/null'}\n")
+        out.write(f"+++ {'b/' + path if new else '/dev/null'}\n")
+        for line in unified_diff(
+            old_content.splitlines(True), new_content.splitlines(True), algorithm=algorithm
+        ):
+            out.write(line.decode("utf-8", "replace"))
 
-        with open(file, "r", encoding="utf-8") as f:
-            working_content = f.readlines()
-
-        commit_object_path = f".pit/objects/{latest_commit_hash}"
-        with open(commit_object_path, "r", encoding="utf-8") as commit:
-            for line in commit.readlines():
-                if line.startswith(file):
-                    _, file_hash = line.strip().split()
-                    object_path = f".pit/objects/{file_hash}"
-                    if os.path.exists(object_path):
-                        with open(object_path, "r", encoding="utf-8") as obj:
-                            committed_content = obj.readlines()
-
-        diff = difflib.unified_diff(
-            committed_content,
-            working_content,
-            fromfile="Committed",
-            tofile="Working Directory",
+    if getattr(args, "stat", False) and stats:
+        width = max(len(path) for path, _, _, _ in stats)
+        for path, added, deleted, binary in stats:
+            if binary:
+                print(f" {path.ljust(width)} | Bin")
+            else:
+                print(_stat_line(path, added, deleted, width))
+        insertions = sum(added for _, added, _, _ in stats)
+        deletions = sum(deleted for _, _, deleted, _ in stats)
+        print(
+            f" {len(stats)} file{'s' if len(stats) != 1 else ''} changed, "
+            f"{insertions} insertions(+), {deletions} deletions(-)"
         )
-        print("".join(diff))
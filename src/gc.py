@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Packs the objects of a repository into a single packfile (`pit gc`, also `pit repack`).
+
+All loose objects and the objects of existing packs are written into one new pack. Objects
+are sorted by type, file name and size so that similar objects end up next to each other,
+and each one is tried as a delta against the previous objects in a small sliding window.
+Once the new pack and its index are in place, the old packs and loose objects are removed.
+Loose branch refs are moved into packed-refs as well, and the filter of the loose objects
+(see `src/presence.py`) is rebuilt.
+"""
+
+import os
+from collections import deque
+
+from src.objects import (get_object_path, list_loose_objects,
+                         read_stored_object)
+from src.pack import (MAX_DELTA_DEPTH, MAX_DELTA_SIZE, create_delta,
+                      get_packs, index_delta_base, write_pack)
+from src.presence import rebuild_presence
+from src.repository import require_repo
+from src.tree import parse_tree
+
+# How many preceding objects each object is tried as a delta against
+DELTA_WINDOW = 10
+# Objects smaller than this are not worth deltifying
+MIN_DELTA_SIZE = 64
+
+
+def _name_hints(repo_dir, object_types):
+    """Map blob and tree hashes to a name they were committed as."""
+    hints = {}
+    for object_hash, obj_type in object_types.items():
+        if obj_type == "tree":
+            _, content = read_stored_object(repo_dir, object_hash)
+            for entry in parse_tree(content):
+                hints.setdefault(entry.hash, entry.name)
+            continue
+        if obj_type != "commit":
+            continue
+        # Commits from older versions of pit list their files inline
+        _, content = read_stored_object(repo_dir, object_hash)
+        for line in content.decode("utf-8", "replace").splitlines():
+            parts = line.rsplit(" ", 1)
+            if len(parts) == 2 and parts[1] in object_types:
+                hints.setdefault(parts[1], os.path.basename(parts[0]))
+    return hints
+
+
+def _pack_records(repo_dir, ordered):
+    """
+    Yield the pack records of the ordered objects, deltifying them against a sliding window.
+
+    Only the objects of the window are held in memory.
+    """
+    window = deque(maxlen=DELTA_WINDOW)
+    depths = {}
+    for object_hash, obj_type in ordered:
+        _, content = read_stored_object(repo_dir, object_hash)
+        best_delta = best_base = None
+        if MIN_DELTA_SIZE <= len(content) <= MAX_DELTA_SIZE:
+            max_size = len(content) // 2
+            for candidate in reversed(window):
+                base_hash, base_type, base_content, base_index = candidate
+                if base_type != obj_type or depths[base_hash] >= MAX_DELTA_DEPTH:
+                    continue
+                if base_index[0] is None:
+                    base_index[0] = index_delta_base(base_content)
+                delta = create_delta(base_content, content, base_index[0], max_size)
+                if delta is not None:
+                    best_delta, best_base, max_size = delta, base_hash, len(delta) - 1
+
+        depths[object_hash] = depths[best_base] + 1 if best_base else 0
+        if best_base:
+            yield object_hash, obj_type, best_delta, best_base
+        else:
+            yield object_hash, obj_type, content, None
+        if len(content) <= MAX_DELTA_SIZE:
+            window.append((object_hash, obj_type, content, [None]))
+
+
+def gc(args, repo=None):
+    """
+    Pack all loose and packed objects of the repository into a single new packfile.
+
+    Args:
+        args: Command-line arguments (not used here, but required for CLI framework).
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory.
+    """
+    repo = repo or require_repo()
+    repo_dir = repo.root
+    repo.update_refs({})
+
+    old_packs = get_packs(repo_dir)
+    loose_hashes = list(list_loose_objects(repo_dir))
+    object_hashes = set(loose_hashes)
+    for pack in old_packs:
+        object_hashes.update(pack.hashes())
+    if not object_hashes:
+        print("Nothing to pack.")
+        return
+
+    # First pass: learn the type and size of every object to order them
+    object_types, object_sizes = {}, {}
+    for object_hash in object_hashes:
+        obj_type, content = read_stored_object(repo_dir, object_hash)
+        object_types[object_hash] = obj_type
+        object_sizes[object_hash] = len(content)
+    hints = _name_hints(repo_dir, object_types)
+    ordered = sorted(
+        object_types.items(),
+        key=lambda item: (item[1], hints.get(item[0], ""), -object_sizes[item[0]], item[0]),
+    )
+
+    # Second pass: stream the objects into the pack, deltas included
+    deltas = 0
+
+    def records():
+        nonlocal deltas
+        for record in _pack_records(repo_dir, ordered):
+            deltas += record[3] is not None
+            yield record
+
+    pack_path = write_pack(repo_dir, records(), len(ordered))
+
+    # The new pack holds everything, drop what it replaces
+    for pack in old_packs:
+        if pack.pack_path != pack_path:
+            os.remove(pack.index_path)
+            os.remove(pack.pack_path)
+    for object_hash in loose_hashes:
+        object_path = get_object_path(repo_dir, object_hash)
+        os.remove(object_path)
+        try:
+            os.rmdir(os.path.dirname(object_path))
+        except OSError:
+            pass
+    rebuild_presence(repo_dir)
+
+    print(
+        f"Packed {len(ordered)} objects ({deltas} as deltas) into {os.path.basename(pack_path)}"
+    )
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+A `.pitignore` engine with gitignore-style pattern matching.
+
+Supported syntax:
+- `*`, `?` and `[...]` globs, which never match a `/`
+- `**/` (any leading directories), `/**` (everything inside) and `/**/` (zero or more directories)
+- `!pattern` to re-include a path excluded by an earlier pattern
+- a trailing `/` to only match directories
+- a leading or inner `/` to anchor the pattern to the directory of its `.pitignore`
+- `#` comments, and `\\#` / `\\!` to match those characters literally
+
+Every directory may hold its own `.pitignore`; its patterns are relative to that directory
+and take precedence over those of its parents. Within a file the last matching pattern wins.
+
+Each `.pitignore` is compiled into two combined regexes (one for files, one for directories)
+whose alternatives are ordered last-pattern-first, so a single `fullmatch` finds the winning
+pattern. Compiled files are cached per process and only recompiled when they change on disk.
+"""
+
+import os
+import re
+from collections import namedtuple
+
+from src import trace
+
+IGNORE_FILE = ".pitignore"
+
+IgnoreRules = namedtuple("IgnoreRules", ["base", "file_regex", "dir_regex", "negated"])
+
+_cache = {}
+
+
+def translate_pattern(pattern):
+    """
+    Translate a single gitignore-style glob into a regular expression.
+
+    Args:
+        pattern (str): The glob, without its `!` prefix or trailing `/`.
+
+    Returns:
+        str: A regex matching paths relative to the directory of the `.pitignore`.
+    """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = [] if anchored else ["(?:.*/)?"]
+    i, n = 0, len(pattern)
+    while i < n:
+        at_segment_start = i == 0 or pattern[i - 1] == "/"
+        if pattern.startswith("**/", i) and at_segment_start:
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and at_segment_start and i + 2 == n:
+            regex.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1 : end]
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            regex.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            regex.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(regex)
+
+
+def compile_rules(base, lines):
+    """
+    Compile the lines of a `.pitignore` into combined matchers.
+
+    Args:
+        base (str): The directory holding the `.pitignore`, relative to the repository root.
+        lines (list): The lines of the file.
+
+    Returns:
+        IgnoreRules: The compiled rules, or None if the file holds no patterns.
+    """
+    file_alternatives, dir_alternatives, negated = [], [], []
+    for line in lines:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            continue
+        is_negated = line.startswith("!")
+        if is_negated or line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+
+        group = f"(?P<p{len(negated)}>{translate_pattern(line)})"
+        negated.append(is_negated)
+        dir_alternatives.append(group)
+        if not dir_only:
+            file_alternatives.append(group)
+
+    if not negated:
+        return None
+
+    # Last pattern first: the first alternative to match is the one that wins
+    def combine(alternatives):
+        if not alternatives:
+            return None
+        return re.compile("|".join(reversed(alternatives)))
+
+    return IgnoreRules(base, combine(file_alternatives), combine(dir_alternatives), negated)
+
+
+def load_rules(repo_dir, rel_dir):
+    """
+    Load the compiled rules of the `.pitignore` in a directory, using the process-wide cache.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        rel_dir (str): The directory to load the rules of, relative to the repository root.
+
+    Returns:
+        IgnoreRules: The compiled rules, or None if the directory has no `.pitignore`.
+    """
+    ignore_path = os.path.join(repo_dir, rel_dir, IGNORE_FILE)
+    try:
+        st = os.stat(ignore_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(ignore_path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    with trace.span("ignore.parse", path=ignore_path):
+        with open(ignore_path, "r", encoding="utf-8") as f:
+            rules = compile_rules(rel_dir, f.readlines())
+    _cache[ignore_path] = (key, rules)
+    return rules
+
+
+def extend_rules(chain, rules):
+    """Return the rule chain of a sub directory given its parent's chain and its own rules."""
+    return chain + (rules,) if rules else chain
+
+
+def match_rules(chain, rel_path, is_dir):
+    """
+    Decide whether a path is ignored by a chain of rules.
+
+    Args:
+        chain (tuple): The IgnoreRules of the path's ancestors, outermost first.
+        rel_path (str): The path relative to the repository root.
+        is_dir (bool): Whether the path is a directory.
+
+    Returns:
+        bool: True if the path is ignored.
+    """
+    for rules in reversed(chain):
+        regex = rules.dir_regex if is_dir else rules.file_regex
+        if regex is None:
+            continue
+        relative = rel_path[len(rules.base) + 1 :] if rules.base else rel_path
+        match = regex.fullmatch(relative)
+        if match:
+            return not rules.negated[int(match.lastgroup[1:])]
+    return False
+
+
+def ancestor_rules(repo_dir, rel_path):
+    """
+    Build the rule chain that applies to the entries of a path's parent directory.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        rel_path (str): The path relative to the repository root, with `/` separators.
+
+    Returns:
+        tuple: The IgnoreRules of every ancestor directory of the path, outermost first.
+    """
+    parts = rel_path.split("/") if rel_path else []
+    chain = extend_rules((), load_rules(repo_dir, ""))
+    for depth in range(1, len(parts)):
+        chain = extend_rules(chain, load_rules(repo_dir, "/".join(parts[:depth])))
+    return chain
+
+
+def is_ignored(repo_dir, rel_path, is_dir=False):
+    """
+    Check whether a single path is ignored, including by an ignored parent directory.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        rel_path (str): The path relative to the repository root, with `/` separators.
+        is_dir (bool): Whether the path is a directory.
+
+    Returns:
+        bool: True if the path or any of its parent directories is ignored.
+    """
+    parts = rel_path.split("/")
+    chain = extend_rules((), load_rules(repo_dir, ""))
+    for depth in range(1, len(parts)):
+        parent = "/".join(parts[:depth])
+        if match_rules(chain, parent, True):
+            return True
+        chain = extend_rules(chain, load_rules(repo_dir, parent))
+    return match_rules(chain, rel_path, is_dir)
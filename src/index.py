@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+A module for reading and writing the pit index (`.pit/index`).
+
+The index records every tracked file together with the hash of its staged content and
+the stat data (size, mtime, ctime, inode and mode) the file had when it was hashed.
+Commands compare that stat data against a fresh `os.stat` and only rehash files whose
+stat data changed.
+
+Binary layout (all integers are big-endian):
+- header: signature `PIDX`, format version (uint32), entry count (uint32)
+- entries, sorted by path: ctime_ns, mtime_ns, inode (uint64), mode (uint32),
+  size (uint64), SHA-1 (20 raw bytes), path length (uint16), UTF-8 path
+- extensions: a 4-byte signature, a length (uint32) and that many bytes of data
+- trailer: SHA-1 of everything above, used to detect a torn or corrupt index
+
+The `TREE` extension caches the tree object hash of every directory whose content has not
+changed since its tree was last written (see `src/tree.py`): hash (20 raw bytes), path
+length (uint16), UTF-8 path, with the root directory stored as the empty path.
+
+Indexes written by older versions of pit (one `path hash` text line per file) are still
+read; their entries carry no stat data, so they are rehashed once and rewritten.
+"""
+
+import bisect
+import hashlib
+import os
+import struct
+from collections import namedtuple
+
+from src import trace
+from src.constants import CORRUPT_INDEX_MESSAGE, PIT_DIR
+from src.lockfile import LockFile
+
+INDEX_SIGNATURE = b"PIDX"
+INDEX_VERSION = 1
+
+_HEADER = struct.Struct(">4sII")
+_ENTRY = struct.Struct(">QQQIQ20sH")
+_EXTENSION = struct.Struct(">4sI")
+_TREE_ENTRY = struct.Struct(">20sH")
+_CHECKSUM_SIZE = hashlib.sha1().digest_size
+TREE_EXTENSION = b"TREE"
+
+IndexEntry = namedtuple(
+    "IndexEntry", ["path", "hash", "mode", "size", "mtime_ns", "ctime_ns", "ino"]
+)
+
+
+class Index(dict):
+    """
+    The index entries, a mapping of relative path to IndexEntry, plus the cached tree hash
+    of every directory whose content is unchanged since its tree was written.
+
+    Adding, replacing or removing an entry drops the cached trees of all its parent
+    directories, unless only its stat data changed.
+
+    The sorted list of paths is kept alongside the mapping: an index read from disk is
+    already in path order, paths added in order are appended, and the list is only sorted
+    again after paths were added out of order or removed. Writing the index and finding the
+    paths under a directory (`paths_under`) then take no more than a pass over the list.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_tree = {}
+        self._paths = None if self else []
+
+    def invalidate(self, path):
+        """Drop the cached tree of every directory containing the path."""
+        if not self.cache_tree:
+            return
+        parent = path
+        while parent:
+            parent = parent.rpartition("/")[0]
+            self.cache_tree.pop(parent, None)
+
+    def __setitem__(self, path, entry):
+        previous = self.get(path)
+        if previous is None:
+            paths = self._paths
+            if paths is not None and (not paths or path > paths[-1]):
+                paths.append(path)
+            else:
+                self._paths = None
+        if previous is None or (previous.hash, previous.mode) != (entry.hash, entry.mode):
+            self.invalidate(path)
+        super().__setitem__(path, entry)
+
+    def __delitem__(self, path):
+        self.invalidate(path)
+        super().__delitem__(path)
+        self._paths = None
+
+    def pop(self, path, *default):
+        if path in self:
+            entry = self[path]
+            del self[path]
+            return entry
+        return super().pop(path, *default)
+
+    def update(self, *args, **kwargs):
+        for path, entry in dict(*args, **kwargs).items():
+            self[path] = entry
+
+    def sorted_paths(self):
+        """Return the paths of the index in sorted order. The list must not be modified."""
+        if self._paths is None:
+            self._paths = sorted(self)
+        return self._paths
+
+    def paths_under(self, prefix):
+        """
+        Return the sorted paths inside a directory, found by binary search.
+
+        Args:
+            prefix (str): A relative directory, "" for the whole index.
+        """
+        paths = self.sorted_paths()
+        if not prefix:
+            return list(paths)
+        # "/" sorts right before "0", so the paths of the directory are contiguous
+        start = bisect.bisect_left(paths, prefix + "/")
+        return paths[start : bisect.bisect_left(paths, prefix + "0", start)]
+
+
+def get_index_path(repo_dir):
+    """Return the absolute path of the index file for the given repository."""
+    return os.path.join(repo_dir, PIT_DIR, "index")
+
+
+def make_entry(path, file_hash, st):
+    """
+    Build an index entry for a file from its hash and `os.stat` result.
+
+    Args:
+        path (str): The path of the file relative to the repository root.
+        file_hash (str): The hex SHA-1 of the file content.
+        st (os.stat_result): The stat data of the file at the time it was hashed.
+
+    Returns:
+        IndexEntry: The new index entry.
+    """
+    return IndexEntry(
+        path, file_hash, st.st_mode, st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino
+    )
+
+
+def stat_matches(entry, st, index_mtime_ns=None):
+    """
+    Check whether a file's current stat data still matches its index entry.
+
+    An entry whose mtime is not older than the index file itself is "racily clean": the file
+    may have been modified within the same timestamp tick it was hashed in, so it is treated
+    as changed and rehashed.
+
+    Args:
+        entry (IndexEntry): The entry recorded in the index.
+        st (os.stat_result): The current stat data of the file.
+        index_mtime_ns (int): The mtime of the index file, if known.
+
+    Returns:
+        bool: True if the file can be assumed unchanged without reading it.
+    """
+    if index_mtime_ns is not None and entry.mtime_ns >= index_mtime_ns:
+        return False
+    return (
+        entry.size == st.st_size
+        and entry.mtime_ns == st.st_mtime_ns
+        and entry.ctime_ns == st.st_ctime_ns
+        and entry.ino == st.st_ino
+        and entry.mode == st.st_mode
+    )
+
+
+def get_index_mtime_ns(repo_dir):
+    """Return the mtime of the index file in nanoseconds, or None if there is no index."""
+    try:
+        return os.stat(get_index_path(repo_dir)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _corrupt_index():
+    print(CORRUPT_INDEX_MESSAGE)
+    exit(1)
+
+
+def _parse_legacy_index(data):
+    """Parse the old text index format: one `path hash` line per file."""
+    entries = Index()
+    for line in data.decode("utf-8").splitlines():
+        parts = line.strip().rsplit(" ", 1)
+        if len(parts) == 2:
+            path, file_hash = parts
+            dict.__setitem__(entries, path, IndexEntry(path, file_hash, 0, 0, 0, 0, 0))
+    return entries
+
+
+def parse_index(data):
+    """
+    Parse the raw bytes of an index file.
+
+    Args:
+        data (bytes): The content of `.pit/index`.
+
+    Returns:
+        Index: A mapping of relative path to IndexEntry.
+    """
+    if not data:
+        return Index()
+    if not data.startswith(INDEX_SIGNATURE):
+        return _parse_legacy_index(data)
+
+    body, checksum = data[:-_CHECKSUM_SIZE], data[-_CHECKSUM_SIZE:]
+    if len(body) < _HEADER.size or hashlib.sha1(body).digest() != checksum:
+        _corrupt_index()
+
+    _, version, count = _HEADER.unpack_from(body, 0)
+    if version != INDEX_VERSION:
+        _corrupt_index()
+
+    entries = Index()
+    offset = _HEADER.size
+    for _ in range(count):
+        ctime_ns, mtime_ns, ino, mode, size, raw_hash, path_len = _ENTRY.unpack_from(
+            body, offset
+        )
+        offset += _ENTRY.size
+        path = body[offset : offset + path_len].decode("utf-8")
+        offset += path_len
+        entry = IndexEntry(path, raw_hash.hex(), mode, size, mtime_ns, ctime_ns, ino)
+        dict.__setitem__(entries, path, entry)
+    # Entries are written in path order
+    entries._paths = list(entries)
+
+    while offset < len(body):
+        signature, length = _EXTENSION.unpack_from(body, offset)
+        offset += _EXTENSION.size
+        if signature == TREE_EXTENSION:
+            entries.cache_tree = _parse_cache_tree(body[offset : offset + length])
+        offset += length
+    return entries
+
+
+def _parse_cache_tree(data):
+    cache_tree = {}
+    offset = 0
+    while offset < len(data):
+        raw_hash, path_len = _TREE_ENTRY.unpack_from(data, offset)
+        offset += _TREE_ENTRY.size
+        cache_tree[data[offset : offset + path_len].decode("utf-8")] = raw_hash.hex()
+        offset += path_len
+    return cache_tree
+
+
+@trace.traced("index.read")
+def read_index(repo_dir):
+    """
+    Read the index of the given repository.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+
+    Returns:
+        Index: A mapping of relative path to IndexEntry. Empty if there is no index.
+    """
+    try:
+        with open(get_index_path(repo_dir), "rb") as f:
+            return parse_index(f.read())
+    except FileNotFoundError:
+        return Index()
+
+
+def serialize_index(entries):
+    """
+    Serialize index entries into the binary index format.
+
+    Args:
+        entries (dict): A mapping of relative path to IndexEntry. The cached trees of an
+            Index are written too.
+
+    Returns:
+        bytes: The content to be written to `.pit/index`.
+    """
+    parts = [_HEADER.pack(INDEX_SIGNATURE, INDEX_VERSION, len(entries))]
+    paths = entries.sorted_paths() if isinstance(entries, Index) else sorted(entries)
+    for path in paths:
+        entry = entries[path]
+        encoded_path = path.encode("utf-8")
+        parts.append(
+            _ENTRY.pack(
+                entry.ctime_ns,
+                entry.mtime_ns,
+                entry.ino,
+                entry.mode,
+                entry.size,
+                bytes.fromhex(entry.hash),
+                len(encoded_path),
+            )
+        )
+        parts.append(encoded_path)
+
+    cache_tree = getattr(entries, "cache_tree", None)
+    if cache_tree:
+        tree_parts = []
+        for path in sorted(cache_tree):
+            encoded_path = path.encode("utf-8")
+            raw_hash = bytes.fromhex(cache_tree[path])
+            tree_parts.append(_TREE_ENTRY.pack(raw_hash, len(encoded_path)))
+            tree_parts.append(encoded_path)
+        tree_data = b"".join(tree_parts)
+        parts.append(_EXTENSION.pack(TREE_EXTENSION, len(tree_data)))
+        parts.append(tree_data)
+    body = b"".join(parts)
+    return body + hashlib.sha1(body).digest()
+
+
+@trace.traced("index.write")
+def write_index(repo_dir, entries, lock=None):
+    """
+    Write the given entries to the index of the repository, replacing its content.
+
+    The index is written to `index.lock` and renamed into place, so it is never seen half
+    written.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        entries (dict): A mapping of relative path to IndexEntry.
+        lock (LockFile): The index lock, if the caller already holds it. It is released.
+    """
+    with lock or LockFile(get_index_path(repo_dir)) as index_lock:
+        index_lock.write(serialize_index(entries))
+        index_lock.commit()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Line diff algorithms and unified diff output.
+
+Lines are interned to integers first, so comparing two lines is a single integer
+comparison whatever their length. Lines that only occur on one side are left out of the
+search since they can never match, and the common prefix and suffix of every sub-problem
+are matched before any search starts.
+
+Two algorithms are available:
+- "myers": Myers' O(ND) algorithm in its linear-space form. The middle snake of the edit
+  path is found by searching forward and backward at once, and the two halves are diffed
+  on their own. When the edit distance of a sub-problem gets very large the search is cut
+  short and split at the furthest point reached, trading a minimal diff for bounded time.
+- "patience": lines that occur exactly once on both sides are matched first, in the
+  longest run that keeps their order; the gaps between them are diffed with Myers. It
+  often gives more readable diffs of reordered code.
+
+Both return matching blocks in the format of `difflib.SequenceMatcher.get_matching_blocks`.
+"""
+
+from bisect import bisect_left
+
+from src import trace
+
+ALGORITHMS = ("myers", "patience")
+
+# Only the start of a file is checked for NUL bytes, as git does
+BINARY_CHECK_SIZE = 8000
+# Edit distance searched in a sub-problem before it is split heuristically
+MIN_SEARCH_COST = 256
+
+
+def is_binary(data):
+    """Check whether content looks binary: it has a NUL byte near its start."""
+    return b"\0" in data[:BINARY_CHECK_SIZE]
+
+
+def _intern(a, b):
+    ids = {}
+    return (
+        [ids.setdefault(line, len(ids)) for line in a],
+        [ids.setdefault(line, len(ids)) for line in b],
+    )
+
+
+def _trim(a, b, a_lo, a_hi, b_lo, b_hi, blocks):
+    """Match the common prefix and suffix of a sub-problem, return what is left of it."""
+    start = a_lo
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        a_lo += 1
+        b_lo += 1
+    if a_lo > start:
+        blocks.append((start, b_lo - (a_lo - start), a_lo - start))
+    end = a_hi
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+    if a_hi < end:
+        blocks.append((a_hi, b_hi, end - a_hi))
+    return a_lo, a_hi, b_lo, b_hi
+
+
+def _run(a, i, b, j, limit):
+    """Return how many lines a[i:] and b[j:] have in common, up to limit, by galloping."""
+    run, step = 0, 1
+    while run < limit:
+        size = min(step, limit - run)
+        if a[i + run : i + run + size] == b[j + run : j + run + size]:
+            run += size
+            step *= 2
+        elif size == 1:
+            break
+        else:
+            step = size // 2
+    return run
+
+
+def _run_back(a, i, b, j, limit):
+    """Return how many lines a[:i] and b[:j] have in common at their ends, up to limit."""
+    run, step = 0, 1
+    while run < limit:
+        size = min(step, limit - run)
+        if a[i - run - size : i - run] == b[j - run - size : j - run]:
+            run += size
+            step *= 2
+        elif size == 1:
+            break
+        else:
+            step = size // 2
+    return run
+
+
+def _middle_snake(a, b, a_lo, a_hi, b_lo, b_hi, max_cost):
+    """
+    Find the middle snake of the shortest edit path of a[a_lo:a_hi] and b[b_lo:b_hi].
+
+    The ranges must be non-empty and differ in their first and last lines.
+
+    Returns:
+        tuple: The start and end of the snake, (x, y, u, v), relative to the ranges.
+    """
+    n, m = a_hi - a_lo, b_hi - b_lo
+    delta = n - m
+    odd = delta & 1
+    max_d = min((n + m + 1) // 2, max_cost)
+    offset = max_d + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            if x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                run = _run(a, a_lo + x + 1, b, b_lo + y + 1, min(n - x, m - y) - 1) + 1
+                x += run
+                y += run
+            forward[offset + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1:
+                if x + backward[offset + delta - k] >= n:
+                    return start_x, start_y, x, y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            if x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                run = _run_back(a, a_hi - 1 - x, b, b_hi - 1 - y, min(n - x, m - y) - 1) + 1
+                x += run
+                y += run
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d:
+                if x + forward[offset + delta - k] >= n:
+                    return n - x, m - y, n - start_x, m - start_y
+
+        if d >= max_cost:
+            # Too expensive: split at the forward point that got furthest along
+            best_x, best_y = n // 2, m // 2
+            for k in range(-d, d + 1, 2):
+                x = forward[offset + k]
+                y = x - k
+                if 0 <= y <= m and x + y > best_x + best_y and (x, y) != (n, m):
+                    best_x, best_y = x, y
+            return best_x, best_y, best_x, best_y
+    raise AssertionError("No middle snake found")
+
+
+def _myers(a, b, a_lo, a_hi, b_lo, b_hi, blocks):
+    """Append the matching blocks of a[a_lo:a_hi] and b[b_lo:b_hi] found with Myers."""
+    pending = [(a_lo, a_hi, b_lo, b_hi)]
+    while pending:
+        a_lo, a_hi, b_lo, b_hi = _trim(a, b, *pending.pop(), blocks)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        max_cost = max(MIN_SEARCH_COST, int((a_hi - a_lo + b_hi - b_lo) ** 0.5))
+        x, y, u, v = _middle_snake(a, b, a_lo, a_hi, b_lo, b_hi, max_cost)
+        if u > x:
+            blocks.append((a_lo + x, b_lo + y, u - x))
+        pending.append((a_lo, a_lo + x, b_lo, b_lo + y))
+        pending.append((a_lo + u, a_hi, b_lo + v, b_hi))
+
+
+def _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    """Return the longest ordered run of (i, j) pairs of lines unique on both sides."""
+    # line -> [position in a, position in b], -1 once the line is seen twice on a side
+    positions = {}
+    for i in range(a_lo, a_hi):
+        entry = positions.get(a[i])
+        positions[a[i]] = [i, None] if entry is None else [-1, None]
+    for j in range(b_lo, b_hi):
+        entry = positions.get(b[j])
+        if entry is not None and entry[0] != -1:
+            entry[1] = j if entry[1] is None else -1
+    pairs = sorted(
+        (i, j) for i, j in positions.values() if i != -1 and j is not None and j != -1
+    )
+
+    # Longest increasing subsequence of the b positions (patience sorting)
+    tops, top_values, links = [], [], []
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect_left(top_values, j)
+        links.append(tops[pile - 1] if pile else -1)
+        if pile == len(tops):
+            tops.append(index)
+            top_values.append(j)
+        else:
+            tops[pile] = index
+            top_values[pile] = j
+    anchors = []
+    index = tops[-1] if tops else -1
+    while index != -1:
+        anchors.append(pairs[index])
+        index = links[index]
+    return anchors[::-1]
+
+
+def _patience(a, b, a_lo, a_hi, b_lo, b_hi, blocks):
+    """Append the matching blocks of a[a_lo:a_hi] and b[b_lo:b_hi] found with patience."""
+    pending = [(a_lo, a_hi, b_lo, b_hi)]
+    while pending:
+        a_lo, a_hi, b_lo, b_hi = _trim(a, b, *pending.pop(), blocks)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if not anchors:
+            _myers(a, b, a_lo, a_hi, b_lo, b_hi, blocks)
+            continue
+        for i, j in anchors:
+            blocks.append((i, j, 1))
+            pending.append((a_lo, i, b_lo, j))
+            a_lo, b_lo = i + 1, j + 1
+        pending.append((a_lo, a_hi, b_lo, b_hi))
+
+
+def _kept_positions(ids, other_ids):
+    return [position for position, line in enumerate(ids) if line in other_ids]
+
+
+@trace.traced("diff.lines")
+def diff_blocks(a, b, algorithm="myers"):
+    """
+    Find the matching blocks of two sequences of lines.
+
+    Args:
+        a (list): The old lines.
+        b (list): The new lines.
+        algorithm (str): "myers" or "patience".
+
+    Returns:
+        list: (i, j, n) triples meaning a[i:i+n] == b[j:j+n], in increasing order,
+            followed by a final (len(a), len(b), 0).
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown diff algorithm {algorithm}")
+    a_ids, b_ids = _intern(a, b)
+    # Lines found on one side only can never match: diff without them, as git does
+    a_kept = _kept_positions(a_ids, set(b_ids))
+    b_kept = _kept_positions(b_ids, set(a_ids))
+    a_ids = [a_ids[i] for i in a_kept]
+    b_ids = [b_ids[j] for j in b_kept]
+
+    kept_blocks = []
+    diff = _patience if algorithm == "patience" else _myers
+    diff(a_ids, b_ids, 0, len(a_ids), 0, len(b_ids), kept_blocks)
+
+    # Map the blocks back to the original positions, splitting them where lines were left out
+    blocks = []
+    for i, j, n in kept_blocks:
+        start = 0
+        for t in range(1, n + 1):
+            if (
+                t == n
+                or a_kept[i + t] != a_kept[i + t - 1] + 1
+                or b_kept[j + t] != b_kept[j + t - 1] + 1
+            ):
+                blocks.append((a_kept[i + start], b_kept[j + start], t - start))
+                start = t
+
+    merged = []
+    for i, j, n in sorted(blocks):
+        if not n:
+            continue
+        if merged:
+            last_i, last_j, last_n = merged[-1]
+            if last_i + last_n == i and last_j + last_n == j:
+                merged[-1] = (last_i, last_j, last_n + n)
+                continue
+        merged.append((i, j, n))
+    merged.append((len(a), len(b), 0))
+    return merged
+
+
+def count_changes(a, b, algorithm="myers"):
+    """Return the number of (inserted, deleted) lines between two sequences of lines."""
+    matched = sum(n for _, _, n in diff_blocks(a, b, algorithm))
+    return len(b) - matched, len(a) - matched
+
+
+def _hunks(blocks, context):
+    """Group the changes between matching blocks into hunks with context lines."""
+    hunks = []
+    i = j = 0
+    for block_i, block_j, size in blocks:
+        if block_i > i or block_j > j:
+            change = (i, block_i, j, block_j)
+            if hunks and i - hunks[-1][-1][1] <= 2 * context:
+                hunks[-1].append(change)
+            else:
+                hunks.append([change])
+        i, j = block_i + size, block_j + size
+    return hunks
+
+
+def _format_range(start, stop):
+    length = stop - start
+    if length == 1:
+        return f"{start + 1}"
+    return f"{start + 1 if length else start},{length}"
+
+
+def _diff_line(prefix, line):
+    if line.endswith(b"\n"):
+        return prefix + line
+    return prefix + line + b"\n\\ No newline at end of file\n"
+
+
+def unified_diff(a, b, context=3, algorithm="myers"):
+    """
+    Yield the hunks of a unified diff between two sequences of lines.
+
+    Args:
+        a (list): The old lines, as bytes with their line endings.
+        b (list): The new lines.
+        context (int): The number of unchanged lines shown around each change.
+        algorithm (str): "myers" or "patience".
+
+    Yields:
+        bytes: The lines of the diff, starting with a `@@` header for each hunk.
+    """
+    for hunk in _hunks(diff_blocks(a, b, algorithm), context):
+        a_start = max(hunk[0][0] - context, 0)
+        b_start = max(hunk[0][2] - context, 0)
+        a_stop = min(hunk[-1][1] + context, len(a))
+        b_stop = min(hunk[-1][3] + context, len(b))
+        yield (
+            f"@@ -{_format_range(a_start, a_stop)} +{_format_range(b_start, b_stop)} @@\n"
+        ).encode("utf-8")
+
+        i = a_start
+        for a_lo, a_hi, b_lo, b_hi in hunk:
+            for line in a[i:a_lo]:
+                yield _diff_line(b" ", line)
+            for line in a[a_lo:a_hi]:
+                yield _diff_line(b"-", line)
+            for line in b[b_lo:b_hi]:
+                yield _diff_line(b"+", line)
+            i = a_hi
+        for line in a[i:a_stop]:
+            yield _diff_line(b" ", line)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Lock files: exclusive, crash-safe replacement of repository files.
+
+To change `.pit/index`, a ref or any other shared file, a process creates `<file>.lock`
+with O_EXCL, which fails while another process holds the lock. The new content is written
+to the lock file, flushed to disk and renamed over the original, so readers see either the
+old or the new file and never a partial one. A crash leaves the original untouched.
+
+While a lock is held elsewhere, acquiring it waits with a growing back-off, so concurrent
+pit processes queue up instead of failing. A lock left behind by a crashed process has to
+be removed by hand; the error message says which one.
+"""
+
+import os
+import time
+
+LOCK_SUFFIX = ".lock"
+# Seconds to wait for a lock held by another process
+LOCK_TIMEOUT = 10
+_MIN_BACKOFF = 0.001
+_MAX_BACKOFF = 0.1
+
+
+class LockFile:
+    """
+    The lock of one file. Use as a context manager: the lock is released on exit, and
+    whatever was written is discarded unless `commit` was called.
+    """
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.path = path
+        self.lock_path = path + LOCK_SUFFIX
+        self.timeout = timeout
+        self.fd = None
+
+    def try_acquire(self):
+        """Take the lock if it is free. Returns whether it was taken."""
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        try:
+            self.fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        return True
+
+    def acquire(self):
+        """Take the lock, waiting for the other holder; exit if it is not released in time."""
+        deadline = time.monotonic() + self.timeout
+        backoff = _MIN_BACKOFF
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                print(
+                    f"Error: Unable to lock {self.path}: {self.lock_path} exists. "
+                    "Another pit process is running, or one crashed and left the lock "
+                    "behind; remove it if no pit process is running."
+                )
+                exit(1)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, _MAX_BACKOFF)
+        return self
+
+    @property
+    def held(self):
+        return self.fd is not None
+
+    def write(self, data):
+        """Write the new content of the file, bytes or str."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+
+    def commit(self):
+        """Replace the file with what was written and release the lock."""
+        os.fsync(self.fd)
+        os.close(self.fd)
+        self.fd = None
+        os.replace(self.lock_path, self.path)
+
+    def rollback(self):
+        """Release the lock, leaving the file unchanged."""
+        if self.fd is None:
+            return
+        os.close(self.fd)
+        self.fd = None
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        if not self.held:
+            self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.rollback()
+
+
+def write_locked(path, data):
+    """Replace a file atomically while holding its lock."""
+    with LockFile(path) as lock:
+        lock.write(data)
+        lock.commit()
@@ -1,47 +1,347 @@
 #!/usr/bin/env python3
+"""
+Three-way merge of another branch into the current one (`pit merge`).
+
+The merge base is the best common ancestor of the two branch heads, found through the
+commit-graph. The base, ours and theirs trees are then compared by hash one directory at a
+time: a directory that only one side changed is taken from that side as a whole, and only
+directories changed on both sides are descended into. Blobs are only read for files changed
+on both sides, which get a line-level three-way merge, and for the files written to the
+working tree.
+
+When the current branch head is itself the merge base, the branch is fast-forwarded: the
+working tree is moved to the other head and the ref updated, without a merge commit.
+
+When every file merges cleanly the result is committed with both heads as parents. Files
+with conflicting changes are written to the working tree with conflict markers and the
+merge is left for the user to finish with `pit commit`; `.pit/MERGE_HEAD` records the
+merged branch head until then.
+"""
 
-import hashlib
 import os
+import time
 
-from src.constants import PIT_DIR
-from src.utils import (ensure_repo, get_current_branch, hash_content,
-                       split_object_hash, write_file)
+from src import trace
+from src.commit import get_author, get_merge_head_path
+from src.commit_graph import merge_base, update_commit_graph
+from src.linediff import diff_blocks
+from src.lockfile import write_locked
+from src.objects import format_commit, read_object, write_object
+from src.repository import require_repo
+from src.tree import TREE_MODE, diff_trees, read_tree, write_tree
+from src.worktree import apply_changes, checkout_tree, has_local_changes
 
 
-def merge_branch(args):
-    # Ensure repo exists
-    ensure_repo()
+def merge_lines(base, ours, theirs, ours_label="ours", theirs_label="theirs"):
+    """
+    Merge two versions of a file line by line against their common base (diff3).
 
-    branch_path = f"{PIT_DIR}/refs/heads/{args.branch_name}"
-    if not os.path.exists(branch_path):
-        print(f"Branch {args.branch_name} does not exist.")
+    Regions of the base left unchanged by both sides split the files into chunks; a chunk
+    changed on one side only takes that side, identical changes are taken once, and
+    different changes to the same chunk are a conflict, written between markers.
+
+    Args:
+        base (list): The lines of the common ancestor, as bytes with their line endings.
+        ours (list): The lines of the current version.
+        theirs (list): The lines of the version being merged in.
+        ours_label (str): The name shown on the `<<<<<<<` marker.
+        theirs_label (str): The name shown on the `>>>>>>>` marker.
+
+    Returns:
+        tuple: The merged lines and the number of conflicts.
+    """
+    merged = []
+    conflicts = 0
+    base_index = ours_index = theirs_index = 0
+    regions = _sync_regions(base, ours, theirs)
+    for base_start, base_end, ours_start, ours_end, theirs_start, theirs_end in regions:
+        base_chunk = base[base_index:base_start]
+        ours_chunk = ours[ours_index:ours_start]
+        theirs_chunk = theirs[theirs_index:theirs_start]
+        if ours_chunk == theirs_chunk or theirs_chunk == base_chunk:
+            merged.extend(ours_chunk)
+        elif ours_chunk == base_chunk:
+            merged.extend(theirs_chunk)
+        else:
+            conflicts += 1
+            merged.append(f"<<<<<<< {ours_label}\n".encode("utf-8"))
+            merged.extend(_terminated(ours_chunk))
+            merged.append(b"=======\n")
+            merged.extend(_terminated(theirs_chunk))
+            merged.append(f">>>>>>> {theirs_label}\n".encode("utf-8"))
+        merged.extend(base[base_start:base_end])
+        base_index, ours_index, theirs_index = base_end, ours_end, theirs_end
+    return merged, conflicts
+
+
+def _terminated(lines):
+    """Make sure the last line ends with a newline so a conflict marker can follow it."""
+    if lines and not lines[-1].endswith(b"\n"):
+        return lines[:-1] + [lines[-1] + b"\n"]
+    return lines
+
+
+def _sync_regions(base, ours, theirs):
+    """
+    Yield the regions of the base left unchanged on both sides, in order.
+
+    Each region is (base_start, base_end, ours_start, ours_end, theirs_start, theirs_end);
+    the last one is an empty region at the end of all three files.
+    """
+    ours_blocks = diff_blocks(base, ours)
+    theirs_blocks = diff_blocks(base, theirs)
+    i = j = 0
+    while i < len(ours_blocks) and j < len(theirs_blocks):
+        ours_base, ours_match, ours_size = ours_blocks[i]
+        theirs_base, theirs_match, theirs_size = theirs_blocks[j]
+        start = max(ours_base, theirs_base)
+        end = min(ours_base + ours_size, theirs_base + theirs_size)
+        if start < end:
+            ours_start = ours_match + start - ours_base
+            theirs_start = theirs_match + start - theirs_base
+            yield (
+                start,
+                end,
+                ours_start,
+                ours_start + end - start,
+                theirs_start,
+                theirs_start + end - start,
+            )
+        if ours_base + ours_size < theirs_base + theirs_size:
+            i += 1
+        else:
+            j += 1
+    yield len(base), len(base), len(ours), len(ours), len(theirs), len(theirs)
+
+
+def _tree_entries(repo_dir, tree_hash):
+    return {entry.name: (entry.mode, entry.hash) for entry in read_tree(repo_dir, tree_hash)}
+
+
+def _is_tree(entry):
+    return entry is not None and entry[0] == TREE_MODE
+
+
+@trace.traced("merge.trees")
+def merge_trees(repo_dir, base, ours, theirs, labels=("ours", "theirs"), prefix=""):
+    """
+    Three-way merge of trees, comparing the hashes of their entries.
+
+    Subtrees with the same hash on two sides are resolved without being read.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        base (str): The tree hash of the merge base, or None.
+        ours (str): The tree hash of the current commit, or None.
+        theirs (str): The tree hash of the commit being merged, or None.
+        labels (tuple): The names of ours and theirs for conflict markers.
+        prefix (str): The path of the trees relative to the repository root.
+
+    Returns:
+        tuple: (changes, conflicts). changes maps the paths whose merged (mode, hash)
+            differs from ours to that value, or None for a deletion. conflicts maps
+            conflicting paths to a description and the content to leave in the working
+            tree (None to keep ours).
+    """
+    changes, conflicts = {}, {}
+    _merge_trees(repo_dir, base, ours, theirs, labels, prefix, changes, conflicts)
+    return changes, conflicts
+
+
+def _take_theirs(repo_dir, path, ours, theirs, changes):
+    """Record the changes turning the entry ours into theirs, at any depth."""
+    ours_tree = ours[1] if _is_tree(ours) else None
+    theirs_tree = theirs[1] if _is_tree(theirs) else None
+    for file_path, _, new in diff_trees(repo_dir, ours_tree, theirs_tree, path):
+        changes[file_path] = new
+    ours_file = ours if ours is not None and not _is_tree(ours) else None
+    theirs_file = theirs if theirs is not None and not _is_tree(theirs) else None
+    if ours_file != theirs_file:
+        changes[path] = theirs_file
+
+
+def _merge_trees(repo_dir, base, ours, theirs, labels, prefix, changes, conflicts):
+    if ours == theirs or base == theirs:
+        return
+    if base == ours:
+        for path, _, new in diff_trees(repo_dir, ours, theirs, prefix):
+            changes[path] = new
         return
 
-    current_branch = get_current_branch()
+    base_entries = _tree_entries(repo_dir, base)
+    ours_entries = _tree_entries(repo_dir, ours)
+    theirs_entries = _tree_entries(repo_dir, theirs)
+    for name in sorted(base_entries.keys() | ours_entries.keys() | theirs_entries.keys()):
+        path = f"{prefix}/{name}" if prefix else name
+        base_entry = base_entries.get(name)
+        ours_entry = ours_entries.get(name)
+        theirs_entry = theirs_entries.get(name)
+        if ours_entry == theirs_entry or base_entry == theirs_entry:
+            continue
+        if base_entry == ours_entry:
+            _take_theirs(repo_dir, path, ours_entry, theirs_entry, changes)
+        elif _is_tree(ours_entry) and _is_tree(theirs_entry):
+            base_tree = base_entry[1] if _is_tree(base_entry) else None
+            _merge_trees(
+                repo_dir,
+                base_tree,
+                ours_entry[1],
+                theirs_entry[1],
+                labels,
+                path,
+                changes,
+                conflicts,
+            )
+        elif ours_entry is None or theirs_entry is None:
+            deleted_by = "us" if ours_entry is None else "them"
+            content = None
+            if ours_entry is None and not _is_tree(theirs_entry):
+                _, content = read_object(repo_dir, theirs_entry[1])
+            conflicts[path] = (f"modify/delete, deleted by {deleted_by}", content)
+        elif _is_tree(ours_entry) or _is_tree(theirs_entry):
+            conflicts[path] = ("file/directory", None)
+        else:
+            base_file = None if _is_tree(base_entry) else base_entry
+            _merge_file(
+                repo_dir, path, base_file, ours_entry, theirs_entry, labels, changes, conflicts
+            )
 
-    with open(f"{PIT_DIR}/refs/heads/{current_branch}", "r") as current:
-        current_commit = current.read().strip()
 
-    with open(branch_path, "r") as other:
-        other_commit = other.read().strip()
+def _merge_file(repo_dir, path, base, ours, theirs, labels, changes, conflicts):
+    """Merge the mode and the content of a file changed on both sides."""
+    base_mode, base_hash = base if base else (None, None)
+    mode = theirs[0] if ours[0] == base_mode else ours[0]
+    if ours[1] == theirs[1] or theirs[1] == base_hash:
+        merged_hash = ours[1]
+    elif ours[1] == base_hash:
+        merged_hash = theirs[1]
+    else:
+        base_content = read_object(repo_dir, base_hash)[1] if base_hash else b""
+        ours_content = read_object(repo_dir, ours[1])[1]
+        theirs_content = read_object(repo_dir, theirs[1])[1]
+        if b"\0" in base_content + ours_content + theirs_content:
+            conflicts[path] = ("binary", None)
+            return
+        merged, conflict_count = merge_lines(
+            base_content.splitlines(keepends=True),
+            ours_content.splitlines(keepends=True),
+            theirs_content.splitlines(keepends=True),
+            *labels,
+        )
+        if conflict_count:
+            conflicts[path] = ("content", b"".join(merged))
+            return
+        merged_hash = write_object(repo_dir, b"".join(merged), "blob")
+    if (mode, merged_hash) != ours:
+        changes[path] = (mode, merged_hash)
 
-    if current_commit == other_commit:
+
+def _print_overwritten(paths):
+    print("Your local changes would be overwritten by merge:")
+    for path in paths:
+        print(f" {path}")
+
+
+def merge_branch(args, repo=None):
+    """
+    Merge another branch into the current branch.
+
+    Args:
+        args: Command-line arguments with `branch_name`, the branch to merge.
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory.
+    """
+    repo = repo or require_repo()
+    with repo.lock_index(), repo.lock_ref(repo.current_branch):
+        _merge_locked(args, repo)
+
+
+def _merge_locked(args, repo):
+    """Merge while `merge_branch` holds the index lock and the current branch lock."""
+    repo_dir = repo.root
+
+    if not repo.branch_exists(args.branch_name):
+        print(f"Branch {args.branch_name} does not exist.")
+        return
+    if os.path.exists(get_merge_head_path(repo_dir)):
+        print("A merge is in progress, commit the result first.")
+        return
+
+    current_branch = repo.current_branch
+    current_commit = repo.head
+    other_commit = repo.read_ref(args.branch_name)
+    if not current_commit:
+        print("No commits in the current branch.")
+        return
+
+    base_commit = merge_base(repo_dir, current_commit, other_commit)
+    if base_commit == other_commit:
         print("Branches are already up to date.")
         return
 
-    # Create a new merge commit (simplified, without conflict resolution)
-    merge_message = f"Merged branch {args.branch_name} into {current_branch}."
-    merge_data = f"commit: merge\nmessage: {merge_message}\nparent: {current_commit}\nparent: {other_commit}\n"
-    merge_hash = hash_content(merge_data)
+    index = repo.index
+    if repo.staged_files():
+        print("There is staged data, commit it before merging.")
+        return
+
+    current_tree = repo.commit(current_commit).tree
+    other_tree = repo.commit(other_commit).tree
+    if base_commit == current_commit:
+        # Nothing to merge on our side: move the branch to the other head
+        dirty = checkout_tree(repo_dir, index, current_tree, other_tree)
+        if dirty:
+            _print_overwritten(dirty)
+            return
+        repo.write_index(index)
+        repo.write_ref(current_branch, other_commit)
+        print(f"Fast-forward {current_branch} to {other_commit}.")
+        return
+
+    base_tree = repo.commit(base_commit).tree if base_commit else None
+    changes, conflicts = merge_trees(
+        repo_dir,
+        base_tree,
+        current_tree,
+        other_tree,
+        (current_branch, args.branch_name),
+    )
+
+    touched = changes.keys() | conflicts.keys()
+    dirty = sorted(path for path in touched if has_local_changes(repo_dir, index, path))
+    if dirty:
+        _print_overwritten(dirty)
+        return
 
-    merge_hash_folder, merge_hash_file = split_object_hash(merge_hash)
-    merge_hash_dir = f"{PIT_DIR}/objects/{merge_hash_folder}"
+    apply_changes(repo_dir, index, changes)
+    for path, (_, content) in sorted(conflicts.items()):
+        if content is not None:
+            abs_path = os.path.join(repo_dir, path)
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+            with open(abs_path, "wb") as f:
+                f.write(content)
 
-    os.makedirs(merge_hash_dir, exist_ok=True)
+    if conflicts:
+        repo.write_index(index)
+        write_locked(get_merge_head_path(repo_dir), other_commit)
+        for path, (kind, _) in sorted(conflicts.items()):
+            print(f"CONFLICT ({kind}): Merge conflict in {path}")
+        print("Automatic merge failed; fix conflicts and then commit the result.")
+        return
 
-    write_file(f"{merge_hash_dir}/{merge_hash_file}", merge_data)
+    tree_hash = write_tree(repo_dir, index)
+    repo.write_index(index)
+    merge_message = f"Merged branch {args.branch_name} into {current_branch}."
+    merge_data = format_commit(
+        tree_hash,
+        [current_commit, other_commit],
+        get_author(repo_dir),
+        time.time(),
+        merge_message,
+    )
+    merge_hash = write_object(repo_dir, merge_data, "commit")
 
-    write_file(f"{PIT_DIR}/refs/heads/{current_branch}", merge_hash)
+    repo.write_ref(current_branch, merge_hash)
+    update_commit_graph(repo_dir, [merge_hash])
 
     print(
         f"Branch {args.branch_name} merged into {current_branch}. New commit: {merge_hash}"
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+The pit object database.
+
+Every object (blob, tree, commit) is identified by the SHA-1 of a typed header followed by
+its content, `b"<type> <size>\\0" + content`. Loose objects are stored zlib-compressed, header
+included, under `.pit/objects/<first two hex digits>/<remaining hex digits>`. The compression
+level is read from `core.compression` in `.pit/config`.
+
+Objects may also live in packfiles (see `src/pack.py`); readers consult the packs first and
+fall back to loose objects.
+
+A partial clone lacks the blobs of its history: an object missing from the repository is
+fetched from the repository it was cloned from (`remote.url` with `remote.promisor` set in
+`.pit/config`) on first read and stored as a loose object. A shallow clone lacks the history
+behind its graft points, the commits listed in `.pit/shallow`, which are read as if they
+had no parents.
+
+Blobs of at least `core.chunkThreshold` bytes are stored in content-defined chunks (see
+`src/chunking.py`): every chunk is a `chunk` object of its own, and the blob hash names a
+`chunked` object listing them. `read_object` puts the chunks back together, so only the
+storage layer (`read_stored_object`, `write_stored_object`, gc and clone) sees the pieces.
+
+All commands read and write objects through this module so storage details stay in one
+place. Objects written by older versions of pit (raw, uncompressed content without a
+header) are still readable.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+import zlib
+from collections import namedtuple
+
+from src import trace
+from src.chunking import format_manifest, iter_chunks, parse_manifest
+from src.config import (get_chunk_threshold, get_compression_level,
+                        get_promisor)
+from src.constants import PIT_DIR
+from src.pack import is_packed, read_packed_object
+from src.presence import get_presence
+
+# Size of the chunks blobs are streamed in when hashed and stored
+BLOB_CHUNK_SIZE = 1024 * 1024
+# Files of at least this size are memory mapped instead of read when stored
+MMAP_THRESHOLD = 256 * 1024 * 1024
+
+# Content prefix of commits written before objects had a typed header
+_LEGACY_COMMIT_PREFIX = b"commit: "
+# Stored types of blobs kept in content-defined chunks
+CHUNK_TYPE = "chunk"
+CHUNKED_TYPE = "chunked"
+
+_shallow_cache = {}
+
+Commit = namedtuple("Commit", ["tree", "parents", "author", "timestamp", "message", "files"])
+
+
+def object_header(obj_type, size):
+    """Return the typed header that prefixes an object's content before hashing."""
+    return f"{obj_type} {size}\0".encode("utf-8")
+
+
+def hash_object_content(content, obj_type="blob"):
+    """
+    Compute the hash of an object without storing it.
+
+    Args:
+        content (bytes): The content of the object.
+        obj_type (str): The type of the object.
+
+    Returns:
+        str: The hex SHA-1 of the typed header and content.
+    """
+    return hashlib.sha1(object_header(obj_type, len(content)) + content).hexdigest()
+
+
+@trace.traced("object.hash")
+def hash_blob_file(file_path):
+    """Compute the blob hash of a file, streaming its content."""
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        trace.count("bytes_hashed", size)
+        hasher = hashlib.sha1(object_header("blob", size))
+        while chunk := f.read(BLOB_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_objects_dir(repo_dir):
+    """Return the directory loose objects are stored in."""
+    return os.path.join(repo_dir, PIT_DIR, "objects")
+
+
+def get_object_path(repo_dir, object_hash):
+    """Return the path of a loose object in `.pit/objects`."""
+    return os.path.join(get_objects_dir(repo_dir), object_hash[:2], object_hash[2:])
+
+
+def object_exists(repo_dir, object_hash):
+    """Check whether an object is stored in the repository, loose or packed."""
+    return os.path.exists(get_object_path(repo_dir, object_hash)) or is_packed(
+        repo_dir, object_hash
+    )
+
+
+def is_stored(repo_dir, object_hash):
+    """
+    Check whether an object is stored, for writers to skip it: mostly answered from memory,
+    see `src/presence.py`.
+    """
+    return get_presence(repo_dir).contains(
+        object_hash, get_object_path(repo_dir, object_hash)
+    )
+
+
+def list_loose_objects(repo_dir):
+    """Yield the hash of every loose object in the repository."""
+    objects_dir = get_objects_dir(repo_dir)
+    for folder in sorted(os.listdir(objects_dir)):
+        if len(folder) != 2 or not os.path.isdir(os.path.join(objects_dir, folder)):
+            continue
+        for name in sorted(os.listdir(os.path.join(objects_dir, folder))):
+            if not name.startswith("tmp_"):
+                yield folder + name
+
+
+@trace.traced("object.write")
+def write_object(repo_dir, content, obj_type):
+    """
+    Hash an object and store it compressed, unless it is already stored.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        content (bytes): The content of the object.
+        obj_type (str): The type of the object: "blob", "tree" or "commit".
+
+    Returns:
+        str: The hash of the object.
+    """
+    threshold = get_chunk_threshold(repo_dir)
+    if obj_type == "blob" and threshold and len(content) >= threshold:
+        return _store_chunked(repo_dir, io.BytesIO(content), len(content))
+    full_content = object_header(obj_type, len(content)) + content
+    object_hash = hashlib.sha1(full_content).hexdigest()
+    _write_stored(repo_dir, object_hash, full_content)
+    return object_hash
+
+
+def write_stored_object(repo_dir, object_hash, obj_type, content):
+    """
+    Store an object as read by `read_stored_object`, e.g. from another repository.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        object_hash (str): The hash of the object.
+        obj_type (str): The stored type of the object, "chunked" for a blob in chunks.
+        content (bytes): The stored content of the object.
+    """
+    _write_stored(repo_dir, object_hash, object_header(obj_type, len(content)) + content)
+
+
+def _write_stored(repo_dir, object_hash, full_content):
+    """Compress and store header and content under a hash, unless it is already stored."""
+    if is_stored(repo_dir, object_hash):
+        return
+    level = get_compression_level(repo_dir)
+    with _temp_object(repo_dir) as tmp:
+        tmp.write(zlib.compress(full_content, level))
+    _move_object(tmp.name, get_object_path(repo_dir, object_hash))
+    get_presence(repo_dir).add(object_hash)
+    trace.count("objects_written")
+
+
+def _store_chunked(repo_dir, src, size):
+    """
+    Store a blob as content-defined chunks and the manifest listing them.
+
+    Chunks already stored, by this or an earlier version of the file, are not written again.
+
+    Returns:
+        str: The hash of the blob, or None if the file did not have `size` bytes.
+    """
+    hasher = hashlib.sha1(object_header("blob", size))
+    chunks = []
+    for chunk in iter_chunks(src):
+        hasher.update(chunk)
+        chunks.append((write_object(repo_dir, chunk, CHUNK_TYPE), len(chunk)))
+    if sum(chunk_size for _, chunk_size in chunks) != size:
+        return None
+    blob_hash = hasher.hexdigest()
+    write_stored_object(repo_dir, blob_hash, CHUNKED_TYPE, format_manifest(chunks))
+    return blob_hash
+
+
+@trace.traced("object.store")
+def store_blob(repo_dir, src, size, use_mmap=None):
+    """
+    Hashes an open binary file and stores its content as a blob object.
+
+    Content that fits in a single chunk is hashed from memory, and neither compressed nor
+    written if the object is already stored. Larger content is read once, chunk by chunk,
+    through both the hasher and the compressor into a temporary file in `.pit/objects`,
+    which is atomically renamed to its hash path, or removed if the object is already
+    stored, so peak memory is bounded by the chunk size whatever the size of the file. With
+    `use_mmap` the file is memory mapped instead, hashed in place and only compressed if
+    the object is new.
+
+    Files of at least `core.chunkThreshold` bytes are stored in content-defined chunks
+    instead, of which only the new ones are written.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        src (file): The file to store, opened in binary mode at its start.
+        size (int): The size of the file, as given by `os.fstat`.
+        use_mmap (bool): Force or disable memory mapping. Defaults to files of MMAP_THRESHOLD
+            bytes or more.
+
+    Returns:
+        str: The hash of the blob.
+    """
+    if use_mmap is None:
+        use_mmap = size >= MMAP_THRESHOLD
+    header = object_header("blob", size)
+    level = get_compression_level(repo_dir)
+    trace.count("bytes_hashed", size)
+
+    threshold = get_chunk_threshold(repo_dir)
+    if threshold and size >= threshold:
+        blob_hash = _store_chunked(repo_dir, src, size)
+        return blob_hash or _restore_blob(repo_dir, src, use_mmap)
+
+    if use_mmap and size:
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) != size:
+                return _restore_blob(repo_dir, src, use_mmap)
+            hasher = hashlib.sha1(header)
+            hasher.update(mapped)
+            blob_hash = hasher.hexdigest()
+            if not is_stored(repo_dir, blob_hash):
+                compressor = zlib.compressobj(level)
+                with _temp_object(repo_dir) as tmp:
+                    tmp.write(compressor.compress(header))
+                    for offset in range(0, len(mapped), BLOB_CHUNK_SIZE):
+                        chunk = mapped[offset : offset + BLOB_CHUNK_SIZE]
+                        tmp.write(compressor.compress(chunk))
+                    tmp.write(compressor.flush())
+                _move_object(tmp.name, get_object_path(repo_dir, blob_hash))
+                get_presence(repo_dir).add(blob_hash)
+                trace.count("objects_written")
+        return blob_hash
+
+    chunk = src.read(BLOB_CHUNK_SIZE)
+    if len(chunk) < BLOB_CHUNK_SIZE:
+        # The whole content fit in one chunk, only write it if the object is new
+        if len(chunk) != size:
+            return _restore_blob(repo_dir, src, use_mmap)
+        return write_object(repo_dir, chunk, "blob")
+
+    # Hash and compress in the same pass, so the file is read only once; the compressed
+    # copy is dropped if the object turns out to be stored already
+    hasher = hashlib.sha1(header)
+    compressor = zlib.compressobj(level)
+    written = 0
+    with _temp_object(repo_dir) as tmp:
+        tmp.write(compressor.compress(header))
+        while chunk:
+            hasher.update(chunk)
+            tmp.write(compressor.compress(chunk))
+            written += len(chunk)
+            chunk = src.read(BLOB_CHUNK_SIZE)
+        tmp.write(compressor.flush())
+    if written != size:
+        os.remove(tmp.name)
+        return _restore_blob(repo_dir, src, use_mmap)
+    blob_hash = hasher.hexdigest()
+    if is_stored(repo_dir, blob_hash):
+        os.remove(tmp.name)
+        return blob_hash
+    _move_object(tmp.name, get_object_path(repo_dir, blob_hash))
+    get_presence(repo_dir).add(blob_hash)
+    trace.count("objects_written")
+    return blob_hash
+
+
+def _restore_blob(repo_dir, src, use_mmap):
+    """Store a file again from its start after it changed size while it was being read."""
+    src.seek(0)
+    return store_blob(repo_dir, src, os.fstat(src.fileno()).st_size, use_mmap)
+
+
+def _temp_object(repo_dir):
+    """Open a temporary file in `.pit/objects` to write an object into before renaming it."""
+    return tempfile.NamedTemporaryFile(
+        dir=get_objects_dir(repo_dir), prefix="tmp_obj_", delete=False
+    )
+
+
+def _move_object(tmp_path, object_path):
+    """
+    Atomically move a fully written temporary file to its object path.
+
+    Objects are named by their content: when another process stored the same object
+    first, either identical file wins. The fan-out directory is only created when the
+    rename finds it missing.
+    """
+    try:
+        os.replace(tmp_path, object_path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.replace(tmp_path, object_path)
+
+
+def _parse_object(raw):
+    """Split stored object bytes into their type and content."""
+    try:
+        data = zlib.decompress(raw)
+    except zlib.error:
+        # Objects from older versions of pit are stored raw, without a header
+        obj_type = "commit" if raw.startswith(_LEGACY_COMMIT_PREFIX) else "blob"
+        return obj_type, raw
+
+    header, _, content = data.partition(b"\0")
+    obj_type, _, size = header.decode("utf-8").partition(" ")
+    if int(size) != len(content):
+        raise ValueError(f"Object is corrupt: expected {size} bytes, got {len(content)}")
+    return obj_type, content
+
+
+@trace.traced("object.read")
+def read_object(repo_dir, object_hash):
+    """
+    Read an object from the repository.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        object_hash (str): The hash of the object.
+
+    Returns:
+        tuple: The type of the object and its content as bytes, or (None, None) if the
+            object does not exist.
+    """
+    obj_type, content = read_stored_object(repo_dir, object_hash)
+    if obj_type == CHUNKED_TYPE:
+        return "blob", _join_chunks(repo_dir, object_hash, content)
+    return obj_type, content
+
+
+def _join_chunks(repo_dir, blob_hash, manifest):
+    """Put a blob stored in chunks back together."""
+    parts = []
+    for chunk_hash, size in parse_manifest(manifest):
+        obj_type, chunk = read_stored_object(repo_dir, chunk_hash)
+        if obj_type != CHUNK_TYPE or len(chunk) != size:
+            raise ValueError(f"Object {blob_hash} is corrupt: chunk {chunk_hash} is missing")
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+def read_stored_object(repo_dir, object_hash):
+    """
+    Read an object as it is stored: a blob stored in chunks is returned as its manifest,
+    with the type "chunked".
+
+    Returns:
+        tuple: The stored type and content, or (None, None) if the object does not exist.
+    """
+    obj_type, content = read_packed_object(repo_dir, object_hash)
+    if obj_type is not None:
+        trace.count("objects_read")
+        return obj_type, content
+    try:
+        with open(get_object_path(repo_dir, object_hash), "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return _fetch_object(repo_dir, object_hash)
+    trace.count("objects_read")
+    return _parse_object(raw)
+
+
+def read_manifest(repo_dir, object_hash):
+    """
+    Return the chunks of a blob stored in chunks, a list of (chunk hash, size), or None if
+    the object is stored whole. Loose objects stored whole are only decompressed as far as
+    their header.
+    """
+    try:
+        with open(get_object_path(repo_dir, object_hash), "rb") as f:
+            head = zlib.decompressobj().decompress(f.read(64), len(CHUNKED_TYPE) + 1)
+        if head != f"{CHUNKED_TYPE} ".encode("utf-8"):
+            return None
+    except (FileNotFoundError, zlib.error):
+        pass
+    obj_type, content = read_stored_object(repo_dir, object_hash)
+    return parse_manifest(content) if obj_type == CHUNKED_TYPE else None
+
+
+def _fetch_object(repo_dir, object_hash):
+    """Copy a missing stored object from the promisor repository of a partial clone, if any."""
+    source = get_promisor(repo_dir)
+    if not source or os.path.abspath(source) == os.path.abspath(repo_dir):
+        return None, None
+    obj_type, content = read_stored_object(source, object_hash)
+    if obj_type is not None:
+        trace.count("objects_fetched")
+        # Chunks of a blob stored in chunks are fetched when they are read
+        write_stored_object(repo_dir, object_hash, obj_type, content)
+    return obj_type, content
+
+
+def format_commit(tree, parents, author, timestamp, message):
+    """
+    Serialize a commit into the content of a commit object.
+
+    The headers (`tree`, one `parent` per parent, `author` with a Unix timestamp) are
+    followed by an empty line and the message.
+
+    Returns:
+        bytes: The content of the commit object.
+    """
+    lines = [f"tree {tree}"]
+    lines += [f"parent {parent}" for parent in parents]
+    lines.append(f"author {author} {int(timestamp)}")
+    return ("\n".join(lines) + f"\n\n{message}\n").encode("utf-8")
+
+
+def parse_commit(content):
+    """
+    Parse the content of a commit object.
+
+    Commits written by older versions of pit have no tree; they list the committed files
+    inline as `path hash` lines, which are returned in `files`.
+
+    Returns:
+        Commit: The parsed commit.
+    """
+    text = content.decode("utf-8")
+    if text.startswith("tree "):
+        headers, _, message = text.partition("\n\n")
+        tree, parents, author, timestamp = None, [], "", 0
+        for line in headers.splitlines():
+            key, _, value = line.partition(" ")
+            if key == "tree":
+                tree = value
+            elif key == "parent":
+                parents.append(value)
+            elif key == "author":
+                author, _, stamp = value.rpartition(" ")
+                timestamp = int(stamp)
+        return Commit(tree, parents, author, timestamp, message.rstrip("\n"), {})
+
+    parents, message, timestamp, files = [], "", 0, {}
+    for line in text.splitlines():
+        if line.startswith("commit: "):
+            try:
+                timestamp = int(float(line[len("commit: ") :]))
+            except ValueError:
+                pass
+        elif line.startswith(("parent ", "parent: ")):
+            parents.append(line.split()[1])
+        elif line.startswith("message: "):
+            message = line[len("message: ") :]
+        else:
+            parts = line.rsplit(" ", 1)
+            if len(parts) == 2:
+                files[parts[0]] = parts[1]
+    return Commit(None, parents, "", timestamp, message, files)
+
+
+def get_shallow_path(repo_dir):
+    """Return the path of the file listing the graft points of a shallow clone."""
+    return os.path.join(repo_dir, PIT_DIR, "shallow")
+
+
+def read_shallow(repo_dir):
+    """
+    Read the graft points of a shallow clone, cached until the file changes.
+
+    Returns:
+        frozenset: The hashes of the commits whose parents are not in the repository.
+    """
+    path = get_shallow_path(repo_dir)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return frozenset()
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _shallow_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path, encoding="utf-8") as f:
+        shallow = frozenset(line.strip() for line in f if line.strip())
+    _shallow_cache[path] = (key, shallow)
+    return shallow
+
+
+def read_commit(repo_dir, commit_hash):
+    """
+    Read and parse a commit object, or return None if it does not exist.
+
+    The graft points of a shallow clone are returned without parents.
+    """
+    obj_type, content = read_object(repo_dir, commit_hash)
+    if obj_type != "commit":
+        return None
+    commit = parse_commit(content)
+    if commit.parents and commit_hash in read_shallow(repo_dir):
+        commit = commit._replace(parents=[])
+    return commit
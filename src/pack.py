@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Packfiles: many objects stored in a single file, with delta compression and an offset index.
+
+Packs live in `.pit/objects/pack` as a `pack-<checksum>.pack` / `pack-<checksum>.idx` pair.
+
+Pack layout (integers are big-endian):
+- header: signature `PACK`, version (uint32), object count (uint32)
+- one record per object: a type byte, the payload size as a varint, for deltas the 20-byte
+  hash of the base object, then the zlib-compressed payload
+- trailer: SHA-1 of everything above
+
+A delta payload starts with the base and result sizes as varints, followed by instructions:
+a byte with the high bit set copies a range of the base (the low bits say which offset and
+size bytes follow), any other non-zero byte inserts that many literal bytes.
+
+Index layout:
+- header: signature `\\xffPIX`, version (uint32)
+- fanout: 256 uint32, entry i is the number of objects whose hash starts with a byte <= i
+- the 20-byte hashes of all objects, sorted
+- the uint64 pack offset of each object, in hash order
+- trailer: the pack checksum, then SHA-1 of everything above
+
+A lookup narrows the search with the fanout table, binary searches the sorted hashes of the
+memory-mapped index, then seeks once into the pack.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+
+from src.constants import PIT_DIR
+
+PACK_SIGNATURE = b"PACK"
+INDEX_SIGNATURE = b"\xffPIX"
+PACK_VERSION = 1
+
+# "chunk" and "chunked" are the pieces and manifests of blobs stored in chunks
+TYPE_CODES = {"commit": 1, "tree": 2, "blob": 3, "chunk": 4, "chunked": 5}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+DELTA_CODE = 7
+
+# Deltas are chained at most this deep so reading an object stays cheap
+MAX_DELTA_DEPTH = 10
+# Objects larger than this are stored whole, delta search is quadratic-ish in pure Python
+MAX_DELTA_SIZE = 1024 * 1024
+# Size of the blocks used to find matching regions between a base and a target
+DELTA_BLOCK_SIZE = 16
+
+_HEADER = struct.Struct(">4sII")
+_FANOUT = struct.Struct(">256I")
+_HASH_SIZE = 20
+_READ_CHUNK = 64 * 1024
+
+_cache = {}
+
+
+def get_pack_dir(repo_dir):
+    """Return the directory packfiles are stored in."""
+    return os.path.join(repo_dir, PIT_DIR, "objects", "pack")
+
+
+def encode_varint(value):
+    """Encode a non-negative integer, 7 bits per byte, least significant group first."""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data, offset):
+    """Decode a varint from data at offset. Returns the value and the offset after it."""
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def index_delta_base(base):
+    """Map each block of the base to its first offset, for use by `create_delta`."""
+    blocks = {}
+    for offset in range(0, len(base) - DELTA_BLOCK_SIZE + 1, DELTA_BLOCK_SIZE):
+        blocks.setdefault(base[offset : offset + DELTA_BLOCK_SIZE], offset)
+    return blocks
+
+
+def _encode_copy(offset, size):
+    command = 0x80
+    args = bytearray()
+    for i in range(4):
+        byte = (offset >> (8 * i)) & 0xFF
+        if byte:
+            command |= 1 << i
+            args.append(byte)
+    for i in range(3):
+        byte = (size >> (8 * i)) & 0xFF
+        if byte:
+            command |= 1 << (4 + i)
+            args.append(byte)
+    return bytes([command]) + bytes(args)
+
+
+def _encode_inserts(literal):
+    out = bytearray()
+    for start in range(0, len(literal), 0x7F):
+        chunk = literal[start : start + 0x7F]
+        out.append(len(chunk))
+        out += chunk
+    return bytes(out)
+
+
+def create_delta(base, target, base_index=None, max_size=None):
+    """
+    Encode target as a sequence of copies from base and literal inserts.
+
+    Args:
+        base (bytes): The content the delta is applied to.
+        target (bytes): The content the delta produces.
+        base_index (dict): The result of `index_delta_base(base)`, if already computed.
+        max_size (int): Give up and return None once the delta grows past this size.
+
+    Returns:
+        bytes: The delta, or None if it would exceed max_size.
+    """
+    if base_index is None:
+        base_index = index_delta_base(base)
+    out = bytearray(encode_varint(len(base)) + encode_varint(len(target)))
+    literal_start = 0
+    position = 0
+    end = len(target) - DELTA_BLOCK_SIZE
+    while position <= end:
+        base_offset = base_index.get(target[position : position + DELTA_BLOCK_SIZE])
+        if base_offset is None:
+            position += 1
+            continue
+
+        # Extend the match backwards into pending literals and forwards as far as it goes
+        while (
+            position > literal_start
+            and base_offset > 0
+            and base[base_offset - 1] == target[position - 1]
+        ):
+            position -= 1
+            base_offset -= 1
+        length = DELTA_BLOCK_SIZE
+        while (
+            position + length < len(target)
+            and base_offset + length < len(base)
+            and base[base_offset + length] == target[position + length]
+        ):
+            length += 1
+
+        out += _encode_inserts(target[literal_start:position])
+        copied = 0
+        while copied < length:
+            size = min(length - copied, 0xFFFFFF)
+            out += _encode_copy(base_offset + copied, size)
+            copied += size
+        position += length
+        literal_start = position
+        if max_size is not None and len(out) > max_size:
+            return None
+
+    out += _encode_inserts(target[literal_start:])
+    if max_size is not None and len(out) > max_size:
+        return None
+    return bytes(out)
+
+
+def apply_delta(base, delta):
+    """
+    Rebuild the target content from a base and a delta created by `create_delta`.
+
+    Raises:
+        ValueError: If the delta does not match the base.
+    """
+    base_size, offset = decode_varint(delta, 0)
+    result_size, offset = decode_varint(delta, offset)
+    if base_size != len(base):
+        raise ValueError("Delta base size mismatch")
+
+    out = bytearray()
+    while offset < len(delta):
+        command = delta[offset]
+        offset += 1
+        if command & 0x80:
+            copy_offset = copy_size = 0
+            for i in range(4):
+                if command & (1 << i):
+                    copy_offset |= delta[offset] << (8 * i)
+                    offset += 1
+            for i in range(3):
+                if command & (1 << (4 + i)):
+                    copy_size |= delta[offset] << (8 * i)
+                    offset += 1
+            out += base[copy_offset : copy_offset + (copy_size or 0x10000)]
+        elif command:
+            out += delta[offset : offset + command]
+            offset += command
+        else:
+            raise ValueError("Invalid delta instruction")
+
+    if len(out) != result_size:
+        raise ValueError("Delta result size mismatch")
+    return bytes(out)
+
+
+class PackFile:
+    """
+    A packfile and its memory-mapped index, for looking up and reading packed objects.
+    """
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self.index_path = pack_path[: -len(".pack")] + ".idx"
+        with open(self.index_path, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version = struct.unpack_from(">4sI", self._index, 0)
+        if signature != INDEX_SIGNATURE or version != PACK_VERSION:
+            raise ValueError(f"Invalid pack index {self.index_path}")
+        self._fanout = _FANOUT.unpack_from(self._index, 8)
+        self.count = self._fanout[255]
+        self._hashes_offset = 8 + _FANOUT.size
+        self._offsets_offset = self._hashes_offset + self.count * _HASH_SIZE
+
+    def close(self):
+        self._index.close()
+
+    def _hash_at(self, position):
+        start = self._hashes_offset + position * _HASH_SIZE
+        return self._index[start : start + _HASH_SIZE]
+
+    def find_offset(self, object_hash):
+        """
+        Find the pack offset of an object with a fanout-bounded binary search.
+
+        Returns:
+            int: The offset of the object's record, or None if it is not in this pack.
+        """
+        raw_hash = bytes.fromhex(object_hash)
+        first = raw_hash[0]
+        low = self._fanout[first - 1] if first else 0
+        high = self._fanout[first]
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self._hash_at(middle)
+            if candidate < raw_hash:
+                low = middle + 1
+            elif candidate > raw_hash:
+                high = middle
+            else:
+                (offset,) = struct.unpack_from(
+                    ">Q", self._index, self._offsets_offset + middle * 8
+                )
+                return offset
+        return None
+
+    def __contains__(self, object_hash):
+        return self.find_offset(object_hash) is not None
+
+    def hashes(self):
+        """Yield the hash of every object in the pack, in sorted order."""
+        for position in range(self.count):
+            yield self._hash_at(position).hex()
+
+    def _read_record(self, f, offset):
+        """Read the record at offset: its type code, base hash (for deltas) and payload."""
+        f.seek(offset)
+        buffer = f.read(_READ_CHUNK)
+        type_code = buffer[0]
+        size, position = decode_varint(buffer, 1)
+        base_hash = None
+        if type_code == DELTA_CODE:
+            base_hash = buffer[position : position + _HASH_SIZE].hex()
+            position += _HASH_SIZE
+
+        decompressor = zlib.decompressobj()
+        parts = [decompressor.decompress(buffer[position:])]
+        while not decompressor.eof:
+            buffer = f.read(_READ_CHUNK)
+            if not buffer:
+                raise ValueError(f"Truncated object in {self.pack_path}")
+            parts.append(decompressor.decompress(buffer))
+        payload = b"".join(parts)
+        if len(payload) != size:
+            raise ValueError(f"Corrupt object in {self.pack_path}")
+        return type_code, base_hash, payload
+
+    def read(self, object_hash):
+        """
+        Read an object from the pack, resolving delta chains.
+
+        Returns:
+            tuple: The object type and content, or (None, None) if it is not in this pack.
+        """
+        offset = self.find_offset(object_hash)
+        if offset is None:
+            return None, None
+
+        deltas = []
+        with open(self.pack_path, "rb") as f:
+            while True:
+                type_code, base_hash, payload = self._read_record(f, offset)
+                if type_code != DELTA_CODE:
+                    break
+                deltas.append(payload)
+                offset = self.find_offset(base_hash)
+                if offset is None:
+                    raise ValueError(f"Missing delta base {base_hash} in {self.pack_path}")
+
+        content = payload
+        for delta in reversed(deltas):
+            content = apply_delta(content, delta)
+        return TYPE_NAMES[type_code], content
+
+
+def get_packs(repo_dir):
+    """
+    Return the packs of a repository, newest first, opening their indexes once per process.
+
+    The list is reloaded when the pack directory changes.
+    """
+    pack_dir = get_pack_dir(repo_dir)
+    try:
+        mtime_ns = os.stat(pack_dir).st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    cached = _cache.get(pack_dir)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    if cached:
+        for pack in cached[1]:
+            pack.close()
+
+    pack_paths = [
+        os.path.join(pack_dir, name)
+        for name in os.listdir(pack_dir)
+        if name.endswith(".pack")
+        and os.path.exists(os.path.join(pack_dir, name[: -len(".pack")] + ".idx"))
+    ]
+    pack_paths.sort(key=os.path.getmtime, reverse=True)
+    packs = [PackFile(path) for path in pack_paths]
+    _cache[pack_dir] = (mtime_ns, packs)
+    return packs
+
+
+def read_packed_object(repo_dir, object_hash):
+    """
+    Read an object from the packs of a repository.
+
+    Returns:
+        tuple: The object type and content, or (None, None) if no pack holds the object.
+    """
+    for pack in get_packs(repo_dir):
+        obj_type, content = pack.read(object_hash)
+        if obj_type is not None:
+            return obj_type, content
+    return None, None
+
+
+def is_packed(repo_dir, object_hash):
+    """Check whether any pack of the repository holds an object."""
+    return any(object_hash in pack for pack in get_packs(repo_dir))
+
+
+def write_pack(repo_dir, records, count):
+    """
+    Write a packfile and its index, streaming the records into the pack.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        records (iterable): (hash, type, payload, base_hash) tuples. base_hash is None for
+            whole objects; otherwise payload is a delta against the object with that hash,
+            which must also be part of the pack.
+        count (int): The number of records.
+
+    Returns:
+        str: The path of the new packfile.
+    """
+    pack_dir = get_pack_dir(repo_dir)
+    os.makedirs(pack_dir, exist_ok=True)
+    tmp_pack = os.path.join(pack_dir, f"tmp_pack_{os.getpid()}")
+    offsets = {}
+    hasher = hashlib.sha1()
+
+    with open(tmp_pack, "wb") as f:
+
+        def write(data):
+            hasher.update(data)
+            f.write(data)
+
+        write(_HEADER.pack(PACK_SIGNATURE, PACK_VERSION, count))
+        position = _HEADER.size
+        for object_hash, obj_type, payload, base_hash in records:
+            offsets[object_hash] = position
+            type_code = DELTA_CODE if base_hash else TYPE_CODES[obj_type]
+            header = bytes([type_code]) + encode_varint(len(payload))
+            if base_hash:
+                header += bytes.fromhex(base_hash)
+            compressed = zlib.compress(payload)
+            write(header)
+            write(compressed)
+            position += len(header) + len(compressed)
+        checksum = hasher.digest()
+        f.write(checksum)
+    if len(offsets) != count:
+        os.remove(tmp_pack)
+        raise ValueError(f"Expected {count} objects to pack, got {len(offsets)}")
+
+    name = f"pack-{checksum.hex()}"
+    pack_path = os.path.join(pack_dir, name + ".pack")
+    os.replace(tmp_pack, pack_path)
+
+    sorted_hashes = sorted(offsets)
+    fanout = [0] * 256
+    for object_hash in sorted_hashes:
+        fanout[int(object_hash[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    index = bytearray(INDEX_SIGNATURE + struct.pack(">I", PACK_VERSION))
+    index += _FANOUT.pack(*fanout)
+    for object_hash in sorted_hashes:
+        index += bytes.fromhex(object_hash)
+    for object_hash in sorted_hashes:
+        index += struct.pack(">Q", offsets[object_hash])
+    index += checksum
+    index += hashlib.sha1(index).digest()
+
+    # The index is moved into place last: a pack without an index is never read
+    tmp_index = os.path.join(pack_dir, f"tmp_idx_{os.getpid()}")
+    with open(tmp_index, "wb") as f:
+        f.write(index)
+    os.replace(tmp_index, os.path.join(pack_dir, name + ".idx"))
+    return pack_path
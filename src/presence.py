@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Object presence: whether an object is already stored, answered mostly from memory, so that
+object writers skip objects the repository already has.
+
+- Packed objects are looked up in the memory-mapped pack indexes with a binary search (see
+  `src/pack.py`), opened once per process.
+- Loose objects are tracked by a bloom filter persisted in `.pit/loose-bloom`. A hash the
+  filter does not contain is not stored loose, and is written without looking for it on
+  disk. A hash it may contain is checked with one stat, so a false positive or an object
+  removed since costs that stat and nothing else.
+
+The filter only has to contain the loose objects that exist: an object written by another
+process after the filter was loaded is at worst written again, which is harmless since
+objects are named by their content. The hashes a process adds are written to the file
+under its lock when the process exits: a few are set in place, bit by bit, more merge the
+filters and replace the file. Bits are only ever set, so a reader never misses an object
+even while the file is being updated. If another process holds the lock, the flush is
+skipped rather than waited for. `pit gc`, which removes loose objects, rebuilds the file.
+
+Filter layout (integers are big-endian): signature `PBLM`, version (uint32), number of hash
+functions (uint32), number of bits (uint64), number of objects added (uint64), then the bits.
+"""
+
+import atexit
+import os
+import struct
+import threading
+
+from src.constants import PIT_DIR
+from src.lockfile import LockFile
+from src.pack import is_packed
+
+BLOOM_FILE = "loose-bloom"
+BLOOM_SIGNATURE = b"PBLM"
+BLOOM_VERSION = 1
+# 10 bits per object and 7 hash functions give about 1% false positives
+BITS_PER_OBJECT = 10
+HASH_COUNT = 7
+MIN_BITS = 1 << 20
+# Up to this many new hashes are set in the persisted filter in place instead of rewriting it
+MAX_IN_PLACE = 1024
+
+_HEADER = struct.Struct(">4sIIQQ")
+
+_cache = {}
+_lock = threading.Lock()
+_flush_registered = False
+
+
+def get_bloom_path(repo_dir):
+    """Return the path of the bloom filter of the loose objects of a repository."""
+    return os.path.join(repo_dir, PIT_DIR, BLOOM_FILE)
+
+
+class BloomFilter:
+    """A set of object hashes that may report hashes it does not hold, but never misses one."""
+
+    def __init__(self, bits, hash_count=HASH_COUNT, data=None, count=0):
+        self.bits = bits
+        self.hash_count = hash_count
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_count(cls, count):
+        """Return an empty filter sized for about `count` objects."""
+        bits = MIN_BITS
+        while bits < count * BITS_PER_OBJECT:
+            bits *= 2
+        return cls(bits)
+
+    @property
+    def full(self):
+        return self.count * BITS_PER_OBJECT > self.bits
+
+    def _positions(self, object_hash):
+        # Object hashes are uniformly distributed, their bytes serve as the hash functions
+        raw = bytes.fromhex(object_hash)
+        first = int.from_bytes(raw[:8], "big")
+        step = int.from_bytes(raw[8:16], "big") | 1
+        return [(first + i * step) % self.bits for i in range(self.hash_count)]
+
+    def add(self, object_hash):
+        """Add a hash. Returns the indexes of the bytes of `data` it sets bits in."""
+        indexes = []
+        for position in self._positions(object_hash):
+            self.data[position >> 3] |= 1 << (position & 7)
+            indexes.append(position >> 3)
+        self.count += 1
+        return indexes
+
+    def __contains__(self, object_hash):
+        data = self.data
+        return all(
+            data[position >> 3] & (1 << (position & 7))
+            for position in self._positions(object_hash)
+        )
+
+    def merge(self, other, added):
+        """
+        Add every hash of a filter with the same parameters.
+
+        Args:
+            other (BloomFilter): The filter to add the hashes of.
+            added (int): How many hashes this filter holds that `other` does not, so the
+                count stays that of every object added to either.
+        """
+        merged = int.from_bytes(self.data, "big") | int.from_bytes(other.data, "big")
+        self.data = bytearray(merged.to_bytes(len(self.data), "big"))
+        self.count = other.count + added
+
+    def header(self):
+        return _HEADER.pack(
+            BLOOM_SIGNATURE, BLOOM_VERSION, self.hash_count, self.bits, self.count
+        )
+
+    def serialize(self):
+        return self.header() + bytes(self.data)
+
+    @classmethod
+    def parse(cls, raw):
+        """Parse a serialized filter, or return None if it is not valid."""
+        if len(raw) < _HEADER.size:
+            return None
+        signature, version, hash_count, bits, count = _HEADER.unpack_from(raw)
+        data = raw[_HEADER.size :]
+        if signature != BLOOM_SIGNATURE or version != BLOOM_VERSION:
+            return None
+        if not bits or len(data) != (bits + 7) // 8:
+            return None
+        return cls(bits, hash_count, data, count)
+
+
+def read_bloom(repo_dir):
+    """Read the persisted filter of a repository, or return None if there is none."""
+    try:
+        with open(get_bloom_path(repo_dir), "rb") as f:
+            return BloomFilter.parse(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def build_bloom(repo_dir, extra=0):
+    """Build a filter of the loose objects of a repository, with room for `extra` more."""
+    # Imported here as objects looks objects up through this module
+    from src.objects import list_loose_objects
+
+    hashes = list(list_loose_objects(repo_dir))
+    bloom = BloomFilter.for_count(2 * (len(hashes) + extra))
+    for object_hash in hashes:
+        bloom.add(object_hash)
+    return bloom
+
+
+class ObjectPresence:
+    """The loose objects of a repository as known to one process."""
+
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self.bloom = read_bloom(repo_dir)
+        # Hashes added since the filter was loaded, and whether it has to be written
+        self.added = []
+        self.dirty = False
+        self._lock = threading.Lock()
+        if self.bloom is None:
+            self.bloom = build_bloom(repo_dir)
+            self.dirty = True
+            _register_flush()
+
+    def contains(self, object_hash, loose_path):
+        """
+        Check whether an object is stored.
+
+        Args:
+            object_hash (str): The hash of the object.
+            loose_path (str): Where the object is stored if it is loose.
+        """
+        if is_packed(self.repo_dir, object_hash):
+            return True
+        return object_hash in self.bloom and os.path.exists(loose_path)
+
+    def add(self, object_hash):
+        """Record a loose object this process has just written."""
+        with self._lock:
+            self.bloom.add(object_hash)
+            self.added.append(object_hash)
+            self.dirty = True
+        _register_flush()
+
+    def flush(self):
+        """
+        Write the added hashes to the persisted filter, unless another process is writing it:
+        they are then at worst written again by a later process.
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+            added, self.added, self.dirty = self.added, [], False
+        if not os.path.isdir(os.path.join(self.repo_dir, PIT_DIR, "objects")):
+            return
+        lock = LockFile(get_bloom_path(self.repo_dir))
+        try:
+            if lock.try_acquire():
+                self._write(lock, added)
+        except OSError:
+            pass  # The filter is only a cache
+        finally:
+            lock.rollback()
+
+    def _write(self, lock, added):
+        """Add hashes to the persisted filter, whose lock is held."""
+        stored = read_bloom(self.repo_dir)
+        # Without a persisted filter, e.g. when it was built on load, the whole one is written
+        bloom = self.bloom
+        if stored is not None and (stored.bits, stored.hash_count) != (
+            bloom.bits,
+            bloom.hash_count,
+        ):
+            # Another process resized the filter: start over from the disk
+            bloom = build_bloom(self.repo_dir, len(added))
+        elif stored is not None and len(added) <= MAX_IN_PLACE:
+            indexes = set()
+            for object_hash in added:
+                indexes.update(stored.add(object_hash))
+            if stored.full:
+                bloom = build_bloom(self.repo_dir)
+            else:
+                with open(get_bloom_path(self.repo_dir), "r+b") as f:
+                    for index in sorted(indexes):
+                        f.seek(_HEADER.size + index)
+                        f.write(stored.data[index : index + 1])
+                    f.seek(0)
+                    f.write(stored.header())
+                return
+        elif stored is not None:
+            bloom.merge(stored, len(added))
+        if bloom.full:
+            bloom = build_bloom(self.repo_dir)
+        lock.write(bloom.serialize())
+        lock.commit()
+        self.bloom = bloom
+
+
+def get_presence(repo_dir):
+    """Return the object presence of a repository, created once per process."""
+    presence = _cache.get(repo_dir)
+    if presence is None:
+        with _lock:
+            presence = _cache.get(repo_dir)
+            if presence is None:
+                presence = _cache[repo_dir] = ObjectPresence(repo_dir)
+    return presence
+
+
+def rebuild_presence(repo_dir):
+    """Rebuild the persisted filter from the loose objects, e.g. after gc removed them."""
+    presence = _cache.pop(repo_dir, None)
+    if presence is not None:
+        with presence._lock:
+            presence.added, presence.dirty = [], False
+    with LockFile(get_bloom_path(repo_dir)) as lock:
+        lock.write(build_bloom(repo_dir).serialize())
+        lock.commit()
+
+
+def flush_all():
+    """Persist the filters of every repository this process wrote objects to."""
+    for presence in list(_cache.values()):
+        presence.flush()
+
+
+def _register_flush():
+    global _flush_registered
+    if not _flush_registered:
+        _flush_registered = True
+        atexit.register(flush_all)
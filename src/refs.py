@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Branch references: loose ref files and the packed-refs file.
+
+A branch is either a loose ref, `.pit/refs/heads/<name>` holding a commit hash, or a line
+of `.pit/packed-refs`. A loose ref overrides the packed entry of the same branch, so
+committing keeps writing a single small file, while repositories with many branches keep
+most of them in the packed file and read it once instead of opening one file per branch.
+
+packed-refs is a text file sorted by ref name:
+
+    # pit packed-refs sorted
+    <commit hash> refs/heads/<name>
+
+Single lookups binary search the memory-mapped file, listing walks it in order.
+`update_refs` applies many ref changes with a single rename of the packed file.
+
+Every ref file is replaced through its lock file (`<ref>.lock`, `packed-refs.lock`), see
+`lockfile`.
+"""
+
+import mmap
+import os
+
+from src import trace
+from src.constants import PIT_DIR
+from src.lockfile import LOCK_SUFFIX, LockFile
+
+PACKED_REFS_HEADER = b"# pit packed-refs sorted\n"
+HEADS_PREFIX = "refs/heads/"
+
+_cache = {}
+
+
+def get_packed_refs_path(repo_dir):
+    """Return the path of the packed-refs file of the given repository."""
+    return os.path.join(repo_dir, PIT_DIR, "packed-refs")
+
+
+def get_ref_path(repo_dir, branch):
+    """Return the path of the loose ref of a branch."""
+    return os.path.join(repo_dir, PIT_DIR, "refs", "heads", branch)
+
+
+class PackedRefs:
+    """
+    A memory-mapped packed-refs file, for looking up or listing refs by name.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._start = len(PACKED_REFS_HEADER) if self._data[:1] == b"#" else 0
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def _line_at(self, offset):
+        """Return the start, end and (name, hash) of the line containing an offset."""
+        start = max(self._data.rfind(b"\n", self._start, offset) + 1, self._start)
+        end = self._data.find(b"\n", offset)
+        end = len(self._data) if end == -1 else end
+        object_hash, _, name = self._data[start:end].partition(b" ")
+        return start, end, name.decode("utf-8"), object_hash.decode("ascii")
+
+    def get(self, name):
+        """Return the hash of a full ref name, e.g. "refs/heads/main", or None."""
+        low, high = self._start, len(self._data)
+        while low < high:
+            start, end, candidate, object_hash = self._line_at((low + high) // 2)
+            if candidate < name:
+                low = end + 1
+            elif candidate > name:
+                high = start
+            else:
+                return object_hash
+        return None
+
+    def items(self):
+        """Yield (full ref name, hash) pairs in name order."""
+        offset = self._start
+        while offset < len(self._data):
+            _, end, name, object_hash = self._line_at(offset)
+            if name:
+                yield name, object_hash
+            offset = end + 1
+
+
+@trace.traced("refs.read_packed")
+def read_packed_refs(repo_dir):
+    """
+    Return the packed refs of a repository, opening the file once per process.
+
+    The file is reopened when it is replaced. Returns None if there are no packed refs.
+    """
+    path = get_packed_refs_path(repo_dir)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    if cached:
+        cached[1].close()
+    packed = PackedRefs(path)
+    _cache[path] = (key, packed)
+    return packed
+
+
+def _read_loose(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+def read_ref(repo_dir, branch):
+    """
+    Return the commit hash a branch points to: its loose ref, else its packed entry.
+
+    Returns:
+        str: The commit hash, or None if the branch does not exist or has no commits.
+    """
+    loose = _read_loose(get_ref_path(repo_dir, branch))
+    if loose is not None:
+        return loose
+    packed = read_packed_refs(repo_dir)
+    return packed.get(HEADS_PREFIX + branch) if packed else None
+
+
+def ref_exists(repo_dir, branch):
+    """Check whether a branch exists, as a loose or a packed ref."""
+    if os.path.isfile(get_ref_path(repo_dir, branch)):
+        return True
+    packed = read_packed_refs(repo_dir)
+    return bool(packed and packed.get(HEADS_PREFIX + branch))
+
+
+def _loose_refs(repo_dir):
+    """Return {branch: hash} for every loose ref, nested branch names included."""
+    heads_dir = os.path.join(repo_dir, PIT_DIR, "refs", "heads")
+    refs = {}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(heads_dir, rel_dir)) as it:
+                for entry in it:
+                    name = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(name)
+                    elif not entry.name.endswith(LOCK_SUFFIX):
+                        object_hash = _read_loose(entry.path)
+                        if object_hash:
+                            refs[name] = object_hash
+        except FileNotFoundError:
+            continue
+    return refs
+
+
+def list_refs(repo_dir):
+    """
+    Return every branch of a repository, loose refs overriding packed ones.
+
+    Returns:
+        dict: A mapping of branch name to commit hash, sorted by name.
+    """
+    refs = {}
+    packed = read_packed_refs(repo_dir)
+    if packed:
+        for name, object_hash in packed.items():
+            if name.startswith(HEADS_PREFIX):
+                refs[name[len(HEADS_PREFIX) :]] = object_hash
+    refs.update(_loose_refs(repo_dir))
+    return dict(sorted(refs.items()))
+
+
+@trace.traced("refs.write")
+def write_ref(repo_dir, branch, commit_hash, lock=None):
+    """
+    Point a branch to a commit by replacing its loose ref.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        branch (str): The branch name.
+        commit_hash (str): The commit the branch points to.
+        lock (LockFile): The lock of the ref, if the caller already holds it. It is released.
+    """
+    with lock or LockFile(get_ref_path(repo_dir, branch)) as ref_lock:
+        ref_lock.write(commit_hash)
+        ref_lock.commit()
+
+
+def _write_packed_refs(lock, refs):
+    """Replace packed-refs with the given {branch: hash} through its held lock."""
+    lines = [PACKED_REFS_HEADER]
+    for branch, object_hash in sorted(refs.items()):
+        lines.append(f"{object_hash} {HEADS_PREFIX}{branch}\n".encode("utf-8"))
+    lock.write(b"".join(lines))
+    lock.commit()
+
+
+def _remove_loose(repo_dir, loose):
+    """Remove loose refs that are packed, unless they were changed in the meantime."""
+    heads_dir = os.path.join(repo_dir, PIT_DIR, "refs", "heads")
+    for branch, packed_hash in loose.items():
+        path = get_ref_path(repo_dir, branch)
+        with LockFile(path):
+            if _read_loose(path) != packed_hash:
+                continue
+            os.remove(path)
+        # Drop the directories of nested branch names once empty
+        parent = os.path.dirname(get_ref_path(repo_dir, branch))
+        while parent != heads_dir:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+
+def pack_refs(repo_dir):
+    """
+    Move every loose ref into packed-refs.
+
+    Returns:
+        dict: All branches after packing, see `list_refs`.
+    """
+    with LockFile(get_packed_refs_path(repo_dir)) as lock:
+        return _pack_refs(repo_dir, lock)
+
+
+def _pack_refs(repo_dir, lock):
+    """
+    Pack the loose refs while holding the packed-refs lock, and hold it again afterwards.
+
+    Returns:
+        dict: All branches once the lock is held again, see `list_refs`.
+    """
+    loose = _loose_refs(repo_dir)
+    if loose:
+        _write_packed_refs(lock, list_refs(repo_dir))
+        _remove_loose(repo_dir, loose)
+        lock.acquire()
+    return list_refs(repo_dir)
+
+
+@trace.traced("refs.update")
+def update_refs(repo_dir, updates):
+    """
+    Apply many ref changes at once: either all of them are visible or none is.
+
+    The loose refs are packed first, which leaves every value unchanged, then the updated
+    table is written with a single rename of packed-refs.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        updates (dict): A mapping of branch name to its new commit hash, or None to
+            delete the branch.
+
+    Returns:
+        dict: All branches after the update, see `list_refs`.
+    """
+    with LockFile(get_packed_refs_path(repo_dir)) as lock:
+        refs = _pack_refs(repo_dir, lock)
+        for branch, commit_hash in updates.items():
+            if commit_hash is None:
+                refs.pop(branch, None)
+            else:
+                refs[branch] = commit_hash
+        _write_packed_refs(lock, refs)
+    return dict(sorted(refs.items()))
@@ -7,17 +7,26 @@ The repository structure:
 - `.pit/refs/heads`: Stores branch references.
 - `.pit/HEAD`: Tracks the current branch.
 - `.pit/index`: Serves as a staging area.
-- `.pit/config`: Contains user configuration.
+- `.pit/config`: Contains user and core configuration (e.g. the object compression level).
 
 Usage:
 Run this script to create a `.pit` directory in the current working directory.
 
+It also defines `Repository`, the context every command works with: the repository is
+found once per invocation, and HEAD, the branch refs and the index are read at most once.
 """
 
 import os
+from contextlib import contextmanager
 
-from src.constants import MAIN_BRANCH, PIT_DIR
-from src.utils import write_file
+from src.config import DEFAULT_COMPRESSION_LEVEL
+from src.constants import MAIN_BRANCH, NOT_A_REPO_MESSAGE, PIT_DIR
+from src.index import get_index_path, read_index, write_index
+from src.lockfile import LockFile, write_locked
+from src.objects import read_commit
+from src.refs import (get_ref_path, list_refs, read_ref, ref_exists,
+                      update_refs, write_ref)
+from src.utils import get_repo_dir, read_file, staged_against, write_file
 
 
 def init_repo(args):
@@ -46,6 +55,230 @@ def init_repo(args):
     os.makedirs(f"{PIT_DIR}/refs/heads")
     write_file(f"{PIT_DIR}/HEAD", f"ref: refs/heads/{MAIN_BRANCH}\n")
     write_file(f"{PIT_DIR}/index", "")
-    write_file(f"{PIT_DIR}/config", "[user]\n\tname = Your Name\n\temail = email@example.com\n")
+    write_file(
+        f"{PIT_DIR}/config",
+        "[user]\n\tname = Your Name\n\temail = email@example.com\n"
+        f"[core]\n\tcompression = {DEFAULT_COMPRESSION_LEVEL}\n",
+    )
 
-    print(f"Initialized empty repository in {PIT_DIR}/")
\ No newline at end of file
+    print(f"Initialized empty repository in {PIT_DIR}/")
+
+class Repository:
+    """
+    A repository as seen by one pit invocation.
+
+    The root is found once. HEAD, the branch refs and the index are read on first use and
+    kept: the write methods update the kept values along with the files, and `invalidate`
+    forgets them when the files may have changed behind the object's back. Changes made to
+    `index` in place are only seen by `staged_files` once saved with `write_index`.
+
+    Commands that read, change and write back the index or a ref do it inside `lock_index`
+    and `lock_ref`, which read the file again once the lock is held, so concurrent pit
+    processes never overwrite each other's changes. Lock the index before any ref.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.pit_dir = os.path.join(root, PIT_DIR)
+        self._commits = {}  # Commits never change, they are kept across invalidations
+        self._index_lock = None
+        self._ref_locks = {}
+        self.invalidate()
+
+    @classmethod
+    def discover(cls, start_dir=None):
+        """Return the repository containing a directory (default: the current one), or None."""
+        root = get_repo_dir(start_dir)
+        return cls(root) if root else None
+
+    def invalidate(self):
+        """Forget HEAD, the refs and the index, they are read again on next use."""
+        self._branch = None
+        self._refs = {}
+        self._all_refs = None
+        self._index = None
+        self._index_stat = None
+        self._staged = None
+
+    @property
+    def current_branch(self):
+        """The branch HEAD points to."""
+        if self._branch is None:
+            head = read_file(os.path.join(self.pit_dir, "HEAD")) or ""
+            self._branch = head.strip().split(": ")[-1].split("/")[-1] or MAIN_BRANCH
+        return self._branch
+
+    @property
+    def head(self):
+        """The commit hash of the current branch, or None if it has no commits yet."""
+        return self.read_ref(self.current_branch)
+
+    def branch_exists(self, branch):
+        if self._all_refs is not None:
+            return branch in self._all_refs
+        return ref_exists(self.root, branch)
+
+    def read_ref(self, branch):
+        """Return the commit hash a branch points to, or None, see `refs.read_ref`."""
+        if self._all_refs is not None:
+            return self._all_refs.get(branch)
+        if branch not in self._refs:
+            self._refs[branch] = read_ref(self.root, branch)
+        return self._refs[branch]
+
+    def branches(self):
+        """Return every branch, a mapping of name to commit hash sorted by name."""
+        if self._all_refs is None:
+            self._all_refs = list_refs(self.root)
+        return self._all_refs
+
+    @contextmanager
+    def lock_ref(self, branch):
+        """Hold the lock of a branch ref; the ref is read again and written through it."""
+        with LockFile(get_ref_path(self.root, branch)) as lock:
+            self._refs.pop(branch, None)
+            self._all_refs = None
+            self._ref_locks[branch] = lock
+            try:
+                yield lock
+            finally:
+                self._ref_locks.pop(branch, None)
+
+    def write_ref(self, branch, commit_hash):
+        """Point a branch to a commit."""
+        write_ref(self.root, branch, commit_hash, self._ref_locks.pop(branch, None))
+        self._refs[branch] = commit_hash
+        if self._all_refs is not None:
+            self._all_refs = dict(sorted({**self._all_refs, branch: commit_hash}.items()))
+        if branch == self.current_branch:
+            self._staged = None
+
+    def update_refs(self, updates):
+        """
+        Apply many ref changes at once, see `refs.update_refs`.
+
+        Args:
+            updates (dict): A mapping of branch name to its new commit hash, or None to
+                delete the branch.
+        """
+        self._all_refs = update_refs(self.root, updates)
+        self._refs = {}
+        if self.current_branch in updates:
+            self._staged = None
+
+    def set_head(self, branch):
+        """Make HEAD point to a branch."""
+        write_locked(os.path.join(self.pit_dir, "HEAD"), f"ref: refs/heads/{branch}")
+        self._branch = branch
+        self._staged = None
+
+    def commit(self, commit_hash):
+        """Return a commit, see `objects.read_commit`; each one is only read once."""
+        if commit_hash not in self._commits:
+            self._commits[commit_hash] = read_commit(self.root, commit_hash)
+        return self._commits[commit_hash]
+
+    def resolve(self, name):
+        """
+        Resolve a revision name to a commit hash.
+
+        Args:
+            name (str): "HEAD", a branch name or a full commit hash.
+
+        Returns:
+            str: The commit hash, or None if the name does not resolve to a commit.
+        """
+        if name == "HEAD":
+            return self.head
+        if self.read_ref(name):
+            return self.read_ref(name)
+        try:
+            is_hash = len(name) == 40 and int(name, 16) >= 0
+        except ValueError:
+            is_hash = False
+        if is_hash and self.commit(name) is not None:
+            return name
+        return None
+
+    @property
+    def index(self):
+        """The index, a mapping of relative path to IndexEntry."""
+        if self._index is None:
+            self._index_stat = _stat_key(get_index_path(self.root))
+            self._index = read_index(self.root)
+        return self._index
+
+    @contextmanager
+    def lock_index(self):
+        """
+        Hold `index.lock`: the index is read again and `write_index` writes through the lock.
+
+        Yields:
+            dict: The index, as read while holding the lock.
+        """
+        with LockFile(get_index_path(self.root)) as lock:
+            self._index = None
+            self._staged = None
+            self._index_lock = lock
+            try:
+                yield self.index
+            finally:
+                self._index_lock = None
+
+    def write_index(self, index=None):
+        """Save the index, by default the one held by the repository."""
+        self._index = self.index if index is None else index
+        write_index(self.root, self._index, self._index_lock)
+        self._index_lock = None
+        self._index_stat = _stat_key(get_index_path(self.root))
+        self._staged = None
+
+    def refresh_index(self):
+        """
+        Save the stat data refreshed in the held index, if that is safe without waiting.
+
+        Nothing is written if another process holds the index lock or changed the index
+        since it was read: refreshed stat data only saves rehashing next time.
+        """
+        lock = LockFile(get_index_path(self.root))
+        if not lock.try_acquire():
+            return
+        with lock:
+            if _stat_key(get_index_path(self.root)) == self._index_stat:
+                self._index_lock = lock
+                self.write_index()
+
+    def staged_files(self):
+        """The sorted paths whose index entry differs from the latest commit."""
+        if self._staged is None:
+            head = self.head
+            self._staged = staged_against(
+                self.root, self.index, self.commit(head) if head else None
+            )
+        return self._staged
+
+    def tracked_files(self):
+        return list(self.index)
+
+    def file_hash(self, path):
+        """Return the indexed hash of a file, or None if it is not tracked."""
+        entry = self.index.get(path)
+        return entry.hash if entry else None
+
+
+def _stat_key(path):
+    """Return what identifies a version of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def require_repo():
+    """Return the repository containing the current directory, exit if there is none."""
+    repo = Repository.discover()
+    if repo is None:
+        print(NOT_A_REPO_MESSAGE)
+        exit(1)
+    return repo
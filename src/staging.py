@@ -4,19 +4,24 @@ A module for managing file staging in a simple distributed source control system
 
 This script provides functionality to hash files and stage them for committing to the repository. 
 It uses SHA-1 hashing to create a unique identifier for each file and stores them in the `.repo/objects` directory. 
-The files are then listed in the `.repo/index` file for further processing in the source control system.
+The files are then listed, together with their stat data, in the `.pit/index` file for further
+processing in the source control system.
 
 Functions:
 - hash_file: Computes the SHA-1 hash of a file.
+- stage_file: Hashes a file and stores its object in a single read.
 - add_files: Stages the specified files by adding them to the repository and updating the index.
 """
 
-import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from src.constants import PIT_DIR
-from src.utils import (ensure_repo, get_repo_dir, get_staged_files,
-                       split_object_hash)
+from src import trace
+from src.index import get_index_mtime_ns, make_entry, stat_matches
+from src.objects import store_blob
+from src.repository import require_repo
+from src.utils import compute_file_hash
+from src.worktree import DELETED, MODIFIED, UNTRACKED, scan_worktree
 
 
 def hash_file(abs_file):
@@ -29,56 +34,121 @@ def hash_file(abs_file):
     Returns:
         str: The SHA-1 hash of the file as a hexadecimal string.
     """
-    with open(abs_file, "rb") as f:
-        return hashlib.sha1(f.read()).hexdigest()
+    return compute_file_hash(abs_file)
 
 
-def add_files(args):
+def stage_file(repo_dir, relative_file):
+    """
+    Hashes a file and stores it in `.pit/objects`, reading its content only once.
+
+    The content is streamed through the hasher and into the object store in bounded chunks,
+    see `store_blob`. Safe to call from several threads at once.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        relative_file (str): The path of the file relative to the repository root.
+
+    Returns:
+        tuple: The relative path, the SHA-1 hash of the file and its `os.stat_result`.
+    """
+    with open(os.path.join(repo_dir, relative_file), "rb") as src:
+        # Stat the open file so the stat data describes the content that was read
+        st = os.fstat(src.fileno())
+        file_hash = store_blob(repo_dir, src, st.st_size)
+    return relative_file, file_hash, st
+
+
+def add_files(args, repo=None):
     """
      Stages files by adding them to the repository and updating the index file.
 
     The files specified in the `args.files` list are added to the `.pit/objects` directory
     and the `.pit/index` file is updated with the file name and its corresponding SHA-1 hash.
+    Directories are expanded to their new, modified and deleted files, skipping ignored ones.
+    Changed files are hashed and written by a pool of `args.jobs` threads.
     If a file does not exist or the repository is not initialized, an appropriate message is printed.
 
     Args:
-        args: The parsed command-line arguments, which include a list of files to be staged.
+        args: The parsed command-line arguments, which include a list of files to be staged
+            and optionally the number of worker threads to use (`jobs`).
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory.
 
     Prints:
         A message indicating the files that have been staged, or errors if files are missing
         or the repository is not initialized.
     """
 
-    # Get repo dir to enable calling the command from anypoint within the repo tree
-    repo_dir = get_repo_dir()
-    # Make sure repo has been initialized
-    ensure_repo(repo_dir)
-    # Get files already in stating
-    files_in_stage = get_staged_files(repo_dir)
+    # Find the repo to enable calling the command from anypoint within the repo tree, and
+    # make sure it has been initialized
+    repo = repo or require_repo()
+    repo_dir = repo.root
+    jobs = getattr(args, "jobs", None)
+    if jobs is not None and jobs < 1:
+        print("Error: --jobs must be at least 1.")
+        return
+    # Get files already in the index
+    index_entries = repo.index
+    index_mtime_ns = get_index_mtime_ns(repo_dir)
+
+    # Resolve the arguments into the files to stage. Directories are expanded with the
+    # working tree scanner, which skips ignored and unchanged files in the same walk
+    files_to_stage = []
+    deleted_files = []
+    refreshed = set()
+    for file in args.files:
+        # Since we can run this command from anywhere within the repo tree, we need the -
+        # absolute file path based on the current working dir
+        abs_file = os.path.abspath(os.path.join(os.getcwd(), file))
+        # Get the relative file path (relative to base repo dir) to be able to compare with -
+        # files in the repo tree
+        relative_file = os.path.relpath(abs_file, repo_dir).replace(os.sep, "/")
+        if os.path.isdir(abs_file):
+            for entry in scan_worktree(
+                repo_dir, index_entries, set(), relative_file, refreshed=refreshed
+            ):
+                if entry.kind in (UNTRACKED, MODIFIED):
+                    files_to_stage.append(entry.path)
+                elif entry.kind == DELETED:
+                    deleted_files.append(entry.path)
+        elif os.path.exists(abs_file):
+            files_to_stage.append(relative_file)
+        else:
+            print(f"File {abs_file} not found.")
+
+    # Unchanged stat data means the indexed content is still current, skip rehashing
+    changed_files = []
+    for relative_file in files_to_stage:
+        entry = index_entries.get(relative_file)
+        st = os.stat(os.path.join(repo_dir, relative_file))
+        trace.count("files_stat")
+        if not (entry and stat_matches(entry, st, index_mtime_ns)):
+            changed_files.append(relative_file)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(lambda f: stage_file(repo_dir, f), changed_files))
 
+    # Only the index update is serialized with other pit processes: the index is read
+    # again under its lock and the new entries are applied to that version
     staged_files = []
-    with open(os.path.join(repo_dir, PIT_DIR, "index"), "a", encoding="utf-8") as index: # use absolute path
-        for file in args.files:
-            # Since we can run this command from anywhere within the repo tree, we need the -
-            # absolute file path based on the current working dir
-            abs_file = os.path.join(os.path.abspath(os.getcwd()), file)
-            if not os.path.exists(abs_file):
-                print(f"File {abs_file} not found.")
-                continue
-            # Get the relative file path (relative to base repo dir) to be able to compare with -
-            # files in the repo tree
-            relative_file = abs_file.split(repo_dir)[-1][1:]
-            if relative_file in [i.split()[0] for i in files_in_stage]:
-                if hash := hash_file(file) in [i.split()[1] for i in files_in_stage]:
-                    continue
-            file_hash = hash_file(abs_file)
-            file_hash_folder, file_hash_name = split_object_hash(file_hash)
-            file_object_dir = os.path.join(repo_dir, PIT_DIR, "objects", file_hash_folder)
-            os.makedirs(file_object_dir, exist_ok=True)
-            object_path = os.path.join(file_object_dir, file_hash_name)
-            with open(object_path, "wb") as obj:
-                with open(abs_file, "rb") as src:
-                    obj.write(src.read())
-            index.write(f"{relative_file} {file_hash}\n")
-            staged_files.append(relative_file)
+    scanned_entries = index_entries
+    with repo.lock_index() as index_entries:
+        # Entries the scan refreshed in place, e.g. a new mode with the same content
+        for relative_file in refreshed:
+            entry = index_entries.get(relative_file)
+            if entry and entry.hash == scanned_entries[relative_file].hash:
+                index_entries[relative_file] = scanned_entries[relative_file]
+
+        for relative_file, file_hash, st in results:
+            entry = index_entries.get(relative_file)
+            index_entries[relative_file] = make_entry(relative_file, file_hash, st)
+            if not (entry and entry.hash == file_hash):
+                staged_files.append(relative_file)
+
+        for relative_file in deleted_files:
+            if index_entries.pop(relative_file, None) is not None:
+                staged_files.append(relative_file)
+
+        # Rewrite the index once for the whole batch
+        repo.write_index(index_entries)
     print(f"Staged files: {', '.join(staged_files)}")
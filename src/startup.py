@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Measures where the start of a pit command goes (`pit --profile-startup <command>`).
+
+Every module imported while profiling is timed: its cumulative time includes the modules it
+imports, its self time does not. The report also splits the whole run into imports, parser
+setup and the command itself, and is written to stderr so the output of the command is
+unchanged.
+"""
+
+import sys
+import time
+from importlib.abc import MetaPathFinder
+
+
+class _TimedLoader:
+    """Wraps a loader to time the execution of the module it loads."""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler.enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.leave(module.__name__)
+
+
+class StartupProfiler(MetaPathFinder):
+    """
+    Times module imports and the phases of a command run.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.marks = []  # (phase, end time) in order
+        self.modules = {}  # name -> (cumulative seconds, self seconds)
+        self._stack = []  # [start time, seconds spent in nested imports]
+
+    def start(self):
+        """Start timing imports."""
+        sys.meta_path.insert(0, self)
+
+    def stop(self):
+        """Stop timing imports."""
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def mark(self, phase):
+        """Record the end of a phase of the run."""
+        self.marks.append((phase, time.perf_counter()))
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def enter(self):
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def leave(self, name):
+        started, nested = self._stack.pop()
+        cumulative = time.perf_counter() - started
+        self.modules[name] = (cumulative, cumulative - nested)
+        if self._stack:
+            self._stack[-1][1] += cumulative
+
+    def report(self, out=None, limit=25):
+        """
+        Write the slowest imports and the time of each phase.
+
+        Args:
+            out: The stream to write to. Defaults to stderr.
+            limit (int): The number of modules to list.
+        """
+        out = out or sys.stderr
+        out.write("Startup profile (ms)\n\n")
+        out.write(f"{'cumulative':>10} {'self':>8}  module\n")
+        ranked = sorted(self.modules.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (cumulative, own) in ranked[:limit]:
+            out.write(f"{cumulative * 1000:10.2f} {own * 1000:8.2f}  {name}\n")
+        if len(ranked) > limit:
+            out.write(f"{'':>20}  ... {len(ranked) - limit} more modules\n")
+
+        out.write("\n")
+        previous = self.start_time
+        for phase, end in self.marks:
+            out.write(f"{phase:<10} {(end - previous) * 1000:8.2f}\n")
+            previous = end
+        total = previous - self.start_time
+        out.write(f"{'total':<10} {total * 1000:8.2f}\n")
@@ -2,27 +2,65 @@
 """
 This script checks for the status of the files in the repository
 """
-from src.utils import (get_modified_files, get_repo_dir, get_staged_files,
-                       get_untracked_files)
+from src.daemon_client import query_daemon
+from src.repository import Repository
+from src.worktree import (DELETED, MODIFIED, STAGED, UNTRACKED,
+                          scan_worktree)
 
 
-def status(args):
+def scan_status(repo):
+    """
+    Classify the files of the repository by walking the working tree once.
+
+    Args:
+        repo (Repository): The repository.
+
+    Returns:
+        dict: The sorted paths of each kind: STAGED, MODIFIED, DELETED and UNTRACKED.
+    """
+    index_entries = repo.index
+    refreshed = set()
+    files = {STAGED: [], MODIFIED: [], DELETED: [], UNTRACKED: []}
+    for entry in scan_worktree(
+        repo.root,
+        index_entries,
+        set(repo.staged_files()),
+        refreshed=refreshed,
+    ):
+        files[entry.kind].append(entry.path)
+
+    # Save the stat data of files that were rehashed but found unchanged
+    if refreshed:
+        repo.refresh_index()
+    return {kind: sorted(paths) for kind, paths in files.items()}
+
+
+def status(args, repo=None):
     """
     Display the current status of the repository, showing staged, modified, and untracked files.
 
+    A running `pit daemon` answers from its in-memory state; otherwise the working tree is
+    walked once and the scan classifies every file in a single pass.
+
     Args:
         args: Command-line arguments (not used here, but required for CLI framework).
+        repo (Repository): The repository. Defaults to the one containing the current
+            directory.
     """
-    repo_dir = get_repo_dir()
+    repo = repo or Repository.discover()
 
-    if not repo_dir:
+    if not repo:
         print("Error: Not a Pit repository (or any of the parent directories.)")
         return
 
     # Get staged, modified, and untracked files
-    staged_files = get_staged_files(repo_dir)
-    modified_files = get_modified_files(repo_dir)
-    untracked_files = get_untracked_files(repo_dir)
+    files = query_daemon(repo.root, "status")
+    if files is None or "error" in files:
+        files = scan_status(repo)
+
+    staged_files = files[STAGED]
+    modified_files = files[MODIFIED] + [f"{path} (deleted)" for path in files[DELETED]]
+    untracked_files = files[UNTRACKED]
 
     # Print status
     print("Repo status:")
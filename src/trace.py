@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Tracing: where the time of a pit command goes (`PIT_TRACE=1` or `pit --trace`).
+
+While tracing is on, spans record when the phases of a command start and how long they take:
+repository discovery, `.pitignore` parsing, the working tree walk, hashing, object reads and
+writes, index and ref updates, tree and line diffs. Counters add up the work done: files
+stat'd, bytes hashed, objects read and written.
+
+When the command ends the trace is written in the Chrome trace event format, which
+chrome://tracing, Perfetto and speedscope load. It goes to stderr with `PIT_TRACE=1` or
+`--trace`, or to a file with `PIT_TRACE=<path>` or `--trace-file <path>`. Spans of worker
+threads (`add`, `clone`) are shown on tracks of their own.
+
+While tracing is off, a span or a counter costs a flag check.
+"""
+
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+
+TRACE_ENV = "PIT_TRACE"
+# PIT_TRACE values that send the trace to stderr; any other value is a file path
+_STDERR_VALUES = {"1", "true", "yes", "on", "stderr"}
+_OFF_VALUES = {"", "0", "false", "no", "off"}
+# inspect.CO_GENERATOR, without importing inspect at startup
+_CO_GENERATOR = 0x20
+
+_enabled = False
+_target = None
+_start_ns = 0
+_events = []
+_counters = {}
+_lock = threading.Lock()
+_NO_SPAN = contextlib.nullcontext()
+
+
+def start(target):
+    """
+    Start tracing.
+
+    Args:
+        target (str): Where the trace goes: "1" (or "true", "stderr") for stderr, a path for
+            a file. None, "" or "0" leave tracing off.
+
+    Returns:
+        bool: Whether tracing is on.
+    """
+    global _enabled, _target, _start_ns
+    if target is None or target.strip().lower() in _OFF_VALUES:
+        return False
+    _target = target if target.lower() in _STDERR_VALUES else os.path.abspath(target)
+    _events.clear()
+    _counters.clear()
+    _start_ns = time.perf_counter_ns()
+    _enabled = True
+    return True
+
+
+def is_enabled():
+    return _enabled
+
+
+def _timestamp(ns):
+    """Return a trace timestamp, microseconds since tracing started."""
+    return (ns - _start_ns) / 1000
+
+
+class _Span:
+    __slots__ = ("name", "args", "start_ns")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event = {
+            "name": self.name,
+            "cat": "pit",
+            "ph": "X",
+            "ts": _timestamp(self.start_ns),
+            "dur": (time.perf_counter_ns() - self.start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if self.args:
+            event["args"] = self.args
+        _events.append(event)
+        return False
+
+
+def span(name, /, **args):
+    """
+    Return a context manager recording its block as a span.
+
+    Args:
+        name (str): The name of the span, e.g. "index.read".
+        **args: Details shown with the span, e.g. a path.
+    """
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name, args)
+
+
+def traced(name):
+    """
+    Decorate a function to record each of its calls as a span.
+
+    The span of a generator function lasts until the generator is exhausted, including the
+    time its caller spends between items.
+    """
+
+    def decorate(function):
+        if function.__code__.co_flags & _CO_GENERATOR:
+
+            @functools.wraps(function)
+            def generator(*args, **kwargs):
+                if not _enabled:
+                    return (yield from function(*args, **kwargs))
+                with _Span(name, None):
+                    return (yield from function(*args, **kwargs))
+
+            return generator
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(name, None):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def count(name, amount=1):
+    """Add to a counter of the trace, e.g. "bytes_hashed"."""
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def counters():
+    """Return a copy of the counters of the current trace."""
+    with _lock:
+        return dict(_counters)
+
+
+def finish():
+    """
+    Stop tracing and write the trace, if tracing is on.
+
+    Returns:
+        dict: The trace, in the Chrome trace event format, or None if tracing was off.
+    """
+    global _enabled
+    if not _enabled:
+        return None
+    _enabled = False
+    import json
+
+    pid, main_tid = os.getpid(), threading.main_thread().ident
+    events = list(_events)
+    totals = counters()
+    if totals:
+        events.append(
+            {
+                "name": "counters",
+                "cat": "pit",
+                "ph": "C",
+                "ts": _timestamp(time.perf_counter_ns()),
+                "pid": pid,
+                "tid": main_tid,
+                "args": totals,
+            }
+        )
+    for tid in sorted({event["tid"] for event in events}):
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": "main" if tid == main_tid else f"worker {tid}"},
+            }
+        )
+    trace = {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {"command": " ".join(sys.argv[1:]), "counters": totals},
+    }
+
+    text = json.dumps(trace)
+    if _target.lower() in _STDERR_VALUES:
+        sys.stderr.write(text + "\n")
+    else:
+        with open(_target, "w", encoding="utf-8") as f:
+            f.write(text)
+    return trace
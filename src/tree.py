@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Tree objects: the hierarchical snapshot of the repository recorded by each commit.
+
+A tree object lists the entries of one directory, sorted by name, one per line:
+
+    100644 blob <hash> <name>
+    100755 blob <hash> <name>
+    40000 tree <hash> <name>
+
+`write_tree` builds the trees from the index. The index caches the tree hash of every
+directory whose content has not changed since its tree was written (its `cache_tree`), so
+only the directories on the path of a changed file are rebuilt and written; every other
+subtree is reused by hash without being read.
+
+`diff_trees` compares two trees, or a tree and the index, descending only into directories
+whose hashes differ.
+"""
+
+from collections import namedtuple
+
+from src import trace
+from src.objects import read_object, write_object
+
+TREE_MODE = "40000"
+FILE_MODE = "100644"
+EXECUTABLE_MODE = "100755"
+
+TreeEntry = namedtuple("TreeEntry", ["mode", "type", "hash", "name"])
+
+
+def file_mode(st_mode):
+    """Return the tree mode of a file given its `st_mode`."""
+    return EXECUTABLE_MODE if st_mode & 0o111 else FILE_MODE
+
+
+def format_tree(entries):
+    """Serialize tree entries into the content of a tree object."""
+    lines = [
+        f"{entry.mode} {entry.type} {entry.hash} {entry.name}"
+        for entry in sorted(entries, key=lambda e: e.name)
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+
+def parse_tree(content):
+    """Parse the content of a tree object into a list of TreeEntry."""
+    entries = []
+    for line in content.decode("utf-8").splitlines():
+        if line:
+            mode, obj_type, object_hash, name = line.split(" ", 3)
+            entries.append(TreeEntry(mode, obj_type, object_hash, name))
+    return entries
+
+
+def read_tree(repo_dir, tree_hash):
+    """
+    Read the entries of a tree object.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        tree_hash (str): The hash of the tree, or None for an empty tree.
+
+    Returns:
+        list: The TreeEntry of each file and sub directory.
+    """
+    if not tree_hash:
+        return []
+    obj_type, content = read_object(repo_dir, tree_hash)
+    if obj_type != "tree":
+        raise ValueError(f"Object {tree_hash} is not a tree")
+    return parse_tree(content)
+
+
+def nest_index(index):
+    """
+    Arrange the index entries into nested directories.
+
+    Directories whose tree hash is cached in the index are not expanded: they are
+    represented by that hash.
+
+    Args:
+        index (Index): The index.
+
+    Returns:
+        The tree hash of the root directory if it is cached, else a (files, dirs) tuple where
+        files maps names to IndexEntry and dirs maps names to nested directories or hashes.
+    """
+    cache_tree = getattr(index, "cache_tree", {})
+    if "" in cache_tree:
+        return cache_tree[""]
+
+    root = ({}, {})
+    for path, entry in index.items():
+        node = root
+        prefix = ""
+        *dir_names, file_name = path.split("/")
+        for name in dir_names:
+            prefix = f"{prefix}/{name}" if prefix else name
+            child = node[1].get(name)
+            if child is None:
+                child = cache_tree.get(prefix) or ({}, {})
+                node[1][name] = child
+            if isinstance(child, str):
+                break  # The directory is unchanged, its tree is reused as a whole
+            node = child
+        else:
+            node[0][file_name] = entry
+    return root
+
+
+@trace.traced("tree.write")
+def write_tree(repo_dir, index):
+    """
+    Write the tree objects of the index and return the hash of the root tree.
+
+    Only directories without a cached tree hash are serialized and written; the hashes of
+    the new trees are stored in the index's cache so the next call can reuse them. The
+    caller is responsible for writing the index back to keep that cache.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        index (Index): The index to write the trees of.
+
+    Returns:
+        str: The hash of the root tree.
+    """
+
+    def build(prefix, node):
+        if isinstance(node, str):
+            return node
+        files, dirs = node
+        entries = [
+            TreeEntry(file_mode(entry.mode), "blob", entry.hash, name)
+            for name, entry in files.items()
+        ]
+        for name, child in dirs.items():
+            child_prefix = f"{prefix}/{name}" if prefix else name
+            entries.append(TreeEntry(TREE_MODE, "tree", build(child_prefix, child), name))
+        tree_hash = write_object(repo_dir, format_tree(entries), "tree")
+        index.cache_tree[prefix] = tree_hash
+        return tree_hash
+
+    return build("", nest_index(index))
+
+
+def _children(repo_dir, node):
+    """Map the names in a tree hash or nested index directory to (mode, hash or node)."""
+    if node is None:
+        return {}
+    if isinstance(node, str):
+        return {
+            entry.name: (entry.mode, entry.hash) for entry in read_tree(repo_dir, node)
+        }
+    files, dirs = node
+    children = {name: (file_mode(entry.mode), entry.hash) for name, entry in files.items()}
+    children.update({name: (TREE_MODE, child) for name, child in dirs.items()})
+    return children
+
+
+def walk_tree(repo_dir, node, prefix=""):
+    """
+    Yield (path, mode, hash) for every file of a tree.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        node: A tree hash, a nested index directory from `nest_index`, or None.
+        prefix (str): The path of the tree relative to the repository root.
+    """
+    for name, (mode, child) in sorted(_children(repo_dir, node).items()):
+        path = f"{prefix}/{name}" if prefix else name
+        if mode == TREE_MODE:
+            yield from walk_tree(repo_dir, child, path)
+        else:
+            yield path, mode, child
+
+
+@trace.traced("tree.diff")
+def diff_trees(repo_dir, old, new, prefix=""):
+    """
+    Yield the files that differ between two trees, skipping subtrees with equal hashes.
+
+    Each side is a tree hash, a nested index directory from `nest_index`, or None for an
+    empty tree. Only the tree objects of directories that differ are read.
+
+    Yields:
+        tuple: (path, old, new) where old and new are (mode, hash) pairs, or None when the
+            file does not exist on that side.
+    """
+    if old == new and isinstance(old, str):
+        return
+    old_children = _children(repo_dir, old)
+    new_children = _children(repo_dir, new)
+    for name in sorted(old_children.keys() | new_children.keys()):
+        path = f"{prefix}/{name}" if prefix else name
+        old_mode, old_child = old_children.get(name, (None, None))
+        new_mode, new_child = new_children.get(name, (None, None))
+        old_is_tree, new_is_tree = old_mode == TREE_MODE, new_mode == TREE_MODE
+
+        if old_is_tree or new_is_tree:
+            old_tree = old_child if old_is_tree else None
+            new_tree = new_child if new_is_tree else None
+            yield from diff_trees(repo_dir, old_tree, new_tree, path)
+        old_file = (old_mode, old_child) if old_mode and not old_is_tree else None
+        new_file = (new_mode, new_child) if new_mode and not new_is_tree else None
+        if old_file != new_file:
+            yield path, old_file, new_file
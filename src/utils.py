@@ -6,14 +6,25 @@ A set of utility functions for pit.
 import hashlib
 import os
 
+from src import trace
 from src.constants import MAIN_BRANCH, NOT_A_REPO_MESSAGE, PIT_DIR
+from src.index import read_index
+from src.objects import hash_blob_file, read_commit, store_blob, write_object
+from src.refs import read_ref
+from src.tree import diff_trees, nest_index, walk_tree
 
+# Repository roots already found by get_repo_dir, by start directory
+_repo_dirs = {}
 
+
+@trace.traced("repo.discover")
 def get_repo_dir(start_dir=None):
     """
     Recursively find the root of the repository by looking for the '.pit' directory.
     To ensure calling this function only ones, every function using it must firt require
         repo_dir as a param if none is given then call this function.
+    A root found once is remembered for the rest of the process, so later calls only check
+    that its '.pit' directory still exists instead of walking up the tree again.
 
     Args:
         start_dir (str): The directory to start the search from. Defaults to the current working directory.
@@ -25,11 +36,16 @@ def get_repo_dir(start_dir=None):
         start_dir = os.getcwd()
 
     current_dir = os.path.abspath(start_dir)
+    known = _repo_dirs.get(current_dir)
+    if known is not None and os.path.isdir(os.path.join(known, PIT_DIR)):
+        return known
+    start_dir = current_dir
 
     # Traverse up the directory tree looking for '.repo'
     while current_dir != os.path.dirname(current_dir):
         repo_dir = os.path.join(current_dir, PIT_DIR)
         if os.path.exists(repo_dir):
+            _repo_dirs[start_dir] = current_dir
             return current_dir
         current_dir = os.path.dirname(current_dir)
     return None
@@ -94,44 +110,11 @@ def get_current_branch(repo_dir=None):
 
 def get_current_commit_hash(repo_dir=None):
     """
-    Get the current branch commit hash
+    Get the current branch commit hash, or None if the branch has no commits yet
     """
     repo_dir = repo_dir if repo_dir else get_repo_dir()
     current_branch = get_current_branch(repo_dir)
-    try:
-        current_hash = read_file(os.path.join(repo_dir, "refs/heads", current_branch), "line")
-    except Exception as e:
-        print(e)
-        os._exit(0)
-    return current_hash.strip()
-
-
-def get_ignored_files(repo_dir):
-    """
-    Parse the '.pitignore' file in the repository to get a list of files and directories to ignore.
-
-    Args:
-        repo_dir (str): The root directory of the repository.
-
-    Returns:
-        tuple: A list of patterns (file and directory names) to ignore,
-               a list of directories (folder patterns).
-    """
-    ignore_file = os.path.join(repo_dir, ".pitignore")
-    ignored_files = []
-    ignored_dirs = []
-
-    if os.path.exists(ignore_file):
-        with open(ignore_file, "r", encoding="utf-8") as file:
-            # Read each line and strip the extra whitespaces or newlines
-            for line in file.readlines():
-                line = line.strip()
-                if line and not line.startswith("#"):
-                    if line.endswith("/"):
-                        ignored_dirs.append(line[:-1])  # Remove the trailing slash
-                    else:
-                        ignored_files.append(line)
-    return ignored_files, ignored_dirs
+    return read_ref(repo_dir, current_branch)
 
 
 def get_file_hash_from_index(repo_dir, file_path):
@@ -145,29 +128,13 @@ def get_file_hash_from_index(repo_dir, file_path):
     Returns:
         str or None: The hash of the file if found in the index, or None if the file is not tracked.
     """
-    index_file = os.path.join(repo_dir, ".pit", "index")
-
-    if not os.path.exists(index_file):
-        return None  # If index doesn't exist, file is not tracked
-
-    with open(index_file, "r", encoding="utf-8") as file:
-        for line in file:
-            parts = line.strip().split()
-            if len(parts) == 2:
-                tracked_file, file_hash = parts
-                if tracked_file == file_path:
-                    return file_hash  # Return the hash if the file is found
-
-    return None  # File not found in index
+    entry = read_index(repo_dir).get(file_path)
+    return entry.hash if entry else None
 
 
 def compute_file_hash(file_path):
     """Compute the hash of a file's content."""
-    hasher = hashlib.sha1()
-    with open(file_path, "rb") as f:
-        while chunk := f.read(4096):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+    return hash_blob_file(file_path)
 
 
 def is_file_modified(repo_dir, file_path):
@@ -180,140 +147,64 @@ def is_file_modified(repo_dir, file_path):
 
 def get_tracked_files(repo_dir):
     """Get a list of all tracked files (staged or committed)."""
-    index_file = os.path.join(repo_dir, ".pit", "index")
-    tracked_files = []
-
-    if os.path.exists(index_file):
-        with open(index_file, "r", encoding="utf-8") as file:
-            for line in file:
-                tracked_files.append(line.split()[1])  # Extract file path from index
+    return list(read_index(repo_dir))
 
-    return tracked_files
 
+def get_committed_files(repo_dir):
+    """
+    Get the files recorded in the current branch's latest commit.
 
-def get_staged_files(repo_dir, mode=None):
-    """Get list of files staged for commit (in index but not committed)."""
-    staged_files = []
-    index_file = os.path.join(repo_dir, ".pit", "index")
-    if os.path.exists(index_file):
-        with open(index_file, "r", encoding="utf-8") as file:
-            if mode == "strip":
-                staged_files = [line.strip() for line in file.readlines()]
-            else:
-                staged_files = file.readlines()
-
-    return staged_files
+    Returns:
+        dict: A mapping of relative file path to the committed hash. Empty if there are no commits.
+    """
+    commit_hash = get_current_commit_hash(repo_dir)
+    commit = read_commit(repo_dir, commit_hash) if commit_hash else None
+    if commit is None:
+        return {}
+    if commit.tree is None:
+        return dict(commit.files)
+    return {path: file_hash for path, _, file_hash in walk_tree(repo_dir, commit.tree)}
 
 
-def get_modified_files(repo_dir):
+def get_staged_files(repo_dir, index=None):
     """
-    Get list of files that have been modified but not staged.
-    Excludes ignored files and untracked files.
-    """
-    modified_files = []
-    ignored_files, ignored_dirs = get_ignored_files(repo_dir)
-    staged_files = get_staged_files(repo_dir)  # Files already staged
-    tracked_files = get_tracked_files(
-        repo_dir
-    )  # Files already tracked (staged or committed)
-
-    for root, dirs, files in os.walk(repo_dir):
-        # Exclude ignored directories
-        dirs[:] = [d for d in dirs if os.path.join(root, d) not in ignored_dirs]
-
-        for file in files:
-            file_path = os.path.relpath(os.path.join(root, file), repo_dir)
-            if file_path in ignored_files or any(
-                file_path.startswith(f"{d}/") for d in ignored_dirs
-            ):
-                continue  # Skip ignored files
-
-            # Check if file is tracked
-            if file_path in tracked_files:
-                if file_path in staged_files:
-                    # Compare staged version with working directory version
-                    staged_hash = get_file_hash_from_index(repo_dir, file_path)
-                    working_hash = compute_file_hash(os.path.join(repo_dir, file_path))
-                    if working_hash != staged_hash:
-                        modified_files.append(file_path)
-                else:
-                    # Compare committed version with working directory version
-                    if is_file_modified(repo_dir, file_path):
-                        modified_files.append(file_path)
-
-    return modified_files
-
-
-def get_untracked_files(repo_dir):
-    """
-    Get a list of untracked files, excluding staged and ignored files.
-    """
-    untracked_files = []
-    ignored_files, ignored_dirs = get_ignored_files(repo_dir)
-    staged_files = get_staged_files(repo_dir)  # Get files already staged
-    tracked_files = get_tracked_files(repo_dir)  # Get files already tracked
+    Get list of files staged for commit (in index but differing from the latest commit).
 
-    for root, dirs, files in os.walk(repo_dir):
-        # Exclude ignored directories
-        dirs[:] = [d for d in dirs if os.path.join(root, d) not in ignored_dirs]
+    The index is compared with the latest commit's tree one directory at a time; directories
+    whose cached tree hash in the index equals the committed one are skipped unread.
+    """
+    index = read_index(repo_dir) if index is None else index
+    commit_hash = get_current_commit_hash(repo_dir)
+    commit = read_commit(repo_dir, commit_hash) if commit_hash else None
+    return staged_against(repo_dir, index, commit)
 
-        for file in files:
-            file_path = os.path.relpath(os.path.join(root, file), repo_dir)
-            if file_path in ignored_files or any(
-                file_path.startswith(f"{d}/") for d in ignored_dirs
-            ):
-                continue  # Skip ignored files and directories
 
-            if file_path not in tracked_files and file_path not in staged_files:
-                untracked_files.append(file_path)
+def staged_against(repo_dir, index, commit):
+    """
+    Get the sorted paths whose index entry differs from a commit, see `get_staged_files`.
 
-    return untracked_files
+    Args:
+        repo_dir (str): The root directory of the repository.
+        index (dict): The index, a mapping of relative path to IndexEntry.
+        commit (Commit): The commit to compare with, or None if there are no commits.
+    """
+    if commit is not None and commit.tree is None:
+        # Commits from older versions of pit list their files inline
+        return sorted(
+            {path for path, entry in index.items() if commit.files.get(path) != entry.hash}
+            | (commit.files.keys() - index.keys())
+        )
+    head_tree = commit.tree if commit else None
+    return sorted(path for path, _, _ in diff_trees(repo_dir, head_tree, nest_index(index)))
 
 
-def write_tree(repo_dir=None):
-    """
-    Writes a Tree object by mergin already committed files with staged files
-        If file exists in prev commit tree replace it in new commit tree with staged
-        Else Add. The tree is sorted alphabetically
-    Returns the hash of the tree object.
-    """
-    repo_dir = repo_dir if repo_dir else get_repo_dir()
-    tree_entries = []
-    committed_entries = []
-    current_branch = get_current_branch()
-    staged_entries = get_staged_files(repo_dir)
-    full_dir_path = os.path.join(repo_dir, dir_path)
-    for entry in sorted(os.listdir(full_dir_path)):
-        entry_path = os.path.join(full_dir_path, entry)
-        print("ENTRY PATH : ", entry_path, entry)
-
-        # TODO: ignore files in .pitignore if PIT_DIR in entry_path:  # skip the pit directory continue
-        if PIT_DIR in entry_path:
-            continue
-
-        if os.path.isfile(entry_path):
-            # write blob object
-            blob_hash = write_blob(repo_dir, entry_path)
-            tree_entries.append(f"100644 blob {blob_hash} {entry}")
-        elif os.path.isdir(entry_path):
-            # Write tree object recursively
-            sub_tree_hash = write_tree(repo_dir, os.path.join(dir_path, entry))
-            tree_entries.append(f"40000 tree {sub_tree_hash} {entry}")
-
-    # create tree content
-    tree_content = "\n".join(tree_entries) + "\n"
-    tree_hash = hash_object(tree_content.encode(), "tree", repo_dir)
-    return tree_hash
-
-
-def write_blob(repo_dir, file_path):
+def write_blob(repo_dir, file_path, use_mmap=None):
     """
-    Writes a blob object for the given file.
+    Writes a blob object for the given file, streaming it so memory use stays bounded.
     Returns the hash of the blob object.
     """
     with open(file_path, "rb") as file:
-        content = file.read()
-    blob_hash = hash_object(content, "blob", repo_dir)
+        return store_blob(repo_dir, file, os.fstat(file.fileno()).st_size, use_mmap)
 
 
 def hash_object(content, obj_type, repo_dir):
@@ -321,18 +212,4 @@ def hash_object(content, obj_type, repo_dir):
     Hashes the content and stores it in the .pit/objects directory.
     Returns the hash of the content.
     """
-    header = f"{obj_type} {len(content)}".encode("utf-8")
-    print("header", type(header))
-    print("content", type(content))
-    # full_content = header + b"\x00" + content
-    full_content = header + content
-    obj_hash = hashlib.sha1(full_content).hexdigest()
-
-    # Store the object in .pit/objects
-    obj_dir = os.path.join(repo_dir, ".pit", "objects", obj_hash[:2])
-    obj_path = os.path.join(obj_dir, obj_hash[2:])
-    os.makedirs(obj_dir, exist_ok=True)
-    with open(obj_path, "wb") as obj_file:
-        obj_file.write(full_content)
-
-    return obj_hash
+    return write_object(repo_dir, content, obj_type)
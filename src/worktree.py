@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+A single-pass scanner of the repository working tree.
+
+`scan_worktree` walks the working tree once with `os.scandir` and classifies every file it
+meets against the index and the files staged since the latest commit, so `status`, `add`
+and `diff` all share the same walk instead of each doing their own. Ignored directories are
+pruned before they are descended into, membership tests use dicts and sets, and only
+tracked files are stat'd.
+
+Entry kinds:
+- untracked: the file is not in the index
+- modified: the working tree content differs from the index
+- deleted: the file is in the index but missing from the working tree
+- staged: the index differs from the latest commit
+- ignored: the file or directory matches `.pitignore` (only yielded on request)
+
+A tracked file can be yielded twice, once as staged and once as modified.
+
+`checkout_tree` moves the working tree and the index from one tree to another, touching
+only the paths that differ between them.
+"""
+
+import os
+from collections import namedtuple
+
+from src import trace
+from src.constants import PIT_DIR
+from src.index import Index, get_index_mtime_ns, make_entry, stat_matches
+from src.ignore import (IGNORE_FILE, ancestor_rules, extend_rules, is_ignored,
+                        load_rules, match_rules)
+from src.objects import read_object
+from src.tree import EXECUTABLE_MODE, diff_trees
+from src.utils import compute_file_hash
+
+UNTRACKED = "untracked"
+MODIFIED = "modified"
+DELETED = "deleted"
+STAGED = "staged"
+IGNORED = "ignored"
+
+ScanEntry = namedtuple("ScanEntry", ["path", "kind"])
+
+
+def _join(parent, name):
+    return f"{parent}/{name}" if parent else name
+
+
+@trace.traced("worktree.scan")
+def scan_worktree(
+    repo_dir,
+    index_entries,
+    staged_paths,
+    prefix="",
+    include_ignored=False,
+    refreshed=None,
+):
+    """
+    Walk the working tree once and yield a classified entry for every file of interest.
+
+    `.pitignore` files are picked up from every directory on the way down and their compiled
+    rules are chained, so deciding whether an entry is ignored never re-reads a file.
+
+    Tracked files whose stat data matches their index entry are assumed unchanged and are
+    not read. Files that are rehashed but turn out unchanged get their entry refreshed in
+    place in `index_entries`; their paths are added to `refreshed` so the caller can write
+    the index back.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        index_entries (dict): The index, a mapping of relative path to IndexEntry.
+        staged_paths (set): The paths whose index entry differs from the latest commit, see
+            `utils.get_staged_files`.
+        prefix (str): A relative directory to restrict the scan to. Defaults to the whole tree.
+        include_ignored (bool): Whether to yield ignored files and directories.
+        refreshed (set): Collects the paths whose index entries were refreshed.
+
+    Yields:
+        ScanEntry: The relative path of a file and its kind.
+    """
+    index_mtime_ns = get_index_mtime_ns(repo_dir)
+    prefix = prefix.strip("/") if prefix not in ("", ".") else ""
+    seen = set()
+
+    start_chain = ancestor_rules(repo_dir, prefix) if prefix else ()
+    if prefix and is_ignored(repo_dir, prefix, is_dir=True):
+        start_chain = None  # Only tracked files below an ignored directory are of interest
+
+    stack = [(prefix, start_chain)] if start_chain is not None else []
+    while stack:
+        rel_dir, chain = stack.pop()
+        try:
+            with os.scandir(os.path.join(repo_dir, rel_dir)) as it:
+                dir_entries = sorted(it, key=lambda e: e.name)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if any(dir_entry.name == IGNORE_FILE for dir_entry in dir_entries):
+            chain = extend_rules(chain, load_rules(repo_dir, rel_dir))
+
+        sub_dirs = []
+        for dir_entry in dir_entries:
+            path = _join(rel_dir, dir_entry.name)
+            if dir_entry.is_dir(follow_symlinks=False):
+                if not rel_dir and dir_entry.name == PIT_DIR:
+                    continue
+                # Prune ignored directories before descending into them
+                if match_rules(chain, path, True):
+                    if include_ignored:
+                        yield ScanEntry(path + "/", IGNORED)
+                    continue
+                sub_dirs.append((path, chain))
+                continue
+
+            entry = index_entries.get(path)
+            if entry is not None:
+                seen.add(path)
+                yield from _classify_tracked(
+                    entry,
+                    dir_entry.path,
+                    index_entries,
+                    staged_paths,
+                    index_mtime_ns,
+                    refreshed,
+                )
+            elif match_rules(chain, path, False):
+                if include_ignored:
+                    yield ScanEntry(path, IGNORED)
+            else:
+                yield ScanEntry(path, UNTRACKED)
+
+        # Push in reverse so directories are visited in sorted order
+        stack.extend(reversed(sub_dirs))
+
+    # Tracked files not met during the walk are either deleted or inside a pruned directory
+    scope = prefix + "/" if prefix else ""
+    if isinstance(index_entries, Index):
+        tracked = index_entries.paths_under(prefix)
+    else:
+        tracked = sorted(path for path in index_entries if path.startswith(scope))
+    for path in tracked:
+        if path in seen:
+            continue
+        entry = index_entries[path]
+        abs_path = os.path.join(repo_dir, path)
+        if os.path.lexists(abs_path):
+            yield from _classify_tracked(
+                entry, abs_path, index_entries, staged_paths, index_mtime_ns, refreshed
+            )
+            continue
+        if path in staged_paths:
+            yield ScanEntry(path, STAGED)
+        yield ScanEntry(path, DELETED)
+
+    # Files removed from the index since the latest commit are staged deletions
+    for path in sorted(staged_paths):
+        if path not in index_entries and path.startswith(scope):
+            yield ScanEntry(path, STAGED)
+
+
+def _classify_tracked(
+    entry, abs_path, index_entries, staged_paths, index_mtime_ns, refreshed
+):
+    """Yield the staged and modified entries of a tracked file that exists on disk."""
+    if entry.path in staged_paths:
+        yield ScanEntry(entry.path, STAGED)
+
+    st = os.stat(abs_path)
+    trace.count("files_stat")
+    if stat_matches(entry, st, index_mtime_ns):
+        return
+    # Stat data changed, compare the indexed version with the working tree version
+    if compute_file_hash(abs_path) != entry.hash:
+        yield ScanEntry(entry.path, MODIFIED)
+    else:
+        index_entries[entry.path] = make_entry(entry.path, entry.hash, st)
+        if refreshed is not None:
+            refreshed.add(entry.path)
+
+
+def classify_path(repo_dir, index_entries, path, index_mtime_ns=None, refreshed=None):
+    """
+    Classify a single file against the index, without walking its directory.
+
+    Returns:
+        str: MODIFIED, DELETED, UNTRACKED or IGNORED, or None if the file is unchanged or
+            neither tracked nor present.
+    """
+    abs_path = os.path.join(repo_dir, path)
+    entry = index_entries.get(path)
+    if entry is None:
+        if not os.path.lexists(abs_path) or os.path.isdir(abs_path):
+            return None
+        return IGNORED if is_ignored(repo_dir, path) else UNTRACKED
+    if not os.path.lexists(abs_path):
+        return DELETED
+    for scan_entry in _classify_tracked(
+        entry, abs_path, index_entries, (), index_mtime_ns, refreshed
+    ):
+        return scan_entry.kind
+    return None
+
+
+def has_local_changes(repo_dir, index_entries, path):
+    """
+    Check whether the working tree file at path differs from its index entry.
+
+    An untracked file counts as a local change, a missing tracked file does not.
+    """
+    abs_path = os.path.join(repo_dir, path)
+    entry = index_entries.get(path)
+    if entry is None:
+        return os.path.lexists(abs_path)
+    try:
+        st = os.stat(abs_path)
+    except FileNotFoundError:
+        return False
+    trace.count("files_stat")
+    if stat_matches(entry, st, get_index_mtime_ns(repo_dir)):
+        return False
+    return compute_file_hash(abs_path) != entry.hash
+
+
+def write_worktree_file(repo_dir, index_entries, path, mode, object_hash):
+    """
+    Write a blob to the working tree and record the file in the index.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        index_entries (dict): The index, updated in place.
+        path (str): The path of the file relative to the repository root.
+        mode (str): The tree mode of the file.
+        object_hash (str): The hash of the blob to write.
+    """
+    _, content = read_object(repo_dir, object_hash)
+    abs_path = os.path.join(repo_dir, path)
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    with open(abs_path, "wb") as f:
+        f.write(content)
+    os.chmod(abs_path, 0o755 if mode == EXECUTABLE_MODE else 0o644)
+    index_entries[path] = make_entry(path, object_hash, os.stat(abs_path))
+
+
+def remove_worktree_file(repo_dir, index_entries, path):
+    """Delete a file from the working tree and the index, with its emptied directories."""
+    abs_path = os.path.join(repo_dir, path)
+    try:
+        os.remove(abs_path)
+    except FileNotFoundError:
+        pass
+    if path in index_entries:
+        del index_entries[path]
+
+    parent = os.path.dirname(path)
+    while parent:
+        try:
+            os.rmdir(os.path.join(repo_dir, parent))
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+
+def apply_changes(repo_dir, index_entries, changes):
+    """
+    Apply file changes to the working tree and the index.
+
+    Files whose content is already in the index only get their mode changed.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        index_entries (dict): The index, updated in place.
+        changes (dict): A mapping of relative path to the new (mode, hash) of the file, or
+            None to delete it.
+    """
+    # Deletions first, a deleted directory may be replaced by a file of the same name
+    for path, new in sorted(changes.items()):
+        if new is None:
+            remove_worktree_file(repo_dir, index_entries, path)
+    for path, new in sorted(changes.items()):
+        if new is None:
+            continue
+        mode, object_hash = new
+        entry = index_entries.get(path)
+        abs_path = os.path.join(repo_dir, path)
+        if entry is not None and entry.hash == object_hash and os.path.exists(abs_path):
+            os.chmod(abs_path, 0o755 if mode == EXECUTABLE_MODE else 0o644)
+            index_entries[path] = make_entry(path, object_hash, os.stat(abs_path))
+        else:
+            write_worktree_file(repo_dir, index_entries, path, mode, object_hash)
+
+
+@trace.traced("worktree.checkout")
+def checkout_tree(repo_dir, index_entries, old_tree, new_tree):
+    """
+    Move the working tree and the index from one tree to another.
+
+    Only the paths that differ between the trees are written, deleted or chmod'ed, and
+    subtrees with equal hashes are not read. Nothing is changed if that would overwrite
+    local changes.
+
+    Args:
+        repo_dir (str): The root directory of the repository.
+        index_entries (dict): The index, updated in place. The caller writes it back.
+        old_tree (str): The tree hash the working tree is at, or None.
+        new_tree (str): The tree hash to move to, or None.
+
+    Returns:
+        list: The paths with local changes that prevented the checkout, empty on success.
+    """
+    changes = {path: new for path, _, new in diff_trees(repo_dir, old_tree, new_tree)}
+    dirty = sorted(
+        path for path in changes if has_local_changes(repo_dir, index_entries, path)
+    )
+    if not dirty:
+        apply_changes(repo_dir, index_entries, changes)
+    return dirty
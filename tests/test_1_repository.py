@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 
+import io
 import os
+from contextlib import ExitStack, redirect_stdout
+from unittest import mock
 
-from src.repository import init_repo
-from src.utils import read_file
+from src import repository
+from src.commit import commit_changes
+from src.repository import Repository, init_repo
+from src.staging import add_files
+from src.status import status
+from src.utils import read_file, write_file
 from tests.test_setup import RepoTestCase
 
 
@@ -18,3 +25,53 @@ class TestRepository(RepoTestCase):
         self.assertIn(
             "ref: refs/heads/master", read_file(os.path.join(self.repo_dir, "HEAD"))
         )
+
+
+class TestRepositoryContext(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("lib")
+        write_file("a.txt", "a\n")
+        write_file("lib/b.txt", "b\n")
+        add_files(type("Args", (object,), {"files": ["."]})())
+        commit_changes(type("Args", (object,), {"message": "first"})())
+
+    def test_status_reads_metadata_once(self):
+        write_file("a.txt", "changed\n")
+        write_file("lib/c.txt", "c\n")
+        os.chdir("lib")
+        repo = Repository.discover()
+        self.assertEqual(repo.root, os.path.realpath(self.test_dir))
+
+        names = ("read_index", "read_file", "read_ref")
+        with ExitStack() as stack, redirect_stdout(io.StringIO()) as out:
+            reads = [
+                stack.enter_context(
+                    mock.patch.object(repository, name, wraps=getattr(repository, name))
+                )
+                for name in names
+            ]
+            status(None, repo)
+            status(None, repo)
+        self.assertIn("a.txt", out.getvalue())
+        # The index, HEAD and the ref of the current branch are each read once
+        self.assertEqual([read.call_count for read in reads], [1, 1, 1])
+
+    def test_writes_update_the_cached_state(self):
+        repo = Repository(self.test_dir)
+        first = repo.head
+        self.assertEqual(repo.staged_files(), [])
+
+        write_file("a.txt", "changed\n")
+        add_files(type("Args", (object,), {"files": ["a.txt"]})(), repo)
+        self.assertEqual(repo.staged_files(), ["a.txt"])
+        commit_changes(type("Args", (object,), {"message": "second"})(), repo)
+        self.assertEqual(repo.staged_files(), [])
+        self.assertNotEqual(repo.head, first)
+
+        repo.write_ref("old", first)
+        repo.set_head("old")
+        self.assertEqual(repo.head, first)
+        self.assertEqual(repo.staged_files(), ["a.txt"])
+        self.assertEqual(Repository(self.test_dir).head, first)
@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
 
 import os
+import shutil
+from unittest import mock
 
 from src.repository import init_repo
+from src.index import read_index
 from src.staging import add_files
-from src.utils import read_file, write_file
+from src.objects import hash_object_content, read_object, store_blob
+from src.utils import write_file
+from src.worktree import MODIFIED, scan_worktree
 from tests.test_setup import RepoTestCase
 
 TEST_FILE = "test_file.txt"
 
 
+def modified_files():
+    entries = scan_worktree(os.getcwd(), read_index(os.getcwd()), set())
+    return [entry.path for entry in entries if entry.kind == MODIFIED]
+
+
 class TestStaging(RepoTestCase):
     def setUp(self):
         super().setUp()
@@ -21,4 +31,78 @@ class TestStaging(RepoTestCase):
         index_path = os.path.join(self.repo_dir, "index")
         self.assertTrue(os.path.exists(index_path))
 
-        self.assertIn(TEST_FILE, read_file(index_path))
+        self.assertIn(TEST_FILE, read_index(self.test_dir))
+
+    def test_add_records_stat_data(self):
+        add_files(type("Args", (object,), {"files": [TEST_FILE]})())
+        entry = read_index(self.test_dir)[TEST_FILE]
+        st = os.stat(TEST_FILE)
+        self.assertEqual(entry.size, st.st_size)
+        self.assertEqual(entry.mtime_ns, st.st_mtime_ns)
+        self.assertEqual(entry.ino, st.st_ino)
+
+    def test_unchanged_file_is_not_rehashed(self):
+        add_files(type("Args", (object,), {"files": [TEST_FILE]})())
+        # Backdate the file so its index entry is not racily clean
+        os.utime(TEST_FILE, ns=(1, 1))
+        add_files(type("Args", (object,), {"files": [TEST_FILE]})())
+        with mock.patch("src.worktree.compute_file_hash") as compute_file_hash:
+            self.assertEqual(modified_files(), [])
+        compute_file_hash.assert_not_called()
+
+    def test_modified_file_is_detected(self):
+        add_files(type("Args", (object,), {"files": [TEST_FILE]})())
+        write_file(TEST_FILE, "Hello, there!")
+        self.assertEqual(modified_files(), [TEST_FILE])
+
+    def test_readding_a_modified_file_replaces_its_entry(self):
+        add_files(type("Args", (object,), {"files": [TEST_FILE]})())
+        write_file(TEST_FILE, "Hello, there!")
+        add_files(type("Args", (object,), {"files": [TEST_FILE]})())
+        with open(os.path.join(self.repo_dir, "index"), "rb") as f:
+            self.assertEqual(f.read().count(TEST_FILE.encode()), 1)
+        self.assertEqual(
+            read_index(self.test_dir)[TEST_FILE].hash, hash_object_content(b"Hello, there!")
+        )
+
+    def test_index_paths_stay_sorted(self):
+        os.makedirs("lib/sub")
+        for path in ["lib/b.txt", "lib/sub/c.txt", "lib.txt", "a.txt"]:
+            write_file(path, path)
+        add_files(type("Args", (object,), {"files": ["."]})())
+        index = read_index(self.test_dir)
+        self.assertEqual(index.sorted_paths(), sorted(index))
+        self.assertEqual(index.paths_under("lib"), ["lib/b.txt", "lib/sub/c.txt"])
+
+        index["lib/a.txt"] = index["lib/b.txt"]._replace(path="lib/a.txt")
+        index.pop("lib/sub/c.txt")
+        self.assertEqual(index.paths_under("lib"), ["lib/a.txt", "lib/b.txt"])
+        self.assertEqual(index.paths_under(""), sorted(index))
+
+    def test_parallel_add_writes_each_object_once(self):
+        for i in range(8):
+            write_file(f"file_{i}.txt", "same content")
+        add_files(type("Args", (object,), {"files": ["."], "jobs": 4})())
+        index = read_index(self.test_dir)
+        self.assertEqual(len({index[f"file_{i}.txt"].hash for i in range(8)}), 1)
+
+        object_hash = index["file_0.txt"].hash
+        object_path = os.path.join(self.repo_dir, "objects", object_hash[:2], object_hash[2:])
+        os.utime(object_path, ns=(1, 1))
+        write_file("copy.txt", "same content")
+        add_files(type("Args", (object,), {"files": ["copy.txt"], "jobs": 2})())
+        self.assertEqual(os.stat(object_path).st_mtime_ns, 1)
+
+    def test_large_files_are_streamed_into_objects(self):
+        content = os.urandom(10000)
+        with open("big.bin", "wb") as f:
+            f.write(content)
+        for use_mmap in (False, True):
+            shutil.rmtree(os.path.join(self.repo_dir, "objects"))
+            os.makedirs(os.path.join(self.repo_dir, "objects"))
+            with mock.patch("src.objects.BLOB_CHUNK_SIZE", 1024):
+                with open("big.bin", "rb") as src:
+                    blob_hash = store_blob(self.test_dir, src, len(content), use_mmap)
+            self.assertEqual(blob_hash, hash_object_content(content))
+            self.assertEqual(read_object(self.test_dir, blob_hash), ("blob", content))
+            self.assertEqual(os.listdir(os.path.join(self.repo_dir, "objects")), [blob_hash[:2]])
@@ -3,6 +3,7 @@
 import os
 
 from src.commit import commit_changes
+from src.objects import object_exists
 from src.repository import init_repo
 from src.staging import add_files
 from src.utils import read_file, write_file
@@ -24,6 +25,4 @@ class TestCommit(RepoTestCase):
         self.assertTrue(os.path.exists(master_path))
 
         commit_hash = read_file(master_path).strip()
-        self.assertTrue(
-            os.path.exists(os.path.join(self.repo_dir, "objects", commit_hash))
-        )
+        self.assertTrue(object_exists(self.test_dir, commit_hash))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import io
+import os
+from contextlib import redirect_stdout
+from unittest import TestCase, mock
+
+from src import diff
+from src.commit import commit_changes
+from src.diff import show_diff
+from src.linediff import count_changes, diff_blocks, unified_diff
+from src.repository import init_repo
+from src.staging import add_files
+from src.utils import get_current_commit_hash, write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestLineDiff(TestCase):
+    def test_myers_finds_a_minimal_diff(self):
+        a = list("abcabba")
+        b = list("cbabac")
+        matched = sum(n for _, _, n in diff_blocks(a, b))
+        self.assertEqual(matched, 4)
+        self.assertEqual(count_changes(a, b), (2, 3))
+
+    def test_patience_matches_unique_lines_first(self):
+        a = [b"foo\n", b"{\n", b"}\n", b"bar\n", b"{\n", b"}\n"]
+        b = [b"bar\n", b"{\n", b"}\n"]
+        self.assertEqual(diff_blocks(a, b, "patience"), [(3, 0, 3), (6, 3, 0)])
+
+    def test_unified_diff(self):
+        a = [f"{i}\n".encode() for i in range(10)]
+        b = a[:4] + [b"four\n"] + a[5:] + [b"end"]
+        self.assertEqual(
+            b"".join(unified_diff(a, b, context=1)),
+            b"@@ -4,3 +4,3 @@\n 3\n-4\n+four\n 5\n"
+            b"@@ -10 +10,2 @@\n 9\n+end\n\\ No newline at end of file\n",
+        )
+
+
+class TestDiffCommand(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("lib")
+        write_file("a.txt", "one\ntwo\n")
+        write_file("lib/b.txt", "b\n")
+        self.commit("first")
+        self.first = get_current_commit_hash(self.test_dir)
+
+    def commit(self, message):
+        add_files(type("Args", (object,), {"files": ["."]})())
+        commit_changes(type("Args", (object,), {"message": message})())
+
+    def diff(self, *revisions, **options):
+        args = {"revisions": list(revisions), "stat": False, "name_only": False, **options}
+        out = io.StringIO()
+        with redirect_stdout(out):
+            show_diff(type("Args", (object,), args)())
+        return out.getvalue()
+
+    def test_worktree_diff_reads_only_changed_files(self):
+        write_file("a.txt", "one\n2\n")
+        with open("data.bin", "wb") as f:
+            f.write(b"\0\1")
+        add_files(type("Args", (object,), {"files": ["data.bin"]})())
+
+        with mock.patch.object(diff, "read_object", wraps=diff.read_object) as read:
+            output = self.diff()
+        self.assertEqual(read.call_count, 1)
+        self.assertIn("--- a/a.txt\n+++ b/a.txt\n@@ -1,2 +1,2 @@\n one\n-two\n+2\n", output)
+        self.assertIn("Binary files /dev/null and b/data.bin differ", output)
+        self.assertNotIn("lib/b.txt", output)
+
+    def test_commit_to_commit_modes(self):
+        write_file("a.txt", "one\n2\n3\n")
+        os.remove("lib/b.txt")
+        self.commit("second")
+
+        self.assertEqual(self.diff(self.first, "main", name_only=True), "a.txt\nlib/b.txt\n")
+        stat = self.diff(self.first, "HEAD", stat=True)
+        self.assertIn(" a.txt     |     3 ++-\n", stat)
+        self.assertIn(" 2 files changed, 2 insertions(+), 2 deletions(-)", stat)
+        self.assertEqual(self.diff("HEAD"), "")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import copy
+import os
+
+from benchmarks.run import COMMANDS, compare, run_benchmarks
+from benchmarks.synthetic import Scale
+from tests.test_setup import RepoTestCase
+
+
+class TestBenchmarks(RepoTestCase):
+    def test_run_times_every_command(self):
+        scale = Scale(files=5, file_size=64, depth=1, commits=2, branches=1)
+        results = run_benchmarks(scale, repeat=2, work_dir=self.test_dir)
+        self.assertEqual(list(results["results"]), COMMANDS)
+        for summary in results["results"].values():
+            self.assertEqual(summary["runs"], 2)
+            self.assertLessEqual(summary["min_ms"], summary["p50_ms"])
+            self.assertLessEqual(summary["p50_ms"], summary["max_ms"])
+            self.assertGreater(summary["max_rss_kb"], 0)
+        self.assertTrue(os.path.isdir(os.path.join(self.test_dir, "repo", ".pit")))
+
+    def test_compare_reports_slowdowns(self):
+        baseline = {
+            "scale": {"files": 5},
+            "results": {
+                "status": {"p50_ms": 100.0, "max_rss_kb": 1000},
+                "log": {"p50_ms": 2.0, "max_rss_kb": 1000},
+            },
+        }
+        results = copy.deepcopy(baseline)
+        self.assertEqual(compare(results, baseline), [])
+
+        results["results"]["status"]["p50_ms"] = 150.0
+        results["results"]["log"]["p50_ms"] = 4.0  # Doubled, but within the noise
+        results["results"]["log"]["max_rss_kb"] = 2000
+        self.assertEqual(
+            compare(results, baseline),
+            ["status: median 100.0 ms -> 150.0 ms", "log: peak RSS 1000 KiB -> 2000 KiB"],
+        )
+        results["scale"] = {"files": 6}
+        with self.assertRaises(ValueError):
+            compare(results, baseline)
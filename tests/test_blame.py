@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import io
+import os
+from contextlib import redirect_stdout
+from unittest import mock
+
+from src import blame
+from src.blame import blame_lines, get_blame_cache_path, show_blame
+from src.commit import commit_changes
+from src.lockfile import LOCK_SUFFIX
+from src.repository import Repository, init_repo
+from src.staging import add_files
+from src.utils import get_current_commit_hash, write_file
+from tests.test_setup import RepoTestCase
+
+PATH = "lib/f.txt"
+
+
+class TestBlame(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("lib")
+        write_file(PATH, "one\ntwo\nthree\n")
+        self.first = self.commit("First", PATH)
+        write_file(PATH, "one\nTWO\nthree\nfour\n")
+        write_file("other.txt", "other\n")
+        self.second = self.commit("Second", PATH, "other.txt")
+        write_file("other.txt", "changed\n")
+        self.third = self.commit("Unrelated", "other.txt")
+
+    def commit(self, message, *files):
+        add_files(type("Args", (object,), {"files": list(files)})())
+        commit_changes(type("Args", (object,), {"message": message})())
+        return get_current_commit_hash(self.test_dir)
+
+    def blame(self, commit_hash):
+        return blame_lines(Repository(self.test_dir), commit_hash, PATH)
+
+    def test_lines_are_attributed_to_the_commit_that_changed_them(self):
+        self.assertEqual(
+            self.blame(self.third),
+            [(self.first, 1), (self.second, 2), (self.first, 3), (self.second, 4)],
+        )
+        self.assertIsNone(blame_lines(Repository(self.test_dir), self.third, "missing"))
+
+    def test_repeated_blame_is_read_from_the_cache(self):
+        origins = self.blame(self.third)
+        self.assertTrue(os.path.exists(get_blame_cache_path(self.test_dir, self.third, PATH)))
+        with mock.patch.object(blame, "diff_blocks") as diff_blocks:
+            self.assertEqual(self.blame(self.third), origins)
+        diff_blocks.assert_not_called()
+
+    def test_blame_is_shown_when_the_cache_cannot_be_written(self):
+        cache_path = get_blame_cache_path(self.test_dir, self.third, PATH)
+        os.makedirs(os.path.dirname(cache_path))
+        open(cache_path + LOCK_SUFFIX, "w").close()
+        expected = [(self.first, 1), (self.second, 2), (self.first, 3), (self.second, 4)]
+        with mock.patch("src.lockfile.time.sleep") as sleep:
+            self.assertEqual(self.blame(self.third), expected)
+        sleep.assert_not_called()
+        self.assertFalse(os.path.exists(cache_path))
+
+        os.remove(cache_path + LOCK_SUFFIX)
+        with mock.patch("src.lockfile.os.open", side_effect=PermissionError):
+            self.assertEqual(self.blame(self.third), expected)
+        self.assertFalse(os.path.exists(cache_path))
+
+    def test_blame_after_a_commit_reuses_the_parent_blame(self):
+        self.blame(self.third)
+        write_file(PATH, "zero\none\nTWO\nthree\nfour\n")
+        fourth = self.commit("Fourth", PATH)
+        with mock.patch.object(blame, "diff_blocks", wraps=blame.diff_blocks) as diff_blocks:
+            origins = self.blame(fourth)
+        self.assertEqual(diff_blocks.call_count, 1)
+        self.assertEqual(
+            origins,
+            [
+                (fourth, 1),
+                (self.first, 1),
+                (self.second, 2),
+                (self.first, 3),
+                (self.second, 4),
+            ],
+        )
+
+    def test_show_blame(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            show_blame(type("Args", (object,), {"file": PATH, "revision": None})())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(self.second[:8]))
+        self.assertTrue(lines[1].endswith("2) TWO"))
+
+        with redirect_stdout(io.StringIO()), self.assertRaises(SystemExit):
+            show_blame(type("Args", (object,), {"file": "missing", "revision": None})())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import os
+from unittest import mock
+
+from src import worktree
+from src.branch import checkout_branch, create_branch
+from src.commit import commit_changes
+from src.index import read_index
+from src.repository import init_repo
+from src.staging import add_files
+from src.utils import get_current_branch, get_staged_files, read_file, write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestCheckout(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("lib")
+        for name in ("a.txt", "b.txt", "lib/c.txt", "run.sh"):
+            write_file(name, f"{name}\n")
+        self.commit("base", ".")
+        create_branch(type("Args", (object,), {"branch_name": "feature"})())
+        self.checkout("feature")
+
+        write_file("a.txt", "changed\n")
+        os.remove("lib/c.txt")
+        os.chmod("run.sh", 0o755)
+        write_file("new.txt", "new\n")
+        self.commit("feature", ".")
+
+    def commit(self, message, *files):
+        add_files(type("Args", (object,), {"files": list(files)})())
+        commit_changes(type("Args", (object,), {"message": message})())
+
+    def checkout(self, branch_name):
+        checkout_branch(type("Args", (object,), {"branch_name": branch_name})())
+
+    def test_checkout_only_touches_changed_paths(self):
+        with mock.patch.object(
+            worktree, "write_worktree_file", wraps=worktree.write_worktree_file
+        ) as write:
+            self.checkout("main")
+        written = [call.args[2] for call in write.call_args_list]
+        self.assertEqual(written, ["a.txt", "lib/c.txt"])
+
+        self.assertEqual(get_current_branch(self.test_dir), "main")
+        self.assertEqual(read_file("a.txt"), "a.txt\n")
+        self.assertEqual(read_file("lib/c.txt"), "lib/c.txt\n")
+        self.assertFalse(os.path.exists("new.txt"))
+        self.assertFalse(os.stat("run.sh").st_mode & 0o111)
+        self.assertNotIn("new.txt", read_index(self.test_dir))
+        self.assertEqual(get_staged_files(self.test_dir), [])
+
+        self.checkout("feature")
+        self.assertFalse(os.path.exists("lib"))
+        self.assertEqual(read_file("new.txt"), "new\n")
+
+    def test_checkout_refuses_to_overwrite_local_changes(self):
+        write_file("a.txt", "local\n")
+        self.checkout("main")
+        self.assertEqual(get_current_branch(self.test_dir), "feature")
+        self.assertEqual(read_file("a.txt"), "local\n")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import random
+
+from src.chunking import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, iter_chunks
+from src.config import set_config_values
+from src.gc import gc
+from src.objects import (get_object_path, list_loose_objects, read_manifest,
+                         read_object)
+from src.repository import Repository, init_repo
+from src.staging import add_files
+from src.status import scan_status
+from src.utils import get_file_hash_from_index
+from src.worktree import MODIFIED
+from tests.test_setup import RepoTestCase
+
+
+def random_bytes(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, "big")
+
+
+class TestChunker(RepoTestCase):
+    def test_boundaries_only_move_around_an_edit(self):
+        rng = random.Random(1)
+        data = random_bytes(rng, 1024 * 1024)
+        edited = data[:500000] + b"inserted" + data[500000:]
+
+        chunks = list(iter_chunks(io.BytesIO(data)))
+        edited_chunks = list(iter_chunks(io.BytesIO(edited)))
+        self.assertEqual(b"".join(chunks), data)
+        self.assertEqual(b"".join(edited_chunks), edited)
+        for chunk in chunks[:-1]:
+            self.assertTrue(MIN_CHUNK_SIZE <= len(chunk) <= MAX_CHUNK_SIZE)
+        self.assertLessEqual(len(set(edited_chunks) - set(chunks)), 2)
+
+
+class TestChunkedBlobs(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        set_config_values(self.test_dir, "core", {"chunkThreshold": 256 * 1024})
+        self.content = random_bytes(random.Random(2), 1024 * 1024)
+        self.add(self.content)
+
+    def add(self, content):
+        with open("artifact.bin", "wb") as f:
+            f.write(content)
+        add_files(type("Args", (object,), {"files": ["artifact.bin"]})())
+        return get_file_hash_from_index(self.test_dir, "artifact.bin")
+
+    def test_blob_is_stored_in_chunks(self):
+        blob_hash = get_file_hash_from_index(self.test_dir, "artifact.bin")
+        chunks = read_manifest(self.test_dir, blob_hash)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(size for _, size in chunks), len(self.content))
+        self.assertEqual(read_object(self.test_dir, blob_hash), ("blob", self.content))
+        self.assertEqual(scan_status(Repository(self.test_dir))[MODIFIED], [])
+
+    def test_small_change_stores_only_changed_chunks(self):
+        before = set(list_loose_objects(self.test_dir))
+        edited = bytearray(self.content)
+        edited[600000] ^= 0xFF
+        blob_hash = self.add(bytes(edited))
+        written = set(list_loose_objects(self.test_dir)) - before
+        # The manifest and the chunk holding the changed byte
+        self.assertEqual(len(written), 2)
+        self.assertIn(blob_hash, written)
+        self.assertEqual(read_object(self.test_dir, blob_hash), ("blob", bytes(edited)))
+
+    def test_gc_keeps_chunks(self):
+        blob_hash = get_file_hash_from_index(self.test_dir, "artifact.bin")
+        gc(None)
+        self.assertFalse(os.path.exists(get_object_path(self.test_dir, blob_hash)))
+        self.assertIsNotNone(read_manifest(self.test_dir, blob_hash))
+        self.assertEqual(read_object(self.test_dir, blob_hash), ("blob", self.content))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import subprocess
+import sys
+
+from tests.test_setup import RepoTestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMAND_MODULES = ["branch", "commit", "daemon", "diff", "gc", "linediff", "merge", "status"]
+
+
+class TestStartup(RepoTestCase):
+    def run_python(self, *args):
+        return subprocess.run(
+            [sys.executable, *args],
+            cwd=self.test_dir,
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PYTHONPATH": ROOT},
+        )
+
+    def test_cli_does_not_import_command_modules(self):
+        result = self.run_python(
+            "-c", "import sys; from src import cli; print(' '.join(sys.modules))"
+        )
+        loaded = result.stdout.split()
+        self.assertIn("src.cli", loaded)
+        for name in COMMAND_MODULES:
+            self.assertNotIn(f"src.{name}", loaded)
+
+    def test_diff_algorithm_choices_match_linediff(self):
+        from src import cli, linediff
+
+        self.assertEqual(cli.DIFF_ALGORITHMS, linediff.ALGORITHMS)
+
+    def test_profile_startup_reports_imports_and_phases(self):
+        pit = os.path.join(ROOT, "pit.py")
+        self.run_python(pit, "init")
+        result = self.run_python(pit, "--profile-startup", "status")
+        self.assertIn("Repo status:", result.stdout)
+        self.assertIn("src.status", result.stderr)
+        for phase in ("imports", "parser", "command", "total"):
+            self.assertRegex(result.stderr, rf"\n{phase} +\d+\.\d\d\n")
+
+    def test_trace_writes_chrome_trace(self):
+        pit = os.path.join(ROOT, "pit.py")
+        self.run_python(pit, "init")
+        with open(os.path.join(self.test_dir, "file.txt"), "w") as f:
+            f.write("content\n")
+        self.run_python(pit, "--trace-file", "trace.json", "add", "file.txt")
+        with open(os.path.join(self.test_dir, "trace.json")) as f:
+            trace = json.load(f)
+        names = {event["name"] for event in trace["traceEvents"]}
+        self.assertTrue({"add", "repo.discover", "index.write", "object.store"} <= names)
+        self.assertEqual(trace["otherData"]["counters"]["objects_written"], 1)
+        self.assertEqual(trace["otherData"]["counters"]["bytes_hashed"], 8)
+
+        result = self.run_python(pit, "--trace", "status")
+        self.assertIn("Repo status:", result.stdout)
+        self.assertIn("status", {e["name"] for e in json.loads(result.stderr)["traceEvents"]})
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import os
+from unittest import mock
+
+from src import clone
+from src.branch import create_branch
+from src.clone import clone_repo
+from src.commit import commit_changes
+from src.gc import gc
+from src.index import read_index
+from src.config import get_chunk_threshold, get_promisor, set_config_values
+from src.objects import (get_object_path, get_objects_dir, hash_object_content,
+                         object_exists, read_commit, read_object, read_shallow)
+from src.refs import list_refs
+from src.repository import Repository, init_repo
+from src.staging import add_files
+from src.status import scan_status
+from src.utils import get_current_commit_hash, read_file, write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestClone(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.test_dir, "source")
+        os.makedirs(os.path.join(self.source, "lib"))
+        os.chdir(self.source)
+        init_repo(None)
+        write_file("a.txt", "a\n")
+        write_file("lib/b.txt", "b\n")
+        write_file("run.sh", "#!/bin/sh\n")
+        os.chmod("run.sh", 0o755)
+        add_files(type("Args", (object,), {"files": ["."]})())
+        commit_changes(type("Args", (object,), {"message": "first"})())
+        gc(None)
+        write_file("a.txt", "a2\n")
+        add_files(type("Args", (object,), {"files": ["a.txt"]})())
+        commit_changes(type("Args", (object,), {"message": "second"})())
+        create_branch(type("Args", (object,), {"branch_name": "feature"})())
+        os.chdir(self.test_dir)
+        self.destination = os.path.join(self.test_dir, "clone")
+
+    def clone(self, **options):
+        clone_repo(
+            type(
+                "Args",
+                (object,),
+                {"source": "source", "destination": "clone", **options},
+            )()
+        )
+
+    def assert_cloned(self):
+        self.assertEqual(read_file(os.path.join(self.destination, "a.txt")), "a2\n")
+        self.assertEqual(read_file(os.path.join(self.destination, "lib/b.txt")), "b\n")
+        self.assertTrue(os.access(os.path.join(self.destination, "run.sh"), os.X_OK))
+        self.assertEqual(list_refs(self.destination), list_refs(self.source))
+        self.assertEqual(
+            get_current_commit_hash(self.destination), get_current_commit_hash(self.source)
+        )
+        self.assertEqual(
+            sorted(read_index(self.destination)), ["a.txt", "lib/b.txt", "run.sh"]
+        )
+        status = scan_status(Repository(self.destination))
+        self.assertFalse(any(status.values()))
+
+    def test_clone_links_objects_and_checks_out_head(self):
+        self.clone()
+        self.assert_cloned()
+        objects = get_objects_dir(self.source)
+        for root, _, names in os.walk(objects):
+            for name in names:
+                path = os.path.join(root, name)
+                cloned = os.path.join(
+                    get_objects_dir(self.destination), os.path.relpath(path, objects)
+                )
+                self.assertTrue(os.path.samefile(path, cloned))
+
+    def test_clone_copies_across_file_systems(self):
+        def cross_device(src, dst):
+            raise OSError(clone.errno.EXDEV, "Invalid cross-device link")
+
+        with mock.patch.object(clone.os, "link", cross_device):
+            self.clone()
+        self.assert_cloned()
+        pack_dir = os.path.join(get_objects_dir(self.destination), "pack")
+        for name in os.listdir(pack_dir):
+            self.assertFalse(
+                os.path.samefile(
+                    os.path.join(pack_dir, name),
+                    os.path.join(get_objects_dir(self.source), "pack", name),
+                )
+            )
+
+    def test_clone_refuses_non_empty_destination(self):
+        os.makedirs(self.destination)
+        write_file(os.path.join(self.destination, "file"), "")
+        self.clone()
+        self.assertFalse(os.path.exists(os.path.join(self.destination, ".pit")))
+
+    def test_shallow_clone_copies_only_recent_history(self):
+        self.clone(depth=1)
+        self.assert_cloned()
+        head = get_current_commit_hash(self.destination)
+        self.assertEqual(read_shallow(self.destination), {head})
+        self.assertEqual(read_commit(self.destination, head).parents, [])
+        self.assertNotEqual(read_commit(self.source, head).parents, [])
+        old_blob = hash_object_content(b"a\n")
+        self.assertFalse(object_exists(self.destination, old_blob))
+
+    def test_blobless_clone_fetches_blobs_on_first_read(self):
+        self.clone(filter="blob:none")
+        self.assert_cloned()
+        self.assertEqual(get_promisor(self.destination), self.source)
+        old_blob = hash_object_content(b"a\n")
+        self.assertFalse(object_exists(self.destination, old_blob))
+        self.assertEqual(read_object(self.destination, old_blob), ("blob", b"a\n"))
+        self.assertTrue(os.path.exists(get_object_path(self.destination, old_blob)))
+
+    def test_config_keeps_percent_signs_and_option_case(self):
+        source = os.path.join(self.test_dir, "100%")
+        os.rename(self.source, source)
+        set_config_values(source, "core", {"chunkThreshold": 1024})
+        clone_repo(
+            type(
+                "Args",
+                (object,),
+                {"source": "100%", "destination": "clone", "filter": "blob:none"},
+            )()
+        )
+        self.assertEqual(get_promisor(self.destination), source)
+        self.assertEqual(get_chunk_threshold(self.destination), 1024)
+        config = read_file(os.path.join(self.destination, ".pit", "config"))
+        self.assertIn("chunkThreshold", config)
+
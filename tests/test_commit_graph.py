@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+import random
+from unittest import mock
+
+from src import commit_graph
+from src.commit_graph import (ahead_behind, get_commit_graph_path,
+                              is_ancestor, merge_base, read_commit_graph,
+                              update_commit_graph, walk_commits)
+from src.objects import format_commit, write_object
+from src.repository import init_repo
+from tests.test_setup import RepoTestCase
+
+
+class TestCommitGraph(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        # root - a - b - merge
+        #          \- c -/
+        self.root = self.make_commit([], 100)
+        self.a = self.make_commit([self.root], 200)
+        self.b = self.make_commit([self.a], 300)
+        self.c = self.make_commit([self.a], 400)
+        self.merge = self.make_commit([self.b, self.c], 500)
+
+    def make_commit(self, parents, timestamp, message="m"):
+        content = format_commit("ab" * 20, parents, "Me <me@example.com>", timestamp, message)
+        return write_object(self.test_dir, content, "commit")
+
+    def test_graph_records_parents_and_generations(self):
+        update_commit_graph(self.test_dir, [self.b])
+        update_commit_graph(self.test_dir, [self.merge])
+        graph = read_commit_graph(self.test_dir)
+        self.assertEqual(len(graph), 5)
+        merge = graph.get(self.merge)
+        self.assertEqual(merge.parents, (self.b, self.c))
+        self.assertEqual((merge.generation, merge.timestamp, merge.tree), (4, 500, "ab" * 20))
+        self.assertEqual(graph.get(self.root).parents, ())
+
+    def test_queries_do_not_open_commit_objects(self):
+        update_commit_graph(self.test_dir, [self.merge])
+        with mock.patch.object(commit_graph, "read_commit", side_effect=AssertionError):
+            walked = [commit.hash for commit in walk_commits(self.test_dir, [self.merge])]
+            self.assertEqual(walked, [self.merge, self.c, self.b, self.a, self.root])
+            recent = walk_commits(self.test_dir, [self.merge], since=300)
+            self.assertEqual([commit.hash for commit in recent], [self.merge, self.c, self.b])
+            self.assertEqual(merge_base(self.test_dir, self.b, self.c), self.a)
+            self.assertEqual(merge_base(self.test_dir, self.merge, self.c), self.c)
+            self.assertTrue(is_ancestor(self.test_dir, self.root, self.merge))
+            self.assertFalse(is_ancestor(self.test_dir, self.b, self.c))
+
+    def test_commits_missing_from_the_graph_are_read_from_objects(self):
+        update_commit_graph(self.test_dir, [self.b])
+        self.assertEqual(merge_base(self.test_dir, self.b, self.c), self.a)
+        self.assertEqual(len(list(walk_commits(self.test_dir, [self.merge]))), 5)
+
+    def test_ahead_behind_without_graph_and_equal_timestamps(self):
+        # root - a1 - a2 - merge
+        #    \- b1 ------/
+        root = self.make_commit([], 100, "root")
+        a1 = self.make_commit([root], 100, "a1")
+        a2 = self.make_commit([a1], 100, "a2")
+        b1 = self.make_commit([root], 100, "b1")
+        merge = self.make_commit([a2, b1], 100, "merge")
+        self.assertEqual(ahead_behind(self.test_dir, merge, b1), (3, 0))
+        self.assertEqual(ahead_behind(self.test_dir, b1, merge), (0, 3))
+        self.assertEqual(ahead_behind(self.test_dir, a2, b1), (2, 1))
+
+    def test_ahead_behind_matches_reachability(self):
+        rng = random.Random(16)
+        hashes = []
+        parents = {}
+        for i in range(40):
+            picked = rng.sample(hashes, min(len(hashes), rng.choice([1, 1, 2])))
+            commit_hash = self.make_commit(picked, rng.choice([100, 200, 300 + i]), str(i))
+            hashes.append(commit_hash)
+            parents[commit_hash] = picked
+
+        def reachable(tip):
+            seen, pending = set(), [tip]
+            while pending:
+                commit_hash = pending.pop()
+                if commit_hash not in seen:
+                    seen.add(commit_hash)
+                    pending.extend(parents[commit_hash])
+            return seen
+
+        pairs = [tuple(rng.sample(hashes, 2)) for _ in range(60)]
+        for with_graph in (False, True):
+            if with_graph:
+                update_commit_graph(self.test_dir, hashes[len(hashes) // 2 :])
+            else:
+                self.assertFalse(os.path.exists(get_commit_graph_path(self.test_dir)))
+            for one, two in pairs:
+                one_side, two_side = reachable(one), reachable(two)
+                self.assertEqual(
+                    ahead_behind(self.test_dir, one, two),
+                    (len(one_side - two_side), len(two_side - one_side)),
+                )
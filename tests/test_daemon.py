@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from src import daemon_client, inotify
+from src.commit import commit_changes
+from src.daemon import Daemon, get_socket_path, query_daemon
+from src.repository import Repository, init_repo
+from src.staging import add_files
+from src.status import scan_status
+from src.utils import write_file
+from tests.test_setup import RepoTestCase
+
+
+@unittest.skipUnless(inotify.is_available(), "inotify is not available")
+class TestDaemon(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("lib")
+        write_file("a.txt", "a\n")
+        write_file("lib/b.txt", "b\n")
+        write_file(".pitignore", "build/\n")
+        self.add(".")
+        commit_changes(type("Args", (object,), {"message": "first"})())
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(get_socket_path(self.test_dir))
+        server.listen()
+        self.daemon = Daemon(self.test_dir)
+        self.thread = threading.Thread(target=self.daemon.serve, args=(server,))
+        self.thread.start()
+        self.server = server
+
+    def tearDown(self):
+        self.stop()
+        super().tearDown()
+
+    def stop(self):
+        if self.thread.is_alive():
+            query_daemon(self.test_dir, "stop")
+            self.thread.join()
+        self.server.close()
+        if os.path.exists(get_socket_path(self.test_dir)):
+            os.remove(get_socket_path(self.test_dir))
+
+    def add(self, *files):
+        add_files(type("Args", (object,), {"files": list(files)})())
+
+    def assertMatchesScan(self):
+        answer = query_daemon(self.test_dir, "status")
+        self.assertEqual(answer, scan_status(Repository(self.test_dir)))
+        return answer
+
+    def test_status_follows_worktree_changes(self):
+        self.assertEqual(
+            self.assertMatchesScan(),
+            {"staged": [], "modified": [], "deleted": [], "untracked": []},
+        )
+
+        write_file("a.txt", "changed\n")
+        os.remove("lib/b.txt")
+        os.makedirs("new/deep")
+        write_file("new/deep/c.txt", "c\n")
+        os.makedirs("build")
+        write_file("build/out.o", "o\n")
+        answer = self.assertMatchesScan()
+        self.assertEqual(answer["modified"], ["a.txt"])
+        self.assertEqual(answer["deleted"], ["lib/b.txt"])
+        self.assertEqual(answer["untracked"], ["new/deep/c.txt"])
+        self.assertEqual(
+            query_daemon(self.test_dir, "diff-files"), {"files": ["a.txt", "lib/b.txt"]}
+        )
+
+        self.add("a.txt", "new")
+        answer = self.assertMatchesScan()
+        self.assertEqual(answer["staged"], ["a.txt", "new/deep/c.txt"])
+        self.assertEqual(answer["untracked"], [])
+
+        os.rename("new", "moved")
+        write_file(".pitignore", "build/\nmoved/\n")
+        self.assertMatchesScan()
+
+    def test_no_daemon_means_no_answer(self):
+        self.stop()
+        self.assertIsNone(query_daemon(self.test_dir, "status"))
+
+    def test_daemon_of_another_user_is_not_trusted(self):
+        self.assertIsNotNone(query_daemon(self.test_dir, "ping"))
+        with mock.patch.object(daemon_client.os, "getuid", return_value=os.getuid() + 1):
+            self.assertIsNone(query_daemon(self.test_dir, "ping"))
+
+
+class TestSocketPath(RepoTestCase):
+    def test_long_paths_use_a_private_directory(self):
+        runtime_dir = os.path.join(self.test_dir, "run")
+        os.makedirs(runtime_dir)
+        repo_dir = os.path.join(self.test_dir, "r" * daemon_client.MAX_SOCKET_PATH)
+        with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": runtime_dir}):
+            socket_path = get_socket_path(repo_dir)
+            private_dir = os.path.dirname(socket_path)
+            self.assertEqual(os.path.dirname(private_dir), runtime_dir)
+            self.assertEqual(os.stat(private_dir).st_mode & 0o777, 0o700)
+
+            os.chmod(private_dir, 0o777)
+            with self.assertRaises(PermissionError):
+                get_socket_path(repo_dir)
+            self.assertIsNone(query_daemon(repo_dir, "ping"))
+
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+from unittest import mock
+
+from src.commit import commit_changes
+from src.gc import gc
+from src.objects import list_loose_objects, read_object
+from src.pack import apply_delta, create_delta, get_packs
+from src.repository import init_repo
+from src.staging import add_files
+from src.utils import get_committed_files, write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestGc(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+
+    def test_delta_round_trip(self):
+        base = os.urandom(5000)
+        target = base[:1000] + b"inserted" + base[1200:4000] + os.urandom(300)
+        delta = create_delta(base, target)
+        self.assertLess(len(delta), len(target) // 4)
+        self.assertEqual(apply_delta(base, delta), target)
+
+    def test_gc_packs_objects_with_deltas(self):
+        lines = [f"line {i}\n" for i in range(500)]
+        for version in range(3):
+            lines[version * 100] = f"changed in version {version}\n"
+            write_file("file.txt", "".join(lines))
+            add_files(type("Args", (object,), {"files": ["file.txt"]})())
+            commit_changes(type("Args", (object,), {"message": f"v{version}"})())
+        expected = {
+            object_hash: read_object(self.test_dir, object_hash)
+            for object_hash in list_loose_objects(self.test_dir)
+        }
+
+        with mock.patch("builtins.print") as output:
+            gc(None)
+        self.assertNotIn("(0 as deltas)", output.call_args[0][0])
+
+        self.assertEqual(list(list_loose_objects(self.test_dir)), [])
+        (pack,) = get_packs(self.test_dir)
+        self.assertEqual(set(pack.hashes()), set(expected))
+        for object_hash, obj in expected.items():
+            self.assertEqual(read_object(self.test_dir, object_hash), obj)
+        latest = next(h for h, (t, c) in expected.items() if t == "blob" and b"version 2" in c)
+        self.assertEqual(get_committed_files(self.test_dir)["file.txt"], latest)
+
+        # Repacking an already packed repository keeps every object readable
+        gc(None)
+        for object_hash, obj in expected.items():
+            self.assertEqual(read_object(self.test_dir, object_hash), obj)
+
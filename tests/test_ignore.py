@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import os
+
+from src.ignore import compile_rules, is_ignored, match_rules
+from src.utils import write_file
+from tests.test_setup import RepoTestCase
+
+
+def ignored(lines, path, is_dir=False):
+    return match_rules((compile_rules("", lines),), path, is_dir)
+
+
+class TestIgnore(RepoTestCase):
+    def test_globs_and_double_star(self):
+        self.assertTrue(ignored(["*.log"], "logs/deep/app.log"))
+        self.assertFalse(ignored(["*.log"], "app.log.txt"))
+        self.assertTrue(ignored(["**/cache"], "a/b/cache", is_dir=True))
+        self.assertTrue(ignored(["docs/**/*.md"], "docs/a/b/readme.md"))
+        self.assertTrue(ignored(["docs/**/*.md"], "docs/readme.md"))
+        self.assertTrue(ignored(["build/**"], "build/x/y.o"))
+        self.assertTrue(ignored(["file?.[ch]"], "file1.c"))
+
+    def test_anchoring_and_directory_only(self):
+        self.assertTrue(ignored(["/out"], "out"))
+        self.assertFalse(ignored(["/out"], "src/out"))
+        self.assertTrue(ignored(["tmp/"], "src/tmp", is_dir=True))
+        self.assertFalse(ignored(["tmp/"], "src/tmp"))
+
+    def test_negation_last_match_wins(self):
+        lines = ["*.log", "!keep.log"]
+        self.assertTrue(ignored(lines, "debug.log"))
+        self.assertFalse(ignored(lines, "keep.log"))
+        self.assertTrue(ignored(lines + ["keep.log"], "keep.log"))
+
+    def test_nested_ignore_files(self):
+        os.makedirs("pkg/vendor")
+        write_file(".pitignore", "*.tmp\nvendor/\n")
+        write_file("pkg/.pitignore", "!important.tmp\n/local.txt\n")
+        self.assertTrue(is_ignored(self.test_dir, "pkg/scratch.tmp"))
+        self.assertFalse(is_ignored(self.test_dir, "pkg/important.tmp"))
+        self.assertTrue(is_ignored(self.test_dir, "pkg/local.txt"))
+        self.assertFalse(is_ignored(self.test_dir, "local.txt"))
+        self.assertTrue(is_ignored(self.test_dir, "pkg/vendor/lib.py"))
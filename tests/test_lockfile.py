@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+
+from src.index import read_index
+from src.lockfile import LockFile, write_locked
+from src.objects import read_commit
+from src.repository import init_repo
+from src.tree import walk_tree
+from src.utils import get_current_commit_hash, read_file, write_file
+from tests.test_setup import RepoTestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestLockFile(RepoTestCase):
+    def test_lock_is_exclusive_and_commit_replaces(self):
+        write_file("file", "old")
+        with LockFile("file") as lock:
+            self.assertFalse(LockFile("file").try_acquire())
+            lock.write("new")
+            self.assertEqual(read_file("file"), "old")
+            lock.commit()
+        self.assertEqual(read_file("file"), "new")
+        self.assertFalse(os.path.exists("file.lock"))
+
+        with LockFile("file") as lock:
+            lock.write("discarded")
+        self.assertEqual(read_file("file"), "new")
+        write_locked("file", "newer")
+        self.assertEqual(read_file("file"), "newer")
+
+    def test_concurrent_adds_and_commits_lose_nothing(self):
+        init_repo(None)
+        pit = f"{sys.executable} {os.path.join(ROOT, 'pit.py')}"
+        workers = []
+        for i in range(6):
+            name = f"file{i}.txt"
+            write_file(name, f"{i}\n")
+            workers.append(
+                subprocess.Popen(
+                    f"{pit} add {name} && {pit} commit -m {name}",
+                    shell=True,
+                    stdout=subprocess.DEVNULL,
+                    env={**os.environ, "PYTHONPATH": ROOT},
+                )
+            )
+        for worker in workers:
+            self.assertEqual(worker.wait(), 0)
+
+        expected = [f"file{i}.txt" for i in range(6)]
+        self.assertEqual(sorted(read_index(self.test_dir)), expected)
+        commit = read_commit(self.test_dir, get_current_commit_hash(self.test_dir))
+        committed = [path for path, _, _ in walk_tree(self.test_dir, commit.tree)]
+        self.assertEqual(committed, expected)
+        leftovers = [
+            name
+            for _, _, files in os.walk(self.repo_dir)
+            for name in files
+            if name.endswith(".lock")
+        ]
+        self.assertEqual(leftovers, [])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import os
+import time
+from unittest import mock
+
+from src import merge
+from src.commit import commit_changes, get_merge_head_path
+from src.index import Index, IndexEntry
+from src.merge import merge_branch, merge_lines
+from src.objects import format_commit, read_commit, write_object
+from src.repository import init_repo
+from src.staging import add_files
+from src.tree import write_tree
+from src.utils import (get_current_commit_hash, get_staged_files, read_file,
+                       write_file)
+from tests.test_setup import RepoTestCase
+
+LINES = "".join(f"line {i}\n" for i in range(10))
+
+
+class TestMerge(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("lib")
+        write_file("a.txt", LINES)
+        write_file("lib/b.txt", "b\n")
+        self.commit_files("base", "a.txt", "lib/b.txt")
+        self.base = get_current_commit_hash(self.test_dir)
+        write_file(os.path.join(self.repo_dir, "refs/heads/feature"), self.base)
+
+    def commit_files(self, message, *files):
+        add_files(type("Args", (object,), {"files": list(files)})())
+        commit_changes(type("Args", (object,), {"message": message})())
+
+    def commit_on_feature(self, files):
+        """Commit files (path to content) on top of the base commit of the feature branch."""
+        index = Index()
+        for path, content in {"a.txt": LINES, "lib/b.txt": "b\n", **files}.items():
+            blob = write_object(self.test_dir, content.encode("utf-8"), "blob")
+            index[path] = IndexEntry(path, blob, 0o100644, 0, 0, 0, 0)
+        tree = write_tree(self.test_dir, index)
+        data = format_commit(tree, [self.base], "Other <o@example.com>", time.time(), "f")
+        commit_hash = write_object(self.test_dir, data, "commit")
+        write_file(os.path.join(self.repo_dir, "refs/heads/feature"), commit_hash)
+        return commit_hash
+
+    def merge(self):
+        merge_branch(type("Args", (object,), {"branch_name": "feature"})())
+
+    def test_merge_lines(self):
+        base = [b"a\n", b"b\n", b"c\n"]
+        self.assertEqual(
+            merge_lines(base, [b"A\n", b"b\n", b"c\n"], [b"a\n", b"b\n", b"C\n"]),
+            ([b"A\n", b"b\n", b"C\n"], 0),
+        )
+        merged, conflicts = merge_lines(base, [b"x\n"] + base[1:], [b"y\n"] + base[1:])
+        self.assertEqual(conflicts, 1)
+        self.assertEqual(
+            b"".join(merged), b"<<<<<<< ours\nx\n=======\ny\n>>>>>>> theirs\nb\nc\n"
+        )
+
+    def test_clean_merge_reads_only_blobs_changed_on_both_sides(self):
+        write_file("a.txt", LINES.replace("line 0", "ours 0"))
+        self.commit_files("ours", "a.txt")
+        ours = get_current_commit_hash(self.test_dir)
+        theirs = self.commit_on_feature(
+            {"a.txt": LINES.replace("line 9", "theirs 9"), "lib/new.txt": "new\n"}
+        )
+
+        with mock.patch.object(merge, "read_object", wraps=merge.read_object) as read:
+            self.merge()
+        self.assertEqual(read.call_count, 3)
+
+        self.assertEqual(
+            read_file("a.txt"), LINES.replace("line 0", "ours 0").replace("line 9", "theirs 9")
+        )
+        self.assertEqual(read_file("lib/new.txt"), "new\n")
+        commit = read_commit(self.test_dir, get_current_commit_hash(self.test_dir))
+        self.assertEqual(commit.parents, [ours, theirs])
+        self.assertEqual(get_staged_files(self.test_dir), [])
+
+    def test_conflicts_are_left_to_commit(self):
+        write_file("a.txt", LINES.replace("line 5", "ours 5"))
+        self.commit_files("ours", "a.txt")
+        theirs = self.commit_on_feature({"a.txt": LINES.replace("line 5", "theirs 5")})
+
+        self.merge()
+        self.assertIn(
+            "<<<<<<< main\nours 5\n=======\ntheirs 5\n>>>>>>> feature\n", read_file("a.txt")
+        )
+        self.assertEqual(read_file(get_merge_head_path(self.test_dir)), theirs)
+
+        write_file("a.txt", LINES)
+        self.commit_files("resolved", "a.txt")
+        commit = read_commit(self.test_dir, get_current_commit_hash(self.test_dir))
+        self.assertEqual(commit.parents[1], theirs)
+        self.assertFalse(os.path.exists(get_merge_head_path(self.test_dir)))
+
+    def test_fast_forward_moves_the_branch(self):
+        theirs = self.commit_on_feature({"lib/new.txt": "new\n"})
+        self.merge()
+        self.assertEqual(get_current_commit_hash(self.test_dir), theirs)
+        self.assertEqual(read_file("lib/new.txt"), "new\n")
+        self.assertEqual(get_staged_files(self.test_dir), [])
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+
+from src.objects import get_object_path, read_object, write_object
+from src.repository import init_repo
+from src.utils import write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestObjects(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+
+    def test_objects_are_compressed_with_typed_header(self):
+        content = b"hello world\n" * 100
+        object_hash = write_object(self.test_dir, content, "blob")
+        with open(get_object_path(self.test_dir, object_hash), "rb") as f:
+            stored = f.read()
+        self.assertLess(len(stored), len(content))
+        self.assertEqual(zlib.decompress(stored), b"blob 1200\0" + content)
+        self.assertEqual(read_object(self.test_dir, object_hash), ("blob", content))
+
+    def test_compression_level_is_read_from_config(self):
+        write_file(os.path.join(self.repo_dir, "config"), "[core]\n\tcompression = 0\n")
+        object_hash = write_object(self.test_dir, b"a" * 1000, "blob")
+        with open(get_object_path(self.test_dir, object_hash), "rb") as f:
+            self.assertGreater(len(f.read()), 1000)
+
+    def test_legacy_uncompressed_objects_are_readable(self):
+        object_path = get_object_path(self.test_dir, "ab" * 20)
+        os.makedirs(os.path.dirname(object_path))
+        with open(object_path, "wb") as f:
+            f.write(b"legacy content")
+        self.assertEqual(read_object(self.test_dir, "ab" * 20), ("blob", b"legacy content"))
+        self.assertEqual(read_object(self.test_dir, "cd" * 20), (None, None))
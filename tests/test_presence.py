@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+from unittest import mock
+
+from src.gc import gc
+from src.lockfile import LOCK_SUFFIX, LockFile
+from src.objects import (get_object_path, hash_object_content, read_object,
+                         store_blob, write_object)
+from src.presence import (BloomFilter, ObjectPresence, flush_all,
+                          get_bloom_path, get_presence, read_bloom)
+from src.repository import Repository, init_repo
+from tests.test_setup import RepoTestCase
+
+
+def fake_hash(number):
+    return hashlib.sha1(str(number).encode()).hexdigest()
+
+
+class TestBloomFilter(RepoTestCase):
+    def test_never_misses_a_hash(self):
+        bloom = BloomFilter.for_count(1000)
+        hashes = [fake_hash(i) for i in range(1000)]
+        for object_hash in hashes:
+            bloom.add(object_hash)
+        self.assertTrue(all(object_hash in bloom for object_hash in hashes))
+        false_positives = sum(fake_hash(i) in bloom for i in range(1000, 11000))
+        self.assertLess(false_positives, 100)
+
+    def test_serializes(self):
+        bloom = BloomFilter.for_count(10)
+        bloom.add(fake_hash(1))
+        parsed = BloomFilter.parse(bloom.serialize())
+        self.assertIn(fake_hash(1), parsed)
+        self.assertEqual(parsed.count, 1)
+        self.assertIsNone(BloomFilter.parse(b"garbage"))
+
+
+    def test_merge_counts_the_hashes_of_both_filters(self):
+        stored = BloomFilter.for_count(10)
+        for i in range(5):
+            stored.add(fake_hash(i))
+        bloom = BloomFilter(stored.bits, data=stored.data, count=stored.count)
+        other = BloomFilter.parse(stored.serialize())
+        for i in range(5, 8):
+            bloom.add(fake_hash(i))
+        for i in range(8, 10):
+            other.add(fake_hash(i))
+        bloom.merge(other, 3)
+        self.assertEqual(bloom.count, 10)
+        self.assertTrue(all(fake_hash(i) in bloom for i in range(10)))
+
+
+class TestObjectPresence(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+
+    def test_unknown_hash_is_answered_without_stat(self):
+        presence = get_presence(self.test_dir)
+        with mock.patch("src.presence.os.path.exists") as exists:
+            self.assertFalse(presence.contains(fake_hash(1), "missing"))
+        exists.assert_not_called()
+
+    def test_large_file_is_read_once_and_not_written_again(self):
+        content = os.urandom(10000)
+        with open("big.bin", "wb") as f:
+            f.write(content)
+        with mock.patch("src.objects.BLOB_CHUNK_SIZE", 1024):
+            with open("big.bin", "rb") as src:
+                with mock.patch.object(src, "seek") as seek:
+                    blob_hash = store_blob(self.test_dir, src, len(content), False)
+                seek.assert_not_called()
+            with mock.patch("src.objects._move_object") as move_object:
+                with open("big.bin", "rb") as src:
+                    self.assertEqual(
+                        store_blob(self.test_dir, src, len(content), False), blob_hash
+                    )
+            move_object.assert_not_called()
+        self.assertEqual(blob_hash, hash_object_content(content))
+        self.assertEqual(read_object(self.test_dir, blob_hash), ("blob", content))
+        folder = os.path.dirname(get_object_path(self.test_dir, blob_hash))
+        objects_dir = os.path.dirname(folder)
+        self.assertFalse([name for name in os.listdir(objects_dir) if name.startswith("tmp_")])
+
+    def test_removed_object_is_written_again(self):
+        blob_hash = write_object(self.test_dir, b"content", "blob")
+        os.remove(get_object_path(self.test_dir, blob_hash))
+        write_object(self.test_dir, b"content", "blob")
+        self.assertEqual(read_object(self.test_dir, blob_hash), ("blob", b"content"))
+
+    def test_filter_is_persisted_and_rebuilt_by_gc(self):
+        blob_hash = write_object(self.test_dir, b"content", "blob")
+        flush_all()
+        self.assertIn(blob_hash, ObjectPresence(self.test_dir).bloom)
+
+        gc(None, Repository(self.test_dir))
+        self.assertNotIn(blob_hash, read_bloom(self.test_dir))
+        self.assertTrue(
+            get_presence(self.test_dir).contains(
+                blob_hash, get_object_path(self.test_dir, blob_hash)
+            )
+        )
+
+    def test_few_hashes_are_set_in_place(self):
+        get_presence(self.test_dir).flush()
+        count = read_bloom(self.test_dir).count
+        first, second = ObjectPresence(self.test_dir), ObjectPresence(self.test_dir)
+        first.add(fake_hash(1))
+        second.add(fake_hash(2))
+        second.add(fake_hash(3))
+        with mock.patch.object(LockFile, "commit") as commit:
+            first.flush()
+            second.flush()
+        commit.assert_not_called()
+        stored = read_bloom(self.test_dir)
+        self.assertEqual(stored.count, count + 3)
+        self.assertTrue(all(fake_hash(i) in stored for i in range(1, 4)))
+
+    def test_flush_is_skipped_while_the_filter_is_locked(self):
+        get_presence(self.test_dir).flush()
+        presence = ObjectPresence(self.test_dir)
+        presence.add(fake_hash(1))
+        lock_path = get_bloom_path(self.test_dir) + LOCK_SUFFIX
+        open(lock_path, "w").close()
+        with mock.patch.object(LockFile, "acquire") as acquire:
+            presence.flush()
+        acquire.assert_not_called()
+        self.assertTrue(os.path.exists(lock_path))
+        self.assertNotIn(fake_hash(1), read_bloom(self.test_dir))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import io
+import os
+from contextlib import redirect_stdout
+
+from src.branch import checkout_branch, create_branch
+from src.commit import commit_changes
+from src.refs import (get_ref_path, list_refs, pack_refs, read_ref,
+                      ref_exists, update_refs, write_ref)
+from src.repository import init_repo
+from src.staging import add_files
+from src.utils import get_current_commit_hash, write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestRefs(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+
+    def test_packed_refs_lookup_and_loose_override(self):
+        refs = {f"topic/{i:04d}": f"{i:040x}" for i in range(500)}
+        refs["main"] = "a" * 40
+        update_refs(self.test_dir, refs)
+        self.assertFalse(os.path.exists(get_ref_path(self.test_dir, "main")))
+
+        for name in ("main", "topic/0000", "topic/0250", "topic/0499"):
+            self.assertEqual(read_ref(self.test_dir, name), refs[name])
+        self.assertIsNone(read_ref(self.test_dir, "topic/0500"))
+        self.assertFalse(ref_exists(self.test_dir, "topic"))
+
+        write_ref(self.test_dir, "topic/0001", "b" * 40)
+        self.assertEqual(read_ref(self.test_dir, "topic/0001"), "b" * 40)
+        self.assertEqual(list_refs(self.test_dir)["topic/0001"], "b" * 40)
+        self.assertEqual(list(list_refs(self.test_dir)), sorted(refs))
+
+        pack_refs(self.test_dir)
+        topic_dir = os.path.join(self.repo_dir, "refs", "heads", "topic")
+        self.assertFalse(os.path.exists(topic_dir))
+        self.assertEqual(read_ref(self.test_dir, "topic/0001"), "b" * 40)
+
+    def test_update_refs_applies_every_change(self):
+        write_ref(self.test_dir, "one", "1" * 40)
+        write_ref(self.test_dir, "two", "2" * 40)
+        refs = update_refs(self.test_dir, {"one": None, "three": "3" * 40})
+        self.assertEqual(refs, {"three": "3" * 40, "two": "2" * 40})
+        self.assertEqual(list_refs(self.test_dir), refs)
+
+
+class TestBranchList(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        self.commit("a.txt", "base")
+        create_branch(type("Args", (object,), {"branch_name": "feature"})())
+        checkout_branch(type("Args", (object,), {"branch_name": "feature"})())
+        self.commit("b.txt", "feature 1")
+        self.commit("c.txt", "feature 2")
+        checkout_branch(type("Args", (object,), {"branch_name": "main"})())
+        self.commit("d.txt", "main")
+
+    def commit(self, name, message):
+        write_file(name, f"{message}\n")
+        add_files(type("Args", (object,), {"files": [name]})())
+        commit_changes(type("Args", (object,), {"message": message})())
+
+    def test_list_shows_ahead_and_behind(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            create_branch(type("Args", (object,), {"branch_name": None, "list": True})())
+        head = get_current_commit_hash(self.test_dir)
+        feature = read_ref(self.test_dir, "feature")
+        self.assertEqual(
+            out.getvalue(),
+            f"  feature {feature[:7]} [ahead 2, behind 1]\n* main    {head[:7]}\n",
+        )
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import os
+
+from src import trace
+from src.repository import init_repo
+from src.staging import add_files
+from src.status import status
+from src.utils import write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestTrace(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        for i in range(4):
+            write_file(f"file{i}.txt", f"{i}\n")
+
+    def tearDown(self):
+        trace.finish()
+        super().tearDown()
+
+    def test_spans_and_counters(self):
+        trace_path = os.path.join(self.test_dir, "trace.json")
+        self.assertTrue(trace.start(trace_path))
+        with trace.span("command", name="add"):
+            add_files(type("Args", (object,), {"files": ["."], "jobs": 2})())
+        result = trace.finish()
+
+        self.assertTrue(os.path.exists(trace_path))
+        spans = [event for event in result["traceEvents"] if event["ph"] == "X"]
+        command = next(event for event in spans if event["name"] == "command")
+        self.assertEqual(command["args"], {"name": "add"})
+        for event in spans:
+            self.assertGreaterEqual(event["ts"], command["ts"])
+            self.assertLessEqual(event["ts"] + event["dur"], command["ts"] + command["dur"])
+        names = {event["name"] for event in spans}
+        self.assertTrue({"worktree.scan", "object.store", "index.write"} <= names)
+        self.assertEqual(
+            result["otherData"]["counters"],
+            {"files_stat": 4, "bytes_hashed": 8, "objects_written": 4},
+        )
+
+    def test_nothing_is_recorded_while_off(self):
+        self.assertFalse(trace.start("0"))
+        status(None)
+        trace.count("files_stat")
+        self.assertEqual(trace.counters(), {})
+        self.assertIsNone(trace.finish())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+from unittest import mock
+
+from src import tree
+from src.commit import commit_changes
+from src.index import read_index
+from src.objects import read_commit
+from src.repository import init_repo
+from src.staging import add_files
+from src.tree import walk_tree
+from src.utils import get_current_commit_hash, get_staged_files, write_file
+from tests.test_setup import RepoTestCase
+
+
+class TestTree(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("src/lib")
+        os.makedirs("docs")
+        write_file("README", "readme")
+        write_file("src/main.py", "main")
+        write_file("src/lib/util.py", "util")
+        write_file("docs/guide.txt", "guide")
+        self.add(".")
+        self.commit("First commit")
+
+    def add(self, *files):
+        add_files(type("Args", (object,), {"files": list(files)})())
+
+    def commit(self, message):
+        commit_changes(type("Args", (object,), {"message": message})())
+        return read_commit(self.test_dir, get_current_commit_hash(self.test_dir))
+
+    def test_commit_records_nested_trees(self):
+        commit = read_commit(self.test_dir, get_current_commit_hash(self.test_dir))
+        self.assertEqual(
+            [path for path, _, _ in walk_tree(self.test_dir, commit.tree)],
+            ["README", "docs/guide.txt", "src/lib/util.py", "src/main.py"],
+        )
+        self.assertEqual(get_staged_files(self.test_dir), [])
+
+    def test_only_trees_on_the_changed_path_are_rewritten(self):
+        write_file("src/lib/util.py", "changed")
+        self.add("src/lib/util.py")
+        self.assertEqual(set(read_index(self.test_dir).cache_tree), {"docs"})
+        self.assertEqual(get_staged_files(self.test_dir), ["src/lib/util.py"])
+
+        with mock.patch.object(tree, "write_object", wraps=tree.write_object) as write:
+            commit = self.commit("Second commit")
+        # The root, src and src/lib trees are written; docs is reused by hash
+        self.assertEqual(write.call_count, 3)
+        self.assertEqual(len(commit.parents), 1)
+        self.assertEqual(
+            set(read_index(self.test_dir).cache_tree), {"", "docs", "src", "src/lib"}
+        )
+
+    def test_staged_deletion_drops_cached_trees(self):
+        os.remove("src/lib/util.py")
+        self.add("src")
+        self.assertEqual(set(read_index(self.test_dir).cache_tree), {"docs"})
+        commit = self.commit("Delete util")
+        self.assertEqual(
+            [path for path, _, _ in walk_tree(self.test_dir, commit.tree)],
+            ["README", "docs/guide.txt", "src/main.py"],
+        )
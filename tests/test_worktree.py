@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import os
+from unittest import mock
+
+from src.index import read_index
+from src.repository import init_repo
+from src.staging import add_files
+from src.utils import get_staged_files, write_file
+from src.worktree import (DELETED, IGNORED, STAGED, UNTRACKED,
+                          scan_worktree)
+from tests.test_setup import RepoTestCase
+
+
+class TestWorktree(RepoTestCase):
+    def setUp(self):
+        super().setUp()
+        init_repo(None)
+        os.makedirs("src/build")
+        write_file("src/main.py", "print('hi')")
+        write_file("src/build/out.o", "binary")
+        write_file("notes.txt", "notes")
+        write_file(".pitignore", "src/build/\n")
+
+    def scan(self, **kwargs):
+        index = read_index(self.test_dir)
+        staged_paths = set(get_staged_files(self.test_dir, index))
+        return sorted(scan_worktree(self.test_dir, index, staged_paths, **kwargs))
+
+    def test_classifies_files_in_one_walk(self):
+        add_files(type("Args", (object,), {"files": ["src/main.py"]})())
+        self.assertEqual(
+            self.scan(include_ignored=True),
+            [
+                (".pitignore", UNTRACKED),
+                ("notes.txt", UNTRACKED),
+                ("src/build/", IGNORED),
+                ("src/main.py", STAGED),
+            ],
+        )
+
+    def test_prunes_ignored_directories(self):
+        scanned = []
+        real_scandir = os.scandir
+
+        def scandir(path):
+            scanned.append(os.path.relpath(path, self.test_dir))
+            return real_scandir(path)
+
+        with mock.patch("src.worktree.os.scandir", scandir):
+            self.scan()
+        self.assertNotIn("src/build", scanned)
+        self.assertNotIn(".pit", scanned)
+
+    def test_add_directory_stages_deletions(self):
+        add_files(type("Args", (object,), {"files": ["."]})())
+        self.assertNotIn("src/build/out.o", read_index(self.test_dir))
+        os.remove("notes.txt")
+        self.assertIn(("notes.txt", DELETED), self.scan())
+        add_files(type("Args", (object,), {"files": ["."]})())
+        self.assertNotIn("notes.txt", read_index(self.test_dir))